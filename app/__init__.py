@@ -1,23 +1,48 @@
+import os
+
 from flask import Flask
 from flask_login import LoginManager
+from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
 
-db = SQLAlchemy()
+from app.replicas import RoutingSession, configure_engines
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
+migrate = Migrate()
+
+def create_app(config_name=None):
+    """Create the app with config.configs[config_name], or APP_CONFIG from the environment (default: development)."""
+    from config import configs
 
-def create_app():
     app = Flask(__name__)
-    app.config.from_object('config.Config')
+    app.config.from_object(configs[config_name or os.environ.get('APP_CONFIG', 'development')])
+    if not app.config['SECRET_KEY']:
+        raise RuntimeError("SECRET_KEY must be set.")
+    configure_engines(app)
 
     # Initialize extensions
     db.init_app(app)
+    migrate.init_app(app, db)
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
 
+    from app import cache, metrics
+    cache.init_app(app)
+    metrics.init_app(app)
+
     @login_manager.user_loader
     def load_user(user_id):
-        from app.models import User
-        return User.query.get(int(user_id))
+        return cache.get_user(int(user_id))
+
+    @login_manager.request_loader
+    def load_user_from_token(request):
+        # Signed bearer tokens let API clients authenticate without a session cookie
+        if not app.config['API_TOKENS'] or request.blueprint != 'api':
+            return None
+        from app.tokens import user_id_from_token
+        user_id = user_id_from_token(request.headers.get('Authorization', ''))
+        return cache.get_user(user_id) if user_id is not None else None
 
     # Register blueprints
     from app.auth import auth as auth_blueprint
@@ -29,4 +54,22 @@ def create_app():
     from app.api.routes import api
     app.register_blueprint(api, url_prefix='/api')
 
+    @app.cli.command('resume-jobs')
+    def resume_jobs_command():
+        """Finish imports and account purges interrupted by a restart, then exit."""
+        resume_background_work(app)
+
     return app
+
+
+def resume_background_work(app):
+    """
+    Re-queue imports and account purges interrupted by a restart. Called by wsgi.py and the
+    `flask resume-jobs` command rather than create_app, so migrations, scripts and tests never start
+    background work; jobs and purges are claimed atomically, so several workers can all call it.
+    """
+    from app.jobs import resume_import_jobs
+    from app.purge import resume_purges
+
+    resume_import_jobs(app)
+    resume_purges(app)
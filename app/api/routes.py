@@ -1,12 +1,94 @@
-from flask import Blueprint, jsonify, request, abort
+import json
+
+from flask import Blueprint, Response, current_app, jsonify, request, abort, stream_with_context
 from flask_login import login_required, current_user, login_user, logout_user
-from werkzeug.security import generate_password_hash, check_password_hash
-from app.models import db, Contact, Tag, ContactTag, User
-from app.utils import process_csv, process_json, process_excel
+from app.models import db, Contact, Tag, ContactTag, User, ImportJob, IMPORT_FIELDS
+from app.utils import is_importable, find_exporter, EXPORTERS
+from app.jobs import submit_import, cancel_import
+from app.upsert import MATCH_KEYS
+from app.search import search_contacts, DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT
+from app.duplicates import find_duplicates, merge_contacts, DUPLICATE_KINDS
+from app.cache import get_tag_tree, invalidate_tags, invalidate_user, conditional, profile_etag
+from app.tokens import issue_token
+from app.passwords import hash_password, check_password
+from app.replicas import use_replica
+from app.batch import apply_batch, is_id
+from app.sync import changes_since
+from app.stats import tag_usage_stats
+from app import purge
 from sqlalchemy.exc import IntegrityError
 
 api = Blueprint('api', __name__)
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def _page_args():
+    """Parse the limit/after/fields query arguments shared by the contact list endpoints."""
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}.")
+    after = request.args.get('after', 0, type=int)
+
+    fields = request.args.get('fields')
+    if fields:
+        fields = [field.strip() for field in fields.split(',') if field.strip()]
+        unknown = [field for field in fields if field not in Contact.FIELDS and field != 'tags']
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}.")
+    else:
+        fields = list(Contact.FIELDS) + ['tags']
+    return limit, after, fields
+
+
+def _contact_page(query, limit, after, fields):
+    """Fetch one keyset page of contacts (id > after), selecting only the requested columns."""
+    columns = [Contact.id] + [getattr(Contact, field) for field in fields if field not in ('id', 'tags')]
+    rows = (
+        query.with_entities(*columns)
+        .filter(Contact.id > after)
+        .order_by(Contact.id)
+        .limit(limit)
+        .all()
+    )
+    contacts = [row._asdict() for row in rows]
+    if 'tags' in fields:
+        tags = Contact.tags_for([contact['id'] for contact in contacts])
+        for contact in contacts:
+            contact['tags'] = tags[contact['id']]
+    if 'id' not in fields:
+        # id is always selected for the cursor, but only returned when asked for
+        for contact in contacts:
+            contact.pop('id')
+    next_cursor = rows[-1].id if len(rows) == limit else None
+    return contacts, next_cursor
+
+
+def _contacts_response(query):
+    """
+    Return a page of contacts, or stream every page as NDJSON when ?stream=1 is given.
+    cf.<name>=<value> arguments filter on custom fields.
+    """
+    try:
+        limit, after, fields = _page_args()
+        query = query.filter(*Contact.custom_field_filters(request.args))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    if request.args.get('stream', type=int):
+        def generate(cursor):
+            while cursor is not None:
+                contacts, cursor = _contact_page(query, limit, cursor, fields)
+                for contact in contacts:
+                    yield json.dumps(contact) + '\n'
+
+        return Response(stream_with_context(generate(after)), mimetype='application/x-ndjson')
+
+    contacts, next_cursor = _contact_page(query, limit, after, fields)
+    return jsonify({"success": True, "contacts": contacts, "next_cursor": next_cursor})
+
+
 @api.route('/login', methods=['POST'])
 def login():
     """API endpoint for logging in a user."""
@@ -15,9 +97,13 @@ def login():
     password = data.get('password')
 
     user = User.query.filter_by(email=email).first()
-    if user and check_password_hash(user.password, password):
+    if check_password(user, password):
+        db.session.commit()  # Saves an upgraded hash
         login_user(user)
-        return jsonify({"success": True, "message": "Login successful", "user": {"id": user.id, "email": user.email, "username": user.username}})
+        response = {"success": True, "message": "Login successful", "user": {"id": user.id, "email": user.email, "username": user.username}}
+        if current_app.config['API_TOKENS']:
+            response["token"] = issue_token(user)
+        return jsonify(response)
     return jsonify({"success": False, "error": "Invalid email or password"}), 401
 
 @api.route('/register', methods=['POST'])
@@ -31,7 +117,7 @@ def register():
     if User.query.filter_by(email=email).first():
         return jsonify({"success": False, "error": "Email already registered"}), 400
 
-    new_user = User(email=email, username=username, password=generate_password_hash(password))
+    new_user = User(email=email, username=username, password=hash_password(password))
     db.session.add(new_user)
     db.session.commit()
     return jsonify({"success": True, "message": "Registration successful", "user": {"id": new_user.id, "email": new_user.email, "username": new_user.username}}), 201
@@ -69,11 +155,7 @@ def add_contact():
         user_id=current_user.id
     )
 
-    tag_ids = data.get('tags', [])
-    for tag_id in tag_ids:
-        tag = Tag.query.get(tag_id)
-        if tag:
-            contact.tags.append(tag)
+    contact.tags = Tag.owned(data.get('tags', []), current_user.id)
 
     try:
         db.session.add(contact)
@@ -85,6 +167,7 @@ def add_contact():
 
 @api.route('/tags', methods=['GET', 'POST'])
 @login_required
+@conditional()
 def manage_tags():
     """API endpoint to manage tags."""
     if request.method == 'POST':
@@ -99,6 +182,7 @@ def manage_tags():
         try:
             db.session.add(tag)
             db.session.commit()
+            invalidate_tags(current_user.id)
             return jsonify({"success": True, "message": "Tag added successfully!", "tag": tag.to_dict()}), 201
         except IntegrityError:
             db.session.rollback()
@@ -107,8 +191,17 @@ def manage_tags():
             db.session.rollback()
             return jsonify({"success": False, "error": f"Failed to add tag: {e}"}), 400
 
-    tags = Tag.query.filter_by(user_id=current_user.id).all()
-    return jsonify({"success": True, "tags": [tag.to_dict() for tag in tags]})
+    return jsonify({"success": True, "tags": get_tag_tree(current_user.id).to_list()})
+
+@api.route('/tags/stats', methods=['GET'])
+@login_required
+@conditional()
+def tag_stats():
+    """API endpoint for tag usage: top tags (?top=10), usage per tag and subtree, untagged contacts."""
+    top = request.args.get('top', 10, type=int)
+    if top < 1 or top > MAX_PAGE_SIZE:
+        return jsonify({"success": False, "error": f"top must be between 1 and {MAX_PAGE_SIZE}."}), 400
+    return jsonify({"success": True, **tag_usage_stats(current_user.id, top)})
 
 @api.route('/tags/<int:tag_id>', methods=['DELETE'])
 @login_required
@@ -119,8 +212,9 @@ def delete_tag(tag_id):
         abort(403)
 
     try:
-        db.session.delete(tag)
+        Tag.delete_tag(tag.id, current_user.id)
         db.session.commit()
+        invalidate_tags(current_user.id)
         return jsonify({"success": True, "message": "Tag deleted successfully!"}), 200
     except Exception as e:
         db.session.rollback()
@@ -128,29 +222,149 @@ def delete_tag(tag_id):
 
 @api.route('/contacts/filter', methods=['GET'])
 @login_required
+@use_replica
+@conditional()
 def filter_contacts():
-    """API endpoint to filter contacts by tag."""
-    tag_id = request.args.get('tag_id', type=int)
-    if tag_id:
-        contacts = (
-            Contact.query.join(ContactTag)
-            .filter(ContactTag.tag_id == tag_id, Contact.user_id == current_user.id)
-            .all()
-        )
-    else:
-        contacts = Contact.query.filter_by(user_id=current_user.id).all()
+    """API endpoint to filter contacts by tag (?tags=1,2&mode=any|all&exclude=3&descendants=1)."""
+    try:
+        tag_filter = Contact.tag_filter_from_args(request.args, current_user.id)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
 
-    return jsonify({"success": True, "contacts": [contact.to_dict() for contact in contacts]})
+    query = Contact.query.filter_by(user_id=current_user.id)
+    if tag_filter is not None:
+        query = query.filter(tag_filter)
+    return _contacts_response(query)
 
 @api.route('/contacts', methods=['GET'])
 @login_required
+@use_replica
+@conditional()
 def list_contacts():
-    """API endpoint to list all contacts."""
-    contacts = Contact.query.filter_by(user_id=current_user.id).all()
-    return jsonify({"success": True, "contacts": [contact.to_dict() for contact in contacts]})
+    """API endpoint to list contacts, paginated by id (?limit=&after=&fields=&stream=)."""
+    return _contacts_response(Contact.query.filter_by(user_id=current_user.id))
+
+@api.route('/contacts/changes', methods=['GET'])
+@login_required
+@conditional()
+def contact_changes():
+    """API endpoint for incremental sync (?since=<cursor>&limit=); pass the returned cursor as since."""
+    since = request.args.get('since', 0, type=int)
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    if since < 0:
+        return jsonify({"success": False, "error": "since must be a cursor returned by this endpoint."}), 400
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        return jsonify({"success": False, "error": f"limit must be between 1 and {MAX_PAGE_SIZE}."}), 400
+    return jsonify({"success": True, **changes_since(current_user.id, since, limit)})
+
+@api.route('/contacts/batch', methods=['POST'])
+@login_required
+def batch():
+    """API endpoint to apply many create/update/delete/tag_add/tag_remove operations in one request."""
+    data = request.get_json()
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list):
+        return jsonify({"success": False, "error": "operations must be a list."}), 400
+    max_operations = current_app.config['BATCH_MAX_OPERATIONS']
+    if len(operations) > max_operations:
+        return jsonify({"success": False, "error": f"At most {max_operations} operations per request."}), 400
+
+    results = apply_batch(operations, current_user.id, chunk_size=current_app.config['BATCH_CHUNK_SIZE'])
+    failed = sum(1 for result in results if result["status"] == "error")
+    return jsonify({"success": not failed, "results": results, "failed": failed}), 200 if not failed else 207
+
+@api.route('/contacts/export', methods=['GET'])
+@login_required
+def export_contacts():
+    """
+    API endpoint to download all contacts as CSV, JSON Lines or Excel (?format=csv|jsonl|xlsx,
+    or else chosen by the Accept header).
+    """
+    exporter = find_exporter(request.args.get('format'), request.accept_mimetypes)
+    if exporter is None:
+        return jsonify({"success": False, "error": f"format must be one of {', '.join(EXPORTERS)}."}), 400
+
+    rows = Contact.export_rows(current_user.id)
+    return Response(
+        stream_with_context(exporter.writer(rows, IMPORT_FIELDS)),
+        mimetype=exporter.content_type,
+        headers={"Content-Disposition": f"attachment; filename=contacts.{exporter.extension}"}
+    )
+
+@api.route('/contacts/search', methods=['GET'])
+@login_required
+@conditional()
+def search():
+    """API endpoint to search contacts (?q=&limit=&offset=), best matches first."""
+    q = request.args.get('q', '')
+    limit = request.args.get('limit', DEFAULT_SEARCH_LIMIT, type=int)
+    offset = request.args.get('offset', 0, type=int)
+    if limit < 1 or limit > MAX_SEARCH_LIMIT or offset < 0:
+        return jsonify({"success": False, "error": f"limit must be between 1 and {MAX_SEARCH_LIMIT} and offset not negative."}), 400
+
+    results, has_more = search_contacts(current_user.id, q, limit=limit, offset=offset)
+    return jsonify({
+        "success": True,
+        "contacts": [dict(contact.to_dict(), score=score) for contact, score in results],
+        "next_offset": offset + limit if has_more else None
+    })
+
+@api.route('/contacts/duplicates', methods=['GET'])
+@login_required
+@conditional()
+def duplicates():
+    """API endpoint to list clusters of likely duplicate contacts (?by=name,email,phone,fuzzy&limit=)."""
+    kinds = request.args.get('by')
+    kinds = [kind.strip() for kind in kinds.split(',')] if kinds else list(DUPLICATE_KINDS)
+    unknown = [kind for kind in kinds if kind not in DUPLICATE_KINDS]
+    if unknown:
+        return jsonify({"success": False, "error": f"Unknown duplicate kinds: {', '.join(unknown)}."}), 400
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        return jsonify({"success": False, "error": f"limit must be between 1 and {MAX_PAGE_SIZE}."}), 400
+
+    clusters = find_duplicates(current_user.id, kinds)
+    total = len(clusters)
+    clusters = clusters[:limit]
+    contacts = Contact.query.filter(
+        Contact.id.in_([contact_id for cluster in clusters for contact_id in cluster["contact_ids"]])
+    )
+    contacts = {contact.id: contact.to_dict() for contact in contacts}
+    for cluster in clusters:
+        cluster["contacts"] = [contacts[contact_id] for contact_id in cluster["contact_ids"]]
+    return jsonify({"success": True, "clusters": clusters, "total": total})
+
+@api.route('/contacts/merge', methods=['POST'])
+@login_required
+def merge():
+    """API endpoint to merge duplicate contacts into a primary contact."""
+    data = request.get_json()
+    primary_id = data.get('primary_id') if isinstance(data, dict) else None
+    duplicate_ids = data.get('duplicate_ids', []) if isinstance(data, dict) else None
+    if not is_id(primary_id):
+        return jsonify({"success": False, "error": "primary_id must be a contact id."}), 400
+    if not isinstance(duplicate_ids, list) or not all(is_id(contact_id) for contact_id in duplicate_ids):
+        return jsonify({"success": False, "error": "duplicate_ids must be a list of contact ids."}), 400
+    primary = Contact.query.get_or_404(primary_id)
+    duplicate_ids = set(duplicate_ids) - {primary.id}
+    duplicates = Contact.query.filter(Contact.id.in_(duplicate_ids)).all()
+    if len(duplicates) != len(duplicate_ids):
+        abort(404)
+    if any(contact.user_id != current_user.id for contact in [primary] + duplicates):
+        abort(403)
+
+    try:
+        merge_contacts(primary, duplicates)
+        db.session.commit()
+        return jsonify({"success": True, "message": "Contacts merged successfully!", "contact": primary.to_dict()}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"success": False, "error": f"Failed to merge contacts: {e}"}), 400
 
 @api.route('/contacts/<int:contact_id>', methods=['GET'])
 @login_required
+@use_replica
+@conditional()
 def view_contact(contact_id):
     """API endpoint to view a specific contact."""
     contact = Contact.query.get_or_404(contact_id)
@@ -177,8 +391,8 @@ def edit_contact(contact_id):
     contact.mobile = data.get('mobile', contact.mobile)
     contact.comment = data.get('comment', contact.comment)
 
-    tag_ids = data.get('tags', [])
-    contact.tags = [Tag.query.get(tag_id) for tag_id in tag_ids if Tag.query.get(tag_id)]
+    if 'tags' in data:
+        contact.set_tags(data['tags'], current_user.id)
 
     try:
         db.session.commit()
@@ -187,6 +401,36 @@ def edit_contact(contact_id):
         db.session.rollback()
         return jsonify({"success": False, "error": f"Failed to update contact: {e}"}), 400
 
+@api.route('/contacts/<int:contact_id>/custom_fields', methods=['PATCH'])
+@login_required
+def update_custom_fields(contact_id):
+    """API endpoint to set ({"set": {...}}) and remove ({"unset": [...]}) custom fields of a contact."""
+    # Checked before the update, which would otherwise bump the user's change counter for nothing
+    contact = Contact.query.get_or_404(contact_id)
+    if contact.user_id != current_user.id:
+        abort(403)
+
+    data = request.get_json()
+    values = data.get('set', {}) if isinstance(data, dict) else None
+    remove = data.get('unset', []) if isinstance(data, dict) else None
+    if not isinstance(values, dict) or not isinstance(remove, list) or not all(isinstance(key, str) for key in remove):
+        return jsonify({"success": False, "error": "Expected {\"set\": {...}, \"unset\": [names]}."}), 400
+
+    try:
+        updated = Contact.update_custom_fields(contact_id, current_user.id, values, remove)
+        if updated:
+            db.session.commit()
+        else:
+            db.session.rollback()  # Deleted meanwhile
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"success": False, "error": f"Failed to update custom fields: {e}"}), 400
+    if not updated:
+        abort(404)
+    contact = db.session.get(Contact, contact_id, populate_existing=True)
+    return jsonify({"success": True, "contact": contact.to_dict()})
+
+
 @api.route('/contacts/<int:contact_id>', methods=['DELETE'])
 @login_required
 def delete_contact(contact_id):
@@ -206,31 +450,50 @@ def delete_contact(contact_id):
 @api.route('/contacts/import', methods=['POST'])
 @login_required
 def import_contacts():
-    """API endpoint to import contacts."""
+    """API endpoint to import contacts; match_on=email|phone|name updates contacts sharing that key instead."""
     file = request.files.get('file')
     if not file:
         return jsonify({"success": False, "error": "No file uploaded."}), 400
 
-    data = None
-    if file.filename.endswith('.csv'):
-        data = process_csv(file)
-    elif file.filename.endswith('.json'):
-        data = process_json(file)
-    elif file.filename.endswith(('.xls', '.xlsx')):
-        data = process_excel(file)
-    else:
+    if not is_importable(file.filename, file.mimetype):
         return jsonify({"success": False, "error": "Unsupported file format."}), 400
 
-    if data:
-        try:
-            Contact.bulk_create(data, user_id=current_user.id)
-            return jsonify({"success": True, "message": "Contacts imported successfully!"}), 201
-        except Exception as e:
-            return jsonify({"success": False, "error": f"Error importing contacts: {e}"}), 400
-    return jsonify({"success": False, "error": "No valid data found in the file."}), 400
+    match_on = request.values.get('match_on') or None
+    if match_on is not None and match_on not in MATCH_KEYS:
+        return jsonify({"success": False, "error": f"match_on must be one of: {', '.join(MATCH_KEYS)}."}), 400
+
+    try:
+        job = submit_import(file, user_id=current_user.id, match_on=match_on)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"success": False, "error": f"Error importing contacts: {e}"}), 400
+    return jsonify({"success": True, "message": "Import started.", "job": job.to_dict()}), 202
+
+@api.route('/imports/<int:job_id>', methods=['GET'])
+@login_required
+def import_status(job_id):
+    """API endpoint to poll the progress of an import job."""
+    job = ImportJob.query.get_or_404(job_id)
+    if job.user_id != current_user.id:
+        abort(403)
+    return jsonify({"success": True, "job": job.to_dict()})
+
+@api.route('/imports/<int:job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_import_job(job_id):
+    """API endpoint to cancel an import job."""
+    job = ImportJob.query.get_or_404(job_id)
+    if job.user_id != current_user.id:
+        abort(403)
+    if job.status in ImportJob.FINISHED:
+        return jsonify({"success": False, "error": f"Import already {job.status}."}), 400
+
+    cancel_import(job)
+    return jsonify({"success": True, "message": "Import cancellation requested.", "job": job.to_dict()})
 
 @api.route('/profile', methods=['GET', 'PUT'])
 @login_required
+@conditional(etag=profile_etag)
 def profile():
     """API endpoint to get or update user profile."""
     if request.method == 'PUT':
@@ -238,10 +501,11 @@ def profile():
         current_user.username = data.get('username', current_user.username)
         current_user.email = data.get('email', current_user.email)
         if data.get('password'):
-            current_user.password = generate_password_hash(data['password'])
+            current_user.password = hash_password(data['password'])
 
         try:
             db.session.commit()
+            invalidate_user(current_user.id)
             return jsonify({"success": True, "message": "Profile updated successfully!"}), 200
         except Exception as e:
             db.session.rollback()
@@ -254,8 +518,13 @@ def profile():
 def delete_account():
     """API endpoint to delete the user account."""
     try:
-        db.session.delete(current_user)
-        db.session.commit()
+        user_id = current_user.id
+        in_background = purge.delete_account(user_id)
+        invalidate_tags(user_id)
+        invalidate_user(user_id)
+        logout_user()
+        if in_background:
+            return jsonify({"success": True, "message": "Account deleted; its data is being removed."}), 202
         return jsonify({"success": True, "message": "Account deleted successfully!"}), 200
     except Exception as e:
         db.session.rollback()
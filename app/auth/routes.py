@@ -1,8 +1,8 @@
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask import render_template, redirect, url_for, request, flash
 from flask_login import login_user, logout_user
 from app.models import User
 from app import db
+from app.passwords import hash_password, check_password
 from . import auth
 
 @auth.route('/login', methods=['GET', 'POST'])
@@ -12,7 +12,8 @@ def login():
         password = request.form.get('password')
 
         user = User.query.filter_by(email=email).first()
-        if user and check_password_hash(user.password, password):
+        if check_password(user, password):
+            db.session.commit()  # Saves an upgraded hash
             login_user(user)
             return redirect(url_for('main.home'))
         flash('Invalid email or password')
@@ -29,7 +30,7 @@ def register():
             flash('Email already registered')
             return redirect(url_for('auth.register'))
 
-        new_user = User(email=email, username=username, password=generate_password_hash(password))
+        new_user = User(email=email, username=username, password=hash_password(password))
         db.session.add(new_user)
         db.session.commit()
         flash('Registration successful. Please log in.')
@@ -0,0 +1,186 @@
+from itertools import islice
+
+from sqlalchemy import delete, insert, tuple_, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db
+from app.models import Contact, ContactTag, Tag, Tombstone, IMPORT_FIELDS, KEY_FIELDS
+
+BATCH_OPERATIONS = ('create', 'update', 'delete', 'tag_add', 'tag_remove')
+
+
+def _contact_values(data, partial):
+    """Validate contact fields for a create (partial=False) or update; raises ValueError."""
+    if not isinstance(data, dict):
+        raise ValueError("data must be an object.")
+    unknown = set(data) - set(IMPORT_FIELDS) - (set() if partial else {'tags'})
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}.")
+    values = {field: data[field] for field in IMPORT_FIELDS if field in data}
+    for field, value in values.items():
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"{field} must be a string.")
+        length = Contact.__table__.c[field].type.length
+        if value and length and len(value) > length:
+            raise ValueError(f"{field} is longer than {length} characters.")
+    for field in ('first_name', 'last_name'):
+        if (not partial or field in values) and not values.get(field):
+            raise ValueError(f"{field} is required.")
+    return values
+
+
+def is_id(value):
+    # JSON true/false arrive as bools, which are ints in Python
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _tag_ids(operation):
+    tags = operation.get('tags', [])
+    if not isinstance(tags, list) or not all(is_id(tag_id) for tag_id in tags):
+        raise ValueError("tags must be a list of tag ids.")
+    return tags
+
+
+def _run_chunk(chunk, user_id, results):
+    """
+    Apply one chunk of (index, operation) pairs in a single transaction using set-based statements.
+    Within a chunk, operations run grouped by kind: creates, updates, tag adds, tag removes, deletes.
+    """
+    creates, updates, deletes, tag_adds, tag_removes = [], [], [], [], []
+    for index, operation in chunk:
+        try:
+            if not isinstance(operation, dict) or operation.get('op') not in BATCH_OPERATIONS:
+                raise ValueError(f"op must be one of {', '.join(BATCH_OPERATIONS)}.")
+            kind = operation['op']
+            if kind == 'create':
+                data = operation.get('data')
+                creates.append((index, _contact_values(data, partial=False), _tag_ids(data)))
+                continue
+            if not is_id(operation.get('id')):
+                raise ValueError("id must be a contact id.")
+            if kind == 'update':
+                updates.append((index, operation['id'], _contact_values(operation.get('data'), partial=True)))
+            elif kind == 'delete':
+                deletes.append((index, operation['id']))
+            elif kind == 'tag_add':
+                tag_adds.append((index, operation['id'], _tag_ids(operation)))
+            else:
+                tag_removes.append((index, operation['id'], _tag_ids(operation)))
+        except ValueError as e:
+            results[index] = {"index": index, "status": "error", "error": str(e)}
+
+    # Ownership of every referenced contact and tag is checked with one query each
+    contact_ids = {op[1] for op in updates + deletes + tag_adds + tag_removes}
+    owned_contacts = set(db.session.scalars(
+        db.select(Contact.id).where(Contact.id.in_(contact_ids), Contact.user_id == user_id)
+    )) if contact_ids else set()
+    tag_ids = {tag_id for op in creates for tag_id in op[2]} | {tag_id for op in tag_adds + tag_removes for tag_id in op[2]}
+    owned_tags = {tag.id for tag in Tag.owned(tag_ids, user_id)}
+
+    def check(index, contact_id=None, tags=()):
+        if contact_id is not None and contact_id not in owned_contacts:
+            results[index] = {"index": index, "status": "error", "error": f"Contact {contact_id} not found."}
+            return False
+        missing = [tag_id for tag_id in tags if tag_id not in owned_tags]
+        if missing:
+            results[index] = {"index": index, "status": "error", "error": f"Tags not found: {missing}."}
+            return False
+        return True
+
+    creates = [op for op in creates if check(op[0], tags=op[2])]
+    updates = [op for op in updates if check(op[0], op[1])]
+    deletes = [op for op in deletes if check(op[0], op[1])]
+    tag_adds = [op for op in tag_adds if check(op[0], op[1], op[2])]
+    tag_removes = [op for op in tag_removes if check(op[0], op[1], op[2])]
+
+    if not (creates or updates or deletes or tag_adds or tag_removes):
+        return
+    # The bulk statements below bypass the ORM flush hook, so version the changes here
+    stamp = Contact.change_stamp(user_id)
+    touched = {contact_id for _, contact_id, _ in tag_adds + tag_removes}
+
+    pairs_to_add = set()
+    if creates:
+        rows = [dict({field: None for field in IMPORT_FIELDS}, **values, **stamp, user_id=user_id)
+                for _, values, _ in creates]
+        new_ids = db.session.scalars(
+            insert(Contact).returning(Contact.id, sort_by_parameter_order=True), rows
+        ).all()
+        for (index, _, tags), contact_id in zip(creates, new_ids):
+            pairs_to_add.update((contact_id, tag_id) for tag_id in tags)
+            results[index] = {"index": index, "status": "ok", "id": contact_id}
+
+    changes = [dict(values, id=contact_id, version=stamp['version'], updated_at=stamp['updated_at'])
+               for _, contact_id, values in updates if values]
+    for values in changes:
+        if any(field in values for field in KEY_FIELDS):
+            values['import_key'] = None  # As the flush hook does: the contact is keyed again on the next upsert
+    if changes:
+        # ORM bulk UPDATE by primary key: one executemany per distinct set of updated columns
+        db.session.execute(update(Contact), changes)
+    for index, contact_id, _ in updates:
+        results[index] = {"index": index, "status": "ok", "id": contact_id}
+
+    for index, contact_id, tags in tag_adds:
+        pairs_to_add.update((contact_id, tag_id) for tag_id in tags)
+        results[index] = {"index": index, "status": "ok", "id": contact_id}
+    if pairs_to_add:
+        existing = set(db.session.execute(
+            db.select(ContactTag.contact_id, ContactTag.tag_id)
+            .where(tuple_(ContactTag.contact_id, ContactTag.tag_id).in_(pairs_to_add))
+        ).tuples())
+        new_pairs = [{"contact_id": contact_id, "tag_id": tag_id} for contact_id, tag_id in pairs_to_add - existing]
+        if new_pairs:
+            db.session.execute(insert(ContactTag), new_pairs)
+
+    pairs_to_remove = {(contact_id, tag_id) for _, contact_id, tags in tag_removes for tag_id in tags}
+    if pairs_to_remove:
+        db.session.execute(
+            delete(ContactTag).where(tuple_(ContactTag.contact_id, ContactTag.tag_id).in_(pairs_to_remove))
+        )
+    for index, contact_id, _ in tag_removes:
+        results[index] = {"index": index, "status": "ok", "id": contact_id}
+
+    if touched:
+        db.session.execute(
+            update(Contact).where(Contact.id.in_(touched))
+            .values(version=stamp['version'], updated_at=stamp['updated_at']),
+            execution_options={"synchronize_session": False}
+        )
+
+    if deletes:
+        ids = sorted({contact_id for _, contact_id in deletes})
+        db.session.execute(delete(ContactTag).where(ContactTag.contact_id.in_(ids)))
+        db.session.execute(delete(Contact).where(Contact.id.in_(ids)), execution_options={"synchronize_session": False})
+        db.session.execute(insert(Tombstone), [
+            {"user_id": user_id, "kind": "contact", "object_id": contact_id,
+             "version": stamp['version'], "deleted_at": stamp['updated_at']}
+            for contact_id in ids
+        ])
+        for index, contact_id in deletes:
+            results[index] = {"index": index, "status": "ok", "id": contact_id}
+
+
+def apply_batch(operations, user_id, chunk_size=500):
+    """
+    Apply a list of contact operations, committing one transaction per chunk of chunk_size operations.
+    If a chunk fails in the database, it is rolled back and all of its operations are reported as errors.
+    Returns one result per operation, in input order.
+    """
+    results = [None] * len(operations)
+    numbered = iter(enumerate(operations))
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            break
+        try:
+            _run_chunk(chunk, user_id, results)
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            error = str(getattr(e, 'orig', None) or e)
+            for index, _ in chunk:
+                results[index] = {"index": index, "status": "error", "error": error}
+    # The bulk statements bypass the identity map, so drop any stale loaded contacts
+    db.session.expire_all()
+    return results
@@ -0,0 +1,248 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, request
+from flask_login import current_user
+from sqlalchemy.orm import make_transient_to_detached
+
+from app import db
+from app.models import Tag, User
+
+try:
+    import redis  # Optional: shares the cache between worker processes
+except ImportError:
+    redis = None
+
+
+class TTLCache:
+    """Thread-safe in-process LRU cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisCache:
+    """Cache with the TTLCache interface backed by Redis; values must be JSON-serializable."""
+
+    def __init__(self, url, ttl=300, prefix='address_book:'):
+        if redis is None:
+            raise RuntimeError("The redis package is required for a Redis cache backend.")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+def make_cache(app, maxsize, ttl):
+    """
+    Build the cache backend selected by CACHE_REDIS_URL (Redis) or an in-process TTLCache.
+    Without the redis package installed, CACHE_REDIS_URL is ignored with a warning.
+    """
+    if app.config.get('CACHE_REDIS_URL') and redis is not None:
+        return RedisCache(app.config['CACHE_REDIS_URL'], ttl=ttl)
+    return TTLCache(maxsize=maxsize, ttl=ttl)
+
+
+def init_app(app):
+    if app.config.get('CACHE_REDIS_URL') and redis is None:
+        app.logger.warning("CACHE_REDIS_URL is set but the redis package is not installed; "
+                           "caching in process instead, so workers do not share invalidations.")
+    app.extensions['tag_cache'] = make_cache(app, app.config['TAG_CACHE_SIZE'], app.config['TAG_CACHE_TTL'])
+    app.extensions['user_cache'] = make_cache(app, app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+    if app.config['RESPONSE_CACHE_SIZE']:
+        app.extensions['response_cache'] = make_cache(app, app.config['RESPONSE_CACHE_SIZE'],
+                                                      app.config['RESPONSE_CACHE_TTL'])
+
+
+class TagTree:
+    """A user's tags with the parent/child hierarchy and ancestor/descendant sets precomputed."""
+
+    def __init__(self, tags):
+        self.tags = {tag['id']: tag for tag in tags}
+        self.children = {tag_id: [] for tag_id in self.tags}
+        for tag in tags:
+            if tag['parent_id'] in self.children:
+                self.children[tag['parent_id']].append(tag['id'])
+
+        self.ancestors = {}
+        for tag_id in self.tags:
+            ancestors = []
+            parent_id = self.tags[tag_id]['parent_id']
+            while parent_id in self.tags and parent_id not in ancestors and parent_id != tag_id:
+                ancestors.append(parent_id)
+                parent_id = self.tags[parent_id]['parent_id']
+            self.ancestors[tag_id] = frozenset(ancestors)
+
+        descendants = {tag_id: set() for tag_id in self.tags}
+        for tag_id, ancestors in self.ancestors.items():
+            for ancestor_id in ancestors:
+                descendants[ancestor_id].add(tag_id)
+        self.descendants = {tag_id: frozenset(ids) for tag_id, ids in descendants.items()}
+
+    def subtree(self, tag_id):
+        """The tag and all of its descendants."""
+        return self.descendants.get(tag_id, frozenset()) | {tag_id}
+
+    def to_list(self):
+        return list(self.tags.values())
+
+    def nodes(self):
+        """Tag dictionaries in id order, each with a 'children' list of tag dictionaries (for templates)."""
+        return [dict(tag, children=[self.tags[child_id] for child_id in self.children[tag['id']]])
+                for tag in self.tags.values()]
+
+
+def _tag_key(user_id):
+    return f'tags:{user_id}'
+
+
+def get_tag_tree(user_id):
+    """Return the user's TagTree, loading it with a single query on a cache miss."""
+    cache = current_app.extensions['tag_cache']
+    cached = cache.get(_tag_key(user_id))
+    if isinstance(cached, TagTree):
+        return cached
+    if cached is not None:
+        # Serialized backends store the tag list; rebuild the tree from it
+        return TagTree(cached)
+
+    tags = [tag.to_dict() for tag in db.session.query(Tag).filter_by(user_id=user_id).order_by(Tag.id)]
+    tree = TagTree(tags)
+    cache.set(_tag_key(user_id), tree if isinstance(cache, TTLCache) else tags)
+    return tree
+
+
+def invalidate_tags(user_id):
+    """Drop the cached tags of a user; call after any tag is created, changed or deleted."""
+    current_app.extensions['tag_cache'].delete(_tag_key(user_id))
+
+
+# Never the password hash: it is only loaded when a view actually reads it
+USER_FIELDS = ('id', 'username', 'email')
+
+
+def _user_key(user_id):
+    return f'user:{user_id}'
+
+
+def get_user(user_id):
+    """
+    Return the user for a session or token, or None. The identity columns come from the cache when
+    possible; the returned User is attached to the session without a query, so views can still
+    modify or delete it (other columns load on first access).
+    """
+    cache = current_app.extensions['user_cache']
+    values = cache.get(_user_key(user_id))
+    if values is None:
+        row = db.session.execute(
+            db.select(*[getattr(User, field) for field in USER_FIELDS])
+            .where(User.id == user_id, User.deleted_at.is_(None))
+        ).first()
+        if row is None:
+            return None
+        values = row._asdict()
+        cache.set(_user_key(user_id), values)
+
+    user = User(**values)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def invalidate_user(user_id):
+    """Drop the cached identity of a user; call after the user is updated or deleted."""
+    current_app.extensions['user_cache'].delete(_user_key(user_id))
+
+
+def data_etag():
+    """ETag for views that depend only on the URL and the current user's contacts and tags."""
+    # Every contact or tag write bumps the user's change counter, in either blueprint
+    version = db.session.scalar(db.select(User.change_counter).where(User.id == current_user.id))
+    return f'{current_user.id}.{version}'
+
+
+def profile_etag():
+    """ETag for the current user's profile."""
+    profile = f'{current_user.username}\0{current_user.email}'.encode()
+    return f'{current_user.id}.{hashlib.sha1(profile).hexdigest()[:16]}'
+
+
+def conditional(etag=data_etag, cache_control='private, no-cache'):
+    """
+    Decorator for GET views: answers a matching If-None-Match with 304 without running the view and,
+    when RESPONSE_CACHE_SIZE is set, serves repeated requests from a cache keyed by ETag and URL.
+    A write changes the ETag, so cached responses are never served for data that has since changed.
+    Other methods pass straight through to the view.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET':
+                return view(*args, **kwargs)
+
+            tag = etag()
+            if tag in request.if_none_match:
+                response = current_app.response_class(status=304)
+            else:
+                cache = current_app.extensions.get('response_cache')
+                key = f'response:{tag}:{request.full_path}'
+                cached = cache.get(key) if cache is not None else None
+                if cached is not None:
+                    response = current_app.response_class(cached['body'], mimetype=cached['mimetype'])
+                else:
+                    response = current_app.make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    if cache is not None and not response.is_streamed:
+                        cache.set(key, {"body": response.get_data(as_text=True), "mimetype": response.mimetype})
+            response.set_etag(tag)
+            response.headers['Cache-Control'] = cache_control
+            return response
+        return wrapper
+    return decorator
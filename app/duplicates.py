@@ -0,0 +1,184 @@
+import re
+import unicodedata
+from collections import defaultdict
+from difflib import SequenceMatcher
+
+from flask import current_app
+
+from app import db
+from app.models import Contact
+
+DUPLICATE_KINDS = ('name', 'email', 'phone', 'fuzzy')
+# Names at least this similar (difflib ratio) count as fuzzy duplicates
+FUZZY_NAME_RATIO = 0.85
+# Fuzzy matching compares contacts sharing this many leading letters of their first or last name
+BLOCK_PREFIX_LENGTH = 2
+# Larger blocks are split on longer prefixes to keep the fuzzy pass from going quadratic
+MAX_BLOCK_SIZE = 200
+# Blocks that cannot be split further (one name shared by many contacts) compare each contact
+# with this many neighbours in name order instead
+SORTED_WINDOW = 20
+
+
+def normalize_name(first_name, last_name):
+    """Lowercase, accent-free, whitespace-collapsed 'first last'."""
+    name = f"{first_name or ''} {last_name or ''}"
+    name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode()
+    return ' '.join(re.findall(r'[a-z0-9]+', name.lower()))
+
+
+def normalize_email(email):
+    email = (email or '').strip().lower()
+    return email if '@' in email else None
+
+
+def normalize_phone(phone, country_code=''):
+    """
+    Normalize a phone number to E.164 (+<country><number>).
+    Numbers without an international prefix get country_code; without one they are compared as bare digits.
+    """
+    if not phone:
+        return None
+    phone = phone.strip()
+    digits = re.sub(r'\D', '', phone)
+    if phone.startswith('+'):
+        number = digits
+    elif digits.startswith('00'):
+        number = digits[2:]
+    elif country_code:
+        number = country_code + (digits[1:] if digits.startswith('0') else digits)
+    else:
+        return digits if len(digits) >= 7 else None
+    return '+' + number if 7 <= len(number) <= 15 else None
+
+
+class _Clusters:
+    """Union-find over contact ids that remembers why contacts were joined."""
+
+    def __init__(self):
+        self.parent = {}
+        self.reasons = defaultdict(set)
+
+    def find(self, contact_id):
+        self.parent.setdefault(contact_id, contact_id)
+        while self.parent[contact_id] != contact_id:
+            self.parent[contact_id] = self.parent[self.parent[contact_id]]
+            contact_id = self.parent[contact_id]
+        return contact_id
+
+    def join(self, ids, reason):
+        root = self.find(ids[0])
+        for contact_id in ids[1:]:
+            other = self.find(contact_id)
+            if other != root:
+                self.parent[other] = root
+                self.reasons[root] |= self.reasons.pop(other, set())
+        self.reasons[root].add(reason)
+
+    def groups(self):
+        members = defaultdict(list)
+        for contact_id in self.parent:
+            members[self.find(contact_id)].append(contact_id)
+        return [(sorted(ids), sorted(self.reasons[root])) for root, ids in members.items() if len(ids) > 1]
+
+
+def _is_fuzzy_match(name, other_name):
+    return name != other_name and SequenceMatcher(None, name, other_name).ratio() >= FUZZY_NAME_RATIO
+
+
+def _match_block(members, clusters, prefix_length):
+    """
+    Join the fuzzy matches within one block of (contact_id, name, blocking word). Blocks over
+    MAX_BLOCK_SIZE are split on a longer prefix of the blocking word; once it cannot grow, each
+    contact is compared with its SORTED_WINDOW neighbours in name order.
+    """
+    if len(members) < 2:
+        return
+    if len(members) > MAX_BLOCK_SIZE:
+        if any(len(word) > prefix_length for _, _, word in members):
+            longer = defaultdict(list)
+            for member in members:
+                longer[member[2][:prefix_length + 1]].append(member)
+            for block in longer.values():
+                _match_block(block, clusters, prefix_length + 1)
+        else:
+            members = sorted(members, key=lambda member: member[1])
+            for i, (contact_id, name, _) in enumerate(members):
+                for other_id, other_name, _ in members[i + 1:i + 1 + SORTED_WINDOW]:
+                    if _is_fuzzy_match(name, other_name):
+                        clusters.join([contact_id, other_id], 'fuzzy')
+        return
+    for i, (contact_id, name, _) in enumerate(members):
+        for other_id, other_name, _ in members[i + 1:]:
+            if _is_fuzzy_match(name, other_name):
+                clusters.join([contact_id, other_id], 'fuzzy')
+
+
+def find_duplicates(user_id, kinds=DUPLICATE_KINDS):
+    """
+    Find clusters of likely duplicate contacts for one user.
+    Contacts sharing a normalized name, email or phone are grouped directly; fuzzy name matches are
+    only compared within blocks of contacts sharing a name prefix (see _match_block), never across the
+    whole book.
+    Returns [{"contact_ids": [...], "reasons": [...]}, ...], largest clusters first.
+    """
+    country_code = current_app.config['DEFAULT_PHONE_COUNTRY_CODE']
+    keys = defaultdict(list)
+    blocks = defaultdict(list)
+
+    rows = (
+        db.session.query(Contact.id, Contact.first_name, Contact.last_name,
+                         Contact.email, Contact.phone, Contact.mobile)
+        .filter(Contact.user_id == user_id)
+        .yield_per(1000)
+    )
+    for contact_id, first_name, last_name, email, phone, mobile in rows:
+        name = normalize_name(first_name, last_name)
+        if 'name' in kinds and name:
+            keys[('name', name)].append(contact_id)
+        if 'email' in kinds:
+            email = normalize_email(email)
+            if email:
+                keys[('email', email)].append(contact_id)
+        if 'phone' in kinds:
+            for number in {normalize_phone(phone, country_code), normalize_phone(mobile, country_code)}:
+                if number:
+                    keys[('phone', number)].append(contact_id)
+        if 'fuzzy' in kinds and name:
+            # Blocking keys: contacts are only compared to others sharing a first- or last-name prefix
+            parts = name.split()
+            for side, word in {('first', parts[0]), ('last', parts[-1])}:
+                blocks[(side, word[:BLOCK_PREFIX_LENGTH])].append((contact_id, name, word))
+
+    clusters = _Clusters()
+    for (reason, _), ids in keys.items():
+        if len(ids) > 1:
+            clusters.join(ids, reason)
+
+    for members in blocks.values():
+        _match_block(members, clusters, BLOCK_PREFIX_LENGTH)
+
+    groups = sorted(clusters.groups(), key=lambda group: (-len(group[0]), group[0][0]))
+    return [{"contact_ids": ids, "reasons": reasons} for ids, reasons in groups]
+
+
+def merge_contacts(primary, duplicates):
+    """
+    Merge duplicates into primary: empty fields are filled from the duplicates, tags and custom
+    fields are combined (primary wins on conflicts), then the duplicates are deleted. Does not commit.
+    """
+    tags = {tag.id: tag for tag in primary.tags}
+    custom_fields = {}
+    for duplicate in duplicates:
+        for field in Contact.FIELDS:
+            if field not in ('id', 'custom_fields') and not getattr(primary, field):
+                setattr(primary, field, getattr(duplicate, field))
+        custom_fields.update(duplicate.custom_fields or {})
+        tags.update((tag.id, tag) for tag in duplicate.tags)
+    custom_fields.update(primary.custom_fields or {})
+
+    primary.custom_fields = custom_fields
+    primary.tags = list(tags.values())
+    for duplicate in duplicates:
+        db.session.delete(duplicate)
+    return primary
@@ -0,0 +1,203 @@
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import islice
+
+from flask import current_app
+from sqlalchemy import update
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.datastructures import FileStorage
+
+from app import db
+from app.models import Contact, ImportJob, utcnow
+from app.parsing import ParallelCSVReader
+from app.upsert import bulk_upsert, claim_existing, staged_upsert
+from app.utils import find_importer, iter_rows
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(app):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=app.config['IMPORT_WORKERS'],
+                                           thread_name_prefix='import')
+        return _executor
+
+
+def _enqueue(app, job_id):
+    if app.config['IMPORT_WORKERS'] > 0:
+        _get_executor(app).submit(run_import, app, job_id)
+    else:
+        # No worker pool configured: run the import in the calling thread
+        run_import(app, job_id)
+
+
+def _discard_upload(job):
+    try:
+        os.remove(job.path)
+    except OSError:
+        pass
+
+
+@contextmanager
+def _keep_alive(app, job_id):
+    """
+    Refresh a job's heartbeat from another thread and connection while the import thread is inside one
+    long transaction (claiming keys, staged upserts), so resume_import_jobs does not take the job over.
+    """
+    stop = threading.Event()
+
+    def beat():
+        with app.app_context():
+            while not stop.wait(app.config['IMPORT_JOB_STALE_SECONDS'] / 3):
+                with db.engine.begin() as connection:
+                    connection.execute(update(ImportJob).where(ImportJob.id == job_id).values(heartbeat_at=utcnow()))
+
+    thread = threading.Thread(target=beat, name=f'import-{job_id}-heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def submit_import(file, user_id, match_on=None):
+    """
+    Spool an uploaded file to disk, record an ImportJob for it and queue it on the worker pool.
+    With match_on (one of app.upsert.MATCH_KEYS), rows update the contacts sharing that natural key.
+    """
+    upload_dir = current_app.config['IMPORT_UPLOAD_DIR']
+    os.makedirs(upload_dir, exist_ok=True)
+    # The spool is named with the format's extension, so the job finds the reader from the path
+    # even for uploads recognised only by their content type
+    importer = find_importer(file.filename, file.mimetype)
+    fd, path = tempfile.mkstemp(dir=upload_dir, suffix=importer.extensions[0])
+    with os.fdopen(fd, 'wb') as spooled:
+        shutil.copyfileobj(file.stream, spooled, 1024 * 1024)
+
+    job = ImportJob(user_id=user_id, filename=file.filename, path=path, match_on=match_on,
+                    bytes_total=os.path.getsize(path))
+    db.session.add(job)
+    db.session.commit()
+
+    _enqueue(current_app._get_current_object(), job.id)
+    if current_app.config['IMPORT_WORKERS'] == 0:
+        # The inline run updated the job through its own session
+        db.session.refresh(job)
+    return job
+
+
+def cancel_import(job):
+    """Cancel a queued job right away, or ask a running one to stop after its current batch."""
+    if job.status == 'queued':
+        job.status = 'cancelled'
+        job.finished_at = utcnow()
+        _discard_upload(job)
+    elif job.status == 'running':
+        job.cancel_requested = True
+    db.session.commit()
+
+
+def run_import(app, job_id):
+    """Run one import job. Rows already recorded as processed are skipped, so interrupted jobs resume."""
+    with app.app_context():
+        # Claim the job atomically so two workers (or processes) never run the same one
+        claimed = db.session.execute(
+            update(ImportJob)
+            .where(ImportJob.id == job_id, ImportJob.status == 'queued')
+            .values(status='running', heartbeat_at=utcnow())
+        ).rowcount
+        db.session.commit()
+        if not claimed:
+            return
+
+        job = db.session.get(ImportJob, job_id)
+        if job.started_at is None:
+            job.started_at = utcnow()
+            db.session.commit()
+        skipped, failed_before = job.rows_processed, job.rows_failed
+        updated_before, skipped_before = job.rows_updated, job.rows_skipped
+        country_code = app.config['DEFAULT_PHONE_COUNTRY_CODE']
+
+        try:
+            with open(job.path, 'rb') as stream:
+                workers = app.config['IMPORT_PARSE_WORKERS']
+                if (workers and job.path.endswith('.csv')
+                        and job.bytes_total >= app.config['IMPORT_PARSE_MIN_BYTES']):
+                    reader = ParallelCSVReader(job.path, workers, app.config['IMPORT_PARSE_CHUNK_BYTES'])
+                    position = reader.tell
+                else:
+                    reader = iter_rows(FileStorage(stream=stream, filename=job.path))
+                    position = stream.tell
+                rows = islice(reader, skipped, None)
+
+                def on_batch(result):
+                    # Runs inside the batch transaction, so progress and inserted rows commit together
+                    job.rows_processed = skipped + result['processed']
+                    job.rows_imported += result['batches'][-1]
+                    job.rows_failed = failed_before + result['failed']
+                    job.rows_updated = updated_before + result.get('updated', 0)
+                    job.rows_skipped = skipped_before + result.get('skipped', 0)
+                    job.bytes_read = position()
+                    job.heartbeat_at = utcnow()
+                    db.session.refresh(job, ['cancel_requested'])
+                    return not job.cancel_requested
+
+                if not job.match_on:
+                    result = Contact.bulk_import(rows, user_id=job.user_id,
+                                                 batch_size=app.config['IMPORT_BATCH_SIZE'],
+                                                 first_row=skipped + 1, on_batch=on_batch)
+                elif (not skipped and db.engine.dialect.name == 'postgresql'
+                        and job.bytes_total >= app.config['IMPORT_STAGING_MIN_BYTES']):
+                    # One transaction until the end: on_batch runs only before the commit
+                    with _keep_alive(app, job.id):
+                        claim_existing(job.user_id, job.match_on, country_code)
+                        result = staged_upsert(rows, job.user_id, job.match_on, on_batch=on_batch,
+                                               country_code=country_code)
+                else:
+                    with _keep_alive(app, job.id):
+                        claim_existing(job.user_id, job.match_on, country_code)
+                    result = bulk_upsert(rows, job.user_id, job.match_on,
+                                         batch_size=app.config['IMPORT_BATCH_SIZE'],
+                                         first_row=skipped + 1, on_batch=on_batch, country_code=country_code)
+
+            job.status = 'cancelled' if job.cancel_requested else 'done'
+            job.errors = (job.errors or []) + result['errors']
+        except Exception as e:
+            db.session.rollback()
+            job.status = 'failed'
+            job.error = str(e)
+        job.finished_at = utcnow()
+        db.session.commit()
+        _discard_upload(job)
+
+
+def resume_import_jobs(app):
+    """Re-queue jobs left queued, or running without a recent heartbeat, by a previous process."""
+    with app.app_context():
+        try:
+            stale = utcnow() - timedelta(seconds=app.config['IMPORT_JOB_STALE_SECONDS'])
+            db.session.execute(
+                update(ImportJob)
+                .where(ImportJob.status == 'running', ImportJob.heartbeat_at < stale)
+                .values(status='queued')
+            )
+            db.session.commit()
+            job_ids = db.session.scalars(
+                db.select(ImportJob.id).filter_by(status='queued').order_by(ImportJob.id)
+            ).all()
+        except SQLAlchemyError:
+            # Tables not created yet (first run, or migrations pending)
+            db.session.rollback()
+            return
+
+    for job_id in job_ids:
+        _enqueue(app, job_id)
@@ -1,14 +1,19 @@
 from sqlite3 import IntegrityError
 
-from flask import render_template, redirect, url_for, flash, request, abort
-from flask_login import login_required
+from flask import render_template, redirect, url_for, flash, request, abort, current_app
+from flask_login import login_required, logout_user
 from flask_login import current_user
-from werkzeug.security import generate_password_hash
 from sqlalchemy import func
 
-from ..models import db, Contact, Tag, ContactTag
+from ..models import db, Contact, Tag, ContactTag, ImportJob
 from ..forms import ContactForm, ProfileForm
-from ..utils import process_csv, process_json, process_excel
+from ..utils import is_importable
+from ..jobs import submit_import, cancel_import
+from ..upsert import MATCH_KEYS
+from ..search import search_contacts, DEFAULT_SEARCH_LIMIT
+from ..passwords import hash_password
+from ..cache import get_tag_tree, invalidate_tags, invalidate_user
+from .. import purge
 from . import main
 
 
@@ -22,7 +27,7 @@ def home():
 @login_required
 def add_contact():
     form = ContactForm()
-    tags = Tag.query.filter_by(user_id=current_user.id).all()
+    tags = get_tag_tree(current_user.id).nodes()
 
     if form.validate_on_submit():
         contact = Contact(
@@ -38,11 +43,7 @@ def add_contact():
             user_id=current_user.id
         )
         # Assign selected tags
-        selected_tags = request.form.getlist('tags')
-        for tag_id in selected_tags:
-            tag = Tag.query.get(tag_id)
-            if tag:
-                contact.tags.append(tag)
+        contact.tags = Tag.owned(request.form.getlist('tags'), current_user.id)
 
         try:
             db.session.add(contact)
@@ -50,7 +51,7 @@ def add_contact():
             flash('Contact saved successfully!', 'success')
         except Exception as e:
             db.session.rollback()
-            print("Error saving contact:", e)
+            current_app.logger.exception("Error saving contact: %s", e)
             flash('Error saving contact. Please try again.', 'danger')
 
         flash('Contact saved successfully!', 'success')
@@ -73,6 +74,7 @@ def manage_tags():
         try:
             db.session.add(tag)
             db.session.commit()
+            invalidate_tags(current_user.id)
             flash('Tag added successfully!', 'success')
         except IntegrityError:
             db.session.rollback()
@@ -81,7 +83,7 @@ def manage_tags():
             db.session.rollback()
             flash(f'Error adding tag: {e}', 'danger')
 
-    tags = Tag.query.filter_by(user_id=current_user.id).all()
+    tags = get_tag_tree(current_user.id).nodes()
     return render_template('main/tags.html', tags=tags)
 
 @main.route('/delete_tag/<int:tag_id>', methods=['POST'])
@@ -92,8 +94,9 @@ def delete_tag(tag_id):
         abort(403)
 
     try:
-        db.session.delete(tag)
+        Tag.delete_tag(tag.id, current_user.id)
         db.session.commit()
+        invalidate_tags(current_user.id)
         flash('Tag deleted successfully!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -104,19 +107,19 @@ def delete_tag(tag_id):
 @main.route('/filter_contacts', methods=['GET'])
 @login_required
 def filter_contacts():
-    tag_id = request.args.get('tag_id', type=int)
-    if tag_id:
+    try:
+        tag_filter = Contact.tag_filter_from_args(request.args, current_user.id)
+    except ValueError as e:
+        flash(str(e), 'danger')
+        tag_filter = None
+
+    contacts = Contact.query.filter_by(user_id=current_user.id)
+    if tag_filter is not None:
         # Filter contacts by tag
-        contacts = (
-            Contact.query.join(ContactTag)
-            .filter(ContactTag.tag_id == tag_id, Contact.user_id == current_user.id)
-            .all()
-        )
-    else:
-        # No tag selected, show all contacts
-        contacts = Contact.query.filter_by(user_id=current_user.id).all()
+        contacts = contacts.filter(tag_filter)
+    contacts = contacts.all()
 
-    tags = Tag.query.filter_by(user_id=current_user.id).all()
+    tags = get_tag_tree(current_user.id).nodes()
     return render_template('main/contacts/contacts.html', contacts=contacts, tags=tags)
 
 
@@ -124,7 +127,7 @@ def filter_contacts():
 @login_required
 def contacts():
     user_contacts = Contact.query.filter_by(user_id=current_user.id).all()
-    tags = Tag.query.filter_by(user_id=current_user.id).all()
+    tags = get_tag_tree(current_user.id).nodes()
     return render_template('main/contacts/contacts.html', contacts=user_contacts, tags=tags)
 
 @main.route('/view_contact/<int:contact_id>', methods=['GET'])
@@ -144,7 +147,7 @@ def edit_contact(contact_id):
         abort(403)
 
     form = ContactForm(obj=contact)
-    tags = Tag.query.filter_by(user_id=current_user.id).all()  # Fetch all tags for the user
+    tags = get_tag_tree(current_user.id).nodes()  # All tags for the user, cached
 
     if request.method == 'POST':
         # Handle custom field addition or update
@@ -152,12 +155,10 @@ def edit_contact(contact_id):
         field_value = request.form.get('value')
 
         if field_name and field_value:
-            # Initialize custom fields if not present
-            if not contact.custom_fields:
-                contact.custom_fields = {}
-            # Add or update the custom field
-            contact.custom_fields[field_name] = field_value
+            # Add or update the custom field in place, without rewriting the rest of the document
+            Contact.update_custom_fields(contact.id, current_user.id, {field_name: field_value})
             db.session.commit()
+            db.session.refresh(contact)
             flash('Custom field updated successfully!', 'success')
 
         # Handle form submission for other fields and tag assignment
@@ -165,12 +166,7 @@ def edit_contact(contact_id):
             form.populate_obj(contact)
 
             # Update tags assigned to the contact
-            selected_tags = request.form.getlist('tags')
-            contact.tags = []  # Clear existing tags
-            for tag_id in selected_tags:
-                tag = Tag.query.get(tag_id)
-                if tag:
-                    contact.tags.append(tag)
+            contact.set_tags(request.form.getlist('tags'), current_user.id)
 
             db.session.commit()
             flash('Contact updated successfully!', 'success')
@@ -201,29 +197,38 @@ def import_data():
             flash('No file uploaded. Please upload a valid file.', 'warning')
             return redirect(url_for('main.import_data'))
 
-        data = None
-        if file.filename.endswith('.csv'):
-            data = process_csv(file)
-        elif file.filename.endswith('.json'):
-            data = process_json(file)
-        elif file.filename.endswith('.xls') or file.filename.endswith('.xlsx'):
-            data = process_excel(file)
-        else:
-            flash('Unsupported file format. Please upload a CSV, JSON, or Excel file.', 'danger')
+        if not is_importable(file.filename, file.mimetype):
+            flash('Unsupported file format. Please upload a CSV, JSON, JSON Lines or Excel file.', 'danger')
             return redirect(url_for('main.import_data'))
 
-        if data:
-            try:
-                Contact.bulk_create(data, user_id=current_user.id)
-                flash('Contacts imported successfully!', 'success')
-            except Exception as e:
-                flash(f'Error importing data: {str(e)}', 'danger')
-        else:
-            flash('No valid data found in the file.', 'warning')
+        match_on = request.form.get('match_on') or None
+        if match_on is not None and match_on not in MATCH_KEYS:
+            flash('Unknown field to match existing contacts on.', 'danger')
+            return redirect(url_for('main.import_data'))
 
-        return redirect(url_for('main.contacts'))
+        try:
+            submit_import(file, user_id=current_user.id, match_on=match_on)
+            flash('Import started. Progress is shown below.', 'success')
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Error importing data: {str(e)}', 'danger')
+
+        return redirect(url_for('main.import_data'))
+
+    jobs = ImportJob.query.filter_by(user_id=current_user.id).order_by(ImportJob.id.desc()).limit(10).all()
+    return render_template('main/import.html', jobs=jobs, match_keys=MATCH_KEYS)
 
-    return render_template('main/import.html')
+
+@main.route('/import/<int:job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_import_job(job_id):
+    job = ImportJob.query.get_or_404(job_id)
+    if job.user_id != current_user.id:
+        abort(403)
+    if job.status not in ImportJob.FINISHED:
+        cancel_import(job)
+        flash('Import cancellation requested.', 'success')
+    return redirect(url_for('main.import_data'))
 
 
 @main.route('/profile', methods=['GET', 'POST'])
@@ -232,38 +237,35 @@ def profile():
     form = ProfileForm(obj=current_user)
 
     if form.validate_on_submit():
-        print("Form submitted and validated!")
         try:
             # Update user details
             current_user.username = form.username.data
             current_user.email = form.email.data
 
             if form.password.data:
-                print("Updating password")
-                current_user.password = generate_password_hash(form.password.data)
+                current_user.password = hash_password(form.password.data)
 
             db.session.commit()
+            invalidate_user(current_user.id)
             flash('Profile updated successfully!', 'success')
-            print("Profile updated in DB")
         except Exception as e:
             db.session.rollback()
-            print(f"Error during commit: {str(e)}")
+            current_app.logger.exception("Error updating profile: %s", e)
             flash('Error updating profile!', 'danger')
 
         return redirect(url_for('main.profile'))
 
-    else:
-        if form.errors:
-            print("Form validation errors:", form.errors)
-
     return render_template('main/profile.html', form=form)
 
 @main.route('/delete_account', methods=['POST'])
 @login_required
 def delete_account():
-    # Delete the user and all associated data
-    db.session.delete(current_user)
-    db.session.commit()
+    # Delete the user and all associated data; large accounts are purged in the background
+    user_id = current_user.id
+    purge.delete_account(user_id)
+    invalidate_tags(user_id)
+    invalidate_user(user_id)
+    logout_user()
     flash('Account deleted successfully.', 'success')
     return redirect(url_for('main.home'))  # Redirect to home or login page
 
@@ -276,21 +278,14 @@ def all_contacts():
 @main.route('/contacts/most_common_tag', methods=['GET'])
 @login_required
 def most_common_tags():
-    from sqlalchemy import func
-
-    # Query for the single most common tag based on usage in contacts
-    most_common_tag = (
-        db.session.query(Tag, func.count(ContactTag.contact_id).label('usage_count'))
-        .join(ContactTag, ContactTag.tag_id == Tag.id)
-        .join(Contact, Contact.id == ContactTag.contact_id)
-        .filter(Tag.user_id == current_user.id)
-        .group_by(Tag.id)
-        .order_by(func.count(ContactTag.contact_id).desc())
-        .first()  # Fetch the top result only
+    # The most common tag, from the usage counters maintained by the database
+    tag = (
+        Tag.query.filter(Tag.user_id == current_user.id, Tag.usage_count > 0)
+        .order_by(Tag.usage_count.desc(), Tag.id)
+        .first()
     )
 
-    if most_common_tag:
-        tag, usage_count = most_common_tag
+    if tag:
         # Fetch contacts associated with the most common tag
         contacts = (
             Contact.query.join(ContactTag)
@@ -298,7 +293,6 @@ def most_common_tags():
             .all()
         )
     else:
-        tag = None
         contacts = []
 
     return render_template(
@@ -316,6 +310,7 @@ def same_firstnames():
         and_(
             Contact.first_name.in_(
                 db.session.query(Contact.first_name)
+                .filter(Contact.user_id == current_user.id)  # Only this user's contacts count as duplicates
                 .group_by(Contact.first_name)
                 .having(func.count(Contact.first_name) > 1)
             ),
@@ -332,6 +327,7 @@ def same_lastnames():
         and_(
             Contact.last_name.in_(
                 db.session.query(Contact.last_name)
+                .filter(Contact.user_id == current_user.id)  # Only this user's contacts count as duplicates
                 .group_by(Contact.last_name)
                 .having(func.count(Contact.last_name) > 1)
             ),
@@ -344,8 +340,14 @@ def same_lastnames():
 @login_required
 def search_contact():
     if request.method == 'POST':
-        first_name = request.form.get('first_name')
-        last_name = request.form.get('last_name')
-        contact = Contact.query.filter_by(first_name=first_name, last_name=last_name, user_id=current_user.id).first()
-        return render_template('main/contacts/contacts.html', contacts=[contact] if contact else [], search=True)
-    return render_template('main/contacts/search.html')  # Render a form for the user to enter name and last name
+        # Older form posted separate first and last names
+        q = request.form.get('q') or f"{request.form.get('first_name', '')} {request.form.get('last_name', '')}"
+    else:
+        q = request.args.get('q')
+    if not q or not q.strip():
+        return render_template('main/contacts/search.html')  # Render a form for the user to enter a query
+
+    page = max(request.args.get('page', 1, type=int), 1)
+    results, has_more = search_contacts(current_user.id, q, offset=(page - 1) * DEFAULT_SEARCH_LIMIT)
+    return render_template('main/contacts/contacts.html', contacts=[contact for contact, _ in results],
+                           search=True, q=q, page=page, has_more=has_more)
@@ -0,0 +1,153 @@
+import hmac
+import threading
+import time
+from collections import Counter, defaultdict
+
+from flask import Response, abort, current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Registry:
+    """In-process metrics, per endpoint. With several worker processes, each exposes its own."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = Counter()  # (endpoint, method, status) -> count
+        self.latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.response_size = defaultdict(lambda: Histogram(SIZE_BUCKETS))
+        self.queries = defaultdict(lambda: Histogram(QUERY_BUCKETS))
+        self.query_seconds = Counter()
+        self.n_plus_one = Counter()
+
+    def record(self, endpoint, method, status, seconds, size, stats):
+        with self.lock:
+            self.requests[(endpoint, method, status)] += 1
+            self.latency[(endpoint, method)].observe(seconds)
+            if size is not None:
+                self.response_size[(endpoint, method)].observe(size)
+            self.queries[(endpoint, method)].observe(stats.count)
+            self.query_seconds[(endpoint, method)] += stats.seconds
+            if stats.repeated:
+                self.n_plus_one[(endpoint, method)] += 1
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format."""
+        lines = []
+
+        def labels(key, **extra):
+            pairs = dict(zip(('endpoint', 'method', 'status'), key), **extra)
+            return '{' + ','.join(f'{name}="{value}"' for name, value in pairs.items()) + '}'
+
+        def counter(name, help_text, values):
+            lines.extend([f'# HELP {name} {help_text}', f'# TYPE {name} counter'])
+            lines.extend(f'{name}{labels(key)} {value}' for key, value in sorted(values.items()))
+
+        def histogram(name, help_text, values):
+            lines.extend([f'# HELP {name} {help_text}', f'# TYPE {name} histogram'])
+            for key, hist in sorted(values.items()):
+                for bound, count in zip(hist.buckets, hist.counts):
+                    lines.append(f'{name}_bucket{labels(key, le=bound)} {count}')
+                lines.append(f'{name}_bucket{labels(key, le="+Inf")} {hist.count}')
+                lines.append(f'{name}_sum{labels(key)} {hist.sum}')
+                lines.append(f'{name}_count{labels(key)} {hist.count}')
+
+        with self.lock:
+            counter('http_requests_total', 'Requests handled.', self.requests)
+            histogram('http_request_duration_seconds', 'Time to produce a response.', self.latency)
+            histogram('http_response_size_bytes', 'Response body size, when known.', self.response_size)
+            histogram('db_queries_per_request', 'SQL statements executed per request.', self.queries)
+            counter('db_query_duration_seconds_total', 'Time spent executing SQL.', self.query_seconds)
+            counter('db_n_plus_one_requests_total', 'Requests that repeated one statement N_PLUS_ONE_THRESHOLD or more times.',
+                    self.n_plus_one)
+        return '\n'.join(lines) + '\n'
+
+
+class QueryStats:
+    """SQL statements executed while handling one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+        self.repeated = []  # Statements that reached the N+1 threshold
+
+    def add(self, statement, seconds, threshold):
+        self.count += 1
+        self.seconds += seconds
+        self.statements[statement] += 1
+        if self.statements[statement] == threshold:
+            self.repeated.append(statement)
+
+
+registry = Registry()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info['query_start'].pop()
+    # Only queries run by a request are attributed; background import threads have no request
+    if has_request_context() and 'query_stats' in g:
+        g.query_stats.add(statement, seconds, current_app.config['N_PLUS_ONE_THRESHOLD'])
+
+
+def _start_request():
+    g.request_start = time.perf_counter()
+    g.query_stats = QueryStats()
+
+
+def _finish_request(response):
+    if 'request_start' not in g:
+        return response
+    seconds = time.perf_counter() - g.request_start
+    stats = g.query_stats
+    endpoint = request.endpoint or 'unmatched'
+    registry.record(endpoint, request.method, response.status_code, seconds, response.content_length, stats)
+    for statement in stats.repeated:
+        current_app.logger.warning("Possible N+1 in %s: statement executed %d+ times: %s",
+                                   endpoint, current_app.config['N_PLUS_ONE_THRESHOLD'], ' '.join(statement.split())[:200])
+    if current_app.config['DEBUG_QUERIES_HEADER']:
+        response.headers['X-Debug-Queries'] = (f'count={stats.count}; time_ms={stats.seconds * 1000:.1f}; '
+                                               f'n_plus_one={len(stats.repeated)}')
+    return response
+
+
+def metrics():
+    token = current_app.config['METRICS_TOKEN']
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(401)
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    """Time every request, count its SQL and expose the results at /metrics (if METRICS_ENABLED, behind METRICS_TOKEN if set)."""
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    if app.config['METRICS_ENABLED']:
+        app.add_url_rule('/metrics', 'metrics', metrics)
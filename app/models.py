@@ -1,11 +1,58 @@
+import json
+import sqlite3
+from collections import defaultdict
+from datetime import datetime, timezone
+from itertools import islice
+
 from . import db
+from .utils import parse_tags
 from flask_login import UserMixin
+from sqlalchemy import DDL, Text, and_, case, cast, column, delete, event, func, inspect, or_, table, text, tuple_, update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+# Columns that can be filled from an imported row
+IMPORT_FIELDS = ('first_name', 'last_name', 'company_name', 'address', 'phone',
+                 'email', 'fax', 'mobile', 'comment')
+# Columns natural keys are built from: changing one of them clears the contact's import_key (see app.upsert)
+KEY_FIELDS = ('first_name', 'last_name', 'company_name', 'phone', 'email', 'mobile')
+# Columns matched by contact search
+SEARCH_FIELDS = ('first_name', 'last_name', 'company_name', 'email', 'phone', 'comment')
+# Cap on row-level errors kept per import, so a bad file cannot grow the report without bound
+MAX_IMPORT_ERRORS = 1000
+# Request arguments of the form cf.<name>=<value> filter contacts on their custom fields
+CUSTOM_FIELD_ARG_PREFIX = 'cf.'
+
+
+class ValidatedRow(dict):
+    """
+    An imported row already checked by Contact.import_row, e.g. in a parsing process (see app.parsing):
+    the values to insert, or in .error the reason it was rejected. .tags holds its tags column.
+    """
+    error = None
+    tags = None
+
+
+def utcnow():
+    """Naive UTC timestamp, as stored in DateTime columns."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
 
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(150), unique=True, nullable=False)
     email = db.Column(db.String(150), unique=True, nullable=False)
     password = db.Column(db.String(300), nullable=False)
+    # Bumped on every change to the user's contacts or tags; the source of their `version` values
+    change_counter = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Maintained by the database triggers in COUNTER_TRIGGERS
+    contact_count = db.Column(db.Integer, nullable=False, server_default='0')
+    untagged_count = db.Column(db.Integer, nullable=False, server_default='0')
+    # Set while a deleted account's data is purged in the background (see app.purge)
+    deleted_at = db.Column(db.DateTime)
+    # Claimed and refreshed by the process purging the account, so only one process purges it
+    purge_heartbeat_at = db.Column(db.DateTime)
 
     @staticmethod
     def bulk_create(data, user_id):
@@ -28,6 +75,18 @@ class User(db.Model, UserMixin):
         db.session.commit()
 
 class Contact(db.Model):
+    # Columns exposed through the API, in serialization order
+    FIELDS = ('id', 'first_name', 'last_name', 'company_name', 'address', 'phone',
+              'email', 'fax', 'mobile', 'comment', 'custom_fields')
+
+    __table_args__ = (
+        db.Index('ix_contact_user_id_id', 'user_id', 'id'),  # Per-user lists and keyset paging
+        db.Index('ix_contact_user_id_last_name_first_name', 'user_id', 'last_name', 'first_name'),
+        db.Index('ix_contact_user_id_first_name', 'user_id', 'first_name'),
+        db.Index('ix_contact_user_id_version', 'user_id', 'version'),  # Change feed
+        db.Index('ix_contact_user_id_import_key', 'user_id', 'import_key', unique=True),  # Upsert imports
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     first_name = db.Column(db.String(50), nullable=False)
     last_name = db.Column(db.String(50), nullable=False)
@@ -38,9 +97,17 @@ class Contact(db.Model):
     fax = db.Column(db.String(20))
     mobile = db.Column(db.String(20))
     comment = db.Column(db.Text)  # Rich text field
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    custom_fields = db.Column(db.JSON, default={})  # JSON column for custom fields
-    tags = db.relationship('Tag', secondary='contact_tag', backref='contacts', lazy='dynamic')
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    # JSONB with a GIN index on PostgreSQL; elsewhere filters use the contact_field table (see CUSTOM_FIELD_INDEX)
+    custom_fields = db.Column(db.JSON().with_variant(JSONB(), 'postgresql'), default={})
+    created_at = db.Column(db.DateTime, default=utcnow)
+    updated_at = db.Column(db.DateTime, default=utcnow)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # User's change_counter at last write
+    tag_count = db.Column(db.Integer, nullable=False, server_default='0')  # Maintained by COUNTER_TRIGGERS
+    # Natural key the contact is matched on by upsert imports, e.g. 'email:ann@example.com' (see app.upsert)
+    import_key = db.Column(db.String(255))
+    # selectin: tags for a whole result set are loaded in one extra IN query, not one per contact
+    tags = db.relationship('Tag', secondary='contact_tag', backref='contacts', lazy='selectin')
 
     def to_dict(self):
         """Convert Contact instance to dictionary."""
@@ -56,9 +123,28 @@ class Contact(db.Model):
             "mobile": self.mobile,
             "comment": self.comment,
             "custom_fields": self.custom_fields,
-            "tags": [tag.to_dict() for tag in self.tags]  # Include tags as dictionaries
+            "tags": [tag.to_dict() for tag in self.tags],  # Include tags as dictionaries
+            "version": self.version,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
         }
 
+    @staticmethod
+    def tags_for(contact_ids):
+        """Return a {contact_id: [tag dict, ...]} map for the given contacts in one query."""
+        tags = {contact_id: [] for contact_id in contact_ids}
+        if not tags:
+            return tags
+        rows = (
+            db.session.query(ContactTag.contact_id, Tag)
+            .join(Tag, Tag.id == ContactTag.tag_id)
+            .filter(ContactTag.contact_id.in_(list(tags)))
+            .order_by(Tag.id)
+            .all()
+        )
+        for contact_id, tag in rows:
+            tags[contact_id].append(tag.to_dict())
+        return tags
+
     @staticmethod
     def bulk_create(data, user_id):
         contacts = []
@@ -80,13 +166,381 @@ class Contact(db.Model):
             db.session.bulk_save_objects(contacts)
             db.session.commit()
 
+    def set_tags(self, tag_ids, user_id):
+        """
+        Make the contact's tags exactly the user's tags among tag_ids, resolved in one query.
+        Ids that do not exist or belong to another user are ignored. Only associations that
+        actually change are added or removed, so unchanged contact_tag rows are not rewritten.
+        """
+        desired = {tag.id: tag for tag in Tag.owned(tag_ids, user_id)}
+        for tag in [tag for tag in self.tags if tag.id not in desired]:
+            self.tags.remove(tag)
+        current = {tag.id for tag in self.tags}
+        self.tags.extend(tag for tag_id, tag in desired.items() if tag_id not in current)
+
+    @staticmethod
+    def tag_filter(user_id, tag_ids, mode='any', exclude=(), descendants=False):
+        """
+        Build a WHERE clause matching contacts by tag, as one set-based subquery.
+        mode='any' matches contacts with any of tag_ids, mode='all' those with every one of them;
+        contacts with any tag in exclude are left out. With descendants=True each tag also matches
+        all tags below it in the hierarchy, expanded by a recursive CTE.
+        """
+        tag_ids, exclude = set(tag_ids), set(exclude)
+        roots = (
+            db.select(Tag.id.label('root_id'), Tag.id.label('tag_id'))
+            .where(Tag.id.in_(tag_ids | exclude), Tag.user_id == user_id)
+        )
+        if descendants:
+            roots = roots.cte('tag_subtree', recursive=True)
+            # UNION (not UNION ALL) also stops the recursion if the hierarchy ever contains a cycle
+            subtree = roots.union(
+                db.select(roots.c.root_id, Tag.id).join(roots, Tag.parent_id == roots.c.tag_id)
+            )
+        else:
+            subtree = roots.cte('tag_subtree')
+
+        def tagged(ids):
+            return (
+                db.select(ContactTag.contact_id)
+                .join(subtree, ContactTag.tag_id == subtree.c.tag_id)
+                .where(subtree.c.root_id.in_(ids))
+            )
+
+        clauses = []
+        if tag_ids:
+            if mode == 'all':
+                clauses.append(Contact.id.in_(
+                    tagged(tag_ids)
+                    .group_by(ContactTag.contact_id)
+                    .having(func.count(subtree.c.root_id.distinct()) == len(tag_ids))
+                ))
+            else:
+                clauses.append(Contact.id.in_(tagged(tag_ids)))
+        if exclude:
+            clauses.append(Contact.id.not_in(tagged(exclude)))
+        return and_(*clauses)
+
+    @staticmethod
+    def tag_filter_from_args(args, user_id):
+        """
+        Build Contact.tag_filter from request arguments: ?tags=1,2&mode=any|all&exclude=3&descendants=1
+        (?tag_id=1 is accepted as a single tag). Returns None when no tag filter was requested.
+        """
+        def ids(name):
+            try:
+                return [int(tag_id) for tag_id in args.get(name, '').split(',') if tag_id.strip()]
+            except ValueError:
+                raise ValueError(f"{name} must be a comma-separated list of tag ids.")
+
+        tag_ids = ids('tags') or ids('tag_id')
+        exclude = ids('exclude')
+        mode = args.get('mode', 'any')
+        if mode not in ('any', 'all'):
+            raise ValueError("mode must be 'any' or 'all'.")
+        if not tag_ids and not exclude:
+            return None
+        descendants = args.get('descendants', '').lower() in ('1', 'true', 'yes')
+        return Contact.tag_filter(user_id, tag_ids, mode=mode, exclude=exclude, descendants=descendants)
+
+    @staticmethod
+    def custom_field_filters(args):
+        """
+        SQL conditions for the cf.<name>=<value> request arguments; repeating a name matches any of its values.
+        Values match string fields and, when they parse as JSON numbers or booleans, fields of that type.
+        """
+        filters = []
+        for arg in args:
+            if not arg.startswith(CUSTOM_FIELD_ARG_PREFIX):
+                continue
+            name = arg[len(CUSTOM_FIELD_ARG_PREFIX):]
+            if not name:
+                raise ValueError("Custom field filters must look like cf.<name>=<value>.")
+            values = args.getlist(arg)
+            if db.engine.dialect.name == 'postgresql':
+                # Containment (@>) is what the jsonb_path_ops GIN index serves
+                documents = []
+                for value in values:
+                    documents.append({name: value})
+                    try:
+                        parsed = json.loads(value)
+                    except ValueError:
+                        continue
+                    if isinstance(parsed, (bool, int, float)):
+                        documents.append({name: parsed})
+                filters.append(or_(*[Contact.custom_fields.op('@>')(cast(document, JSONB))
+                                     for document in documents]))
+            else:
+                filters.append(Contact.id.in_(
+                    db.select(contact_field.c.contact_id)
+                    .where(contact_field.c.key == name, contact_field.c.value.in_(values))
+                ))
+        return filters
+
+    @staticmethod
+    def update_custom_fields(contact_id, user_id, values=None, remove=()):
+        """
+        Set and remove custom fields of one contact in a single UPDATE, without reading the document
+        (jsonb || and - on PostgreSQL, json_each elsewhere). Set values replace whole top-level keys, nulls
+        included. Returns False if the contact was not found. Does not commit.
+        """
+        values = dict(values or {})
+        if db.engine.dialect.name == 'postgresql':
+            # Rows may hold SQL NULL or a JSON null instead of an object; || on those would build an array
+            current = case((func.jsonb_typeof(Contact.custom_fields) == 'object', Contact.custom_fields),
+                           else_=cast({}, JSONB))
+            document = current.op('||')(cast(values, JSONB))
+            if remove:
+                document = document.op('-')(cast(postgresql.array(list(remove)), ARRAY(Text)))
+        else:
+            # Top-level merge like jsonb ||: json_patch would merge nested objects and drop keys set to null.
+            # json_each yields booleans as 1 and 0, and objects and arrays lose their JSON type through the UNION.
+            document = text(
+                "(SELECT json_group_object(key, CASE WHEN type IN ('true', 'false', 'object', 'array') "
+                "THEN json(CASE type WHEN 'true' THEN 'true' WHEN 'false' THEN 'false' ELSE value END) "
+                "ELSE value END) FROM ("
+                "SELECT key, value, type FROM json_each(CASE json_type(contact.custom_fields) "
+                "WHEN 'object' THEN contact.custom_fields ELSE '{}' END) "
+                "WHERE key NOT IN (SELECT value FROM json_each(:replaced)) "
+                "UNION ALL SELECT key, value, type FROM json_each(:values)))"
+            ).bindparams(replaced=json.dumps([*values, *remove]), values=json.dumps(values))
+        stamp = Contact.change_stamp(user_id)
+        return db.session.execute(
+            update(Contact)
+            .where(Contact.id == contact_id, Contact.user_id == user_id)
+            .values(custom_fields=document, version=stamp['version'], updated_at=stamp['updated_at']),
+            execution_options={"synchronize_session": False}
+        ).rowcount == 1
+
+    @staticmethod
+    def export_rows(user_id, batch_size=1000):
+        """
+        Yield (field values..., [tag names]) for every contact of a user, in id order.
+        Rows are streamed from a server-side cursor and tag names are aggregated in SQL.
+        """
+        separator = '\x1f'
+        if db.engine.dialect.name == 'postgresql':
+            aggregate = func.string_agg(Tag.name, separator)
+        else:
+            aggregate = func.group_concat(Tag.name, separator)
+        tag_names = (
+            db.select(aggregate)
+            .select_from(ContactTag)
+            .join(Tag, Tag.id == ContactTag.tag_id)
+            .where(ContactTag.contact_id == Contact.id)
+            .scalar_subquery()
+        )
+        statement = (
+            db.select(*[getattr(Contact, field) for field in IMPORT_FIELDS], tag_names)
+            .where(Contact.user_id == user_id)
+            .order_by(Contact.id)
+            .execution_options(yield_per=batch_size)
+        )
+        for *values, tags in db.session.execute(statement):
+            yield values, tags.split(separator) if tags else []
+
+    @staticmethod
+    def change_stamp(user_id):
+        """Version and timestamp columns for contacts written with Core statements, which skip _track_changes."""
+        now = utcnow()
+        return {"version": next_version(user_id), "created_at": now, "updated_at": now}
+
+    @staticmethod
+    def import_row(item, user_id):
+        """Validate one imported row and return the values to insert; raises ValueError."""
+        if isinstance(item, ValidatedRow):
+            if item.error:
+                raise ValueError(item.error)
+            item['user_id'] = user_id
+            return item
+        if not isinstance(item, dict):
+            raise ValueError("Row is not an object.")
+        values = {'user_id': user_id}
+        for field in IMPORT_FIELDS:
+            value = item.get(field)
+            if value is not None:
+                value = str(value).strip() or None
+            length = Contact.__table__.c[field].type.length
+            if value and length and len(value) > length:
+                raise ValueError(f"{field} is longer than {length} characters.")
+            values[field] = value
+        for field in ('first_name', 'last_name'):
+            if not values[field]:
+                raise ValueError(f"{field} is required.")
+        return values
+
+    @staticmethod
+    def import_tags(item):
+        """Tag names of an imported row: a list, or a string as CSV and Excel exports write (see parse_tags)."""
+        if isinstance(item, ValidatedRow):
+            tags = item.tags
+        else:
+            tags = item.get('tags') if isinstance(item, dict) else None
+        if isinstance(tags, str):
+            tags = parse_tags(tags)
+        if not isinstance(tags, list):
+            return []
+        names = (str(tag).strip() for tag in tags if tag is not None)
+        return list(dict.fromkeys(name for name in names if name))
+
+    @staticmethod
+    def add_tags_by_name(tagged, user_id, existing=False):
+        """
+        Tag contacts with the user's tags named in [(contact_id, [tag name, ...]), ...].
+        Names the user has no tag for are ignored; tags are never created by imports. With existing=True
+        the contacts may have some of the tags already (upserts) and only the missing ones are added.
+        Returns the ids of the contacts that gained a tag. Does not commit.
+        """
+        names = {name for _, tags in tagged for name in tags}
+        tag_ids = dict(db.session.execute(
+            db.select(Tag.name, Tag.id).where(Tag.user_id == user_id, Tag.name.in_(names))
+        ).tuples().all())
+        pairs = {(contact_id, tag_ids[name]) for contact_id, tags in tagged for name in tags if name in tag_ids}
+        if existing and pairs:
+            pairs -= set(db.session.execute(
+                db.select(ContactTag.contact_id, ContactTag.tag_id)
+                .where(tuple_(ContactTag.contact_id, ContactTag.tag_id).in_(pairs))
+            ).tuples())
+        if pairs:
+            db.session.execute(ContactTag.__table__.insert(),
+                               [{"contact_id": contact_id, "tag_id": tag_id} for contact_id, tag_id in pairs])
+        return {contact_id for contact_id, _ in pairs}
+
+    @staticmethod
+    def bulk_import(rows, user_id, batch_size=1000, first_row=1, on_batch=None):
+        """
+        Insert contacts from an iterable of row dictionaries in batches, committing after each batch.
+        A tags column tags the new contacts with the user's existing tags of those names (see import_tags).
+        on_batch(result), if given, runs inside each batch's transaction and can return False to stop.
+        Returns {"processed": int, "imported": int, "failed": int, "batches": [int, ...],
+                 "errors": [{"row": int, "error": str}, ...]}.
+        """
+        result = {"processed": 0, "imported": 0, "failed": 0, "batches": [], "errors": []}
+
+        def add_error(row_number, error):
+            result["failed"] += 1
+            if len(result["errors"]) < MAX_IMPORT_ERRORS:
+                result["errors"].append({"row": row_number, "error": error})
+
+        numbered = enumerate(rows, start=first_row)
+        while True:
+            chunk = list(islice(numbered, batch_size))
+            if not chunk:
+                break
+
+            batch = []
+            for row_number, item in chunk:
+                try:
+                    batch.append((row_number, Contact.import_row(item, user_id), Contact.import_tags(item)))
+                except ValueError as e:
+                    add_error(row_number, str(e))
+
+            inserted = 0
+            tagged = []
+            if batch:
+                statement = Contact.__table__.insert()
+                with_tags = any(tags for _, _, tags in batch)
+                if with_tags:
+                    # The new ids are needed to tag the contacts
+                    statement = statement.returning(Contact.__table__.c.id, sort_by_parameter_order=True)
+                try:
+                    stamp = Contact.change_stamp(user_id)
+                    returned = db.session.execute(statement, [dict(values, **stamp) for _, values, _ in batch])
+                    if with_tags:
+                        tagged = [(contact_id, tags) for contact_id, (_, _, tags) in zip(returned.scalars(), batch)]
+                    inserted = len(batch)
+                except SQLAlchemyError:
+                    # Retry the failed batch row by row so only the offending rows are rejected. Each row gets
+                    # a savepoint and the rows kept commit with the batch's progress, so a resumed job never
+                    # inserts them twice.
+                    db.session.rollback()
+                    stamp = Contact.change_stamp(user_id)
+                    for row_number, values, tags in batch:
+                        try:
+                            with db.session.begin_nested():
+                                returned = db.session.execute(statement, [dict(values, **stamp)])
+                                contact_id = returned.scalar_one() if with_tags else None
+                            if with_tags:
+                                tagged.append((contact_id, tags))
+                            inserted += 1
+                        except SQLAlchemyError as e:
+                            add_error(row_number, str(getattr(e, 'orig', None) or e))
+                tagged = [(contact_id, tags) for contact_id, tags in tagged if tags]
+                if tagged:
+                    Contact.add_tags_by_name(tagged, user_id)
+
+            result["processed"] += len(chunk)
+            result["batches"].append(inserted)
+            result["imported"] += inserted
+            keep_going = on_batch(result) if on_batch else True
+            db.session.commit()
+            if keep_going is False:
+                break
+        return result
+
+def search_text():
+    """The searchable text of a contact as one SQL expression; must match the search indexes exactly."""
+    document = func.coalesce(getattr(Contact, SEARCH_FIELDS[0]), '')
+    for field in SEARCH_FIELDS[1:]:
+        document = document + ' ' + func.coalesce(getattr(Contact, field), '')
+    return func.lower(document)
+
+
+def search_vector():
+    """The full-text search vector of a contact, built from search_text()."""
+    return func.to_tsvector(text("'simple'"), search_text())
+
+
+# Full-text and trigram indexes backing contact search; PostgreSQL only
+event.listen(Contact.__table__, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+db.Index('ix_contact_search_vector', search_vector(),
+         postgresql_using='gin').ddl_if(dialect='postgresql')
+db.Index('ix_contact_search_trgm', search_text().label('search_text'),
+         postgresql_using='gin', postgresql_ops={'search_text': 'gin_trgm_ops'}).ddl_if(dialect='postgresql')
+
+db.Index('ix_contact_custom_fields', Contact.custom_fields,
+         postgresql_using='gin', postgresql_ops={'custom_fields': 'jsonb_path_ops'}).ddl_if(dialect='postgresql')
+
+# Without JSONB, custom fields are indexed as (key, value) rows kept in step with contact.custom_fields by
+# triggers. Scalar values are stored as text; nested objects and arrays are not indexed.
+contact_field = table('contact_field', column('contact_id'), column('key'), column('value'))
+CUSTOM_FIELD_ROWS = """
+    INSERT INTO contact_field (contact_id, key, value)
+    SELECT NEW.id, key, CASE type WHEN 'true' THEN 'true' WHEN 'false' THEN 'false' ELSE CAST(value AS TEXT) END
+    FROM json_each(NEW.custom_fields) WHERE type NOT IN ('object', 'array', 'null');
+"""
+CUSTOM_FIELD_INDEX = {
+    'sqlite': [
+        "CREATE TABLE contact_field (contact_id INTEGER NOT NULL, key VARCHAR(100) NOT NULL, value TEXT, "
+        "PRIMARY KEY (contact_id, key))",
+        "CREATE INDEX ix_contact_field_key_value ON contact_field (key, value)",
+        f"CREATE TRIGGER contact_field_insert AFTER INSERT ON contact BEGIN {CUSTOM_FIELD_ROWS} END",
+        "CREATE TRIGGER contact_field_update AFTER UPDATE OF custom_fields ON contact BEGIN "
+        f"DELETE FROM contact_field WHERE contact_id = NEW.id; {CUSTOM_FIELD_ROWS} END",
+        "CREATE TRIGGER contact_field_delete AFTER DELETE ON contact BEGIN "
+        "DELETE FROM contact_field WHERE contact_id = OLD.id; END",
+    ],
+}
+for dialect, statements in CUSTOM_FIELD_INDEX.items():
+    for statement in statements:
+        event.listen(Contact.__table__, 'after_create', DDL(statement).execute_if(dialect=dialect))
+event.listen(Contact.__table__, 'before_drop',
+             DDL('DROP TABLE IF EXISTS contact_field').execute_if(dialect='sqlite'))
+
 class Tag(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), unique=True, nullable=False)
     color = db.Column(db.String(20))  # Hex color codes like #FF5733
-    parent_id = db.Column(db.Integer, db.ForeignKey('tag.id'), nullable=True)
+    parent_id = db.Column(db.Integer, db.ForeignKey('tag.id', ondelete='SET NULL'), nullable=True, index=True)
     children = db.relationship('Tag', backref=db.backref('parent', remote_side=[id]))
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=utcnow)
+    updated_at = db.Column(db.DateTime, default=utcnow)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    usage_count = db.Column(db.Integer, nullable=False, server_default='0')  # Contacts with this tag; see COUNTER_TRIGGERS
+
+    __table_args__ = (db.Index('ix_tag_user_id_version', 'user_id', 'version'),)
 
     def to_dict(self):
         """Convert Tag instance to dictionary."""
@@ -94,9 +548,265 @@ class Tag(db.Model):
             "id": self.id,
             "name": self.name,
             "color": self.color,
-            "parent_id": self.parent_id
+            "parent_id": self.parent_id,
+            "version": self.version
         }
 
+    @staticmethod
+    def owned(tag_ids, user_id):
+        """Return the tags among tag_ids that belong to the user, in a single IN query."""
+        ids = set()
+        for tag_id in tag_ids or []:
+            try:
+                ids.add(int(tag_id))
+            except (TypeError, ValueError):
+                continue
+        if not ids:
+            return []
+        return Tag.query.filter(Tag.id.in_(ids), Tag.user_id == user_id).all()
+
+    @staticmethod
+    def delete_tag(tag_id, user_id):
+        """
+        Delete one of the user's tags with set-based statements instead of loading its children and
+        contacts: child tags become top-level tags, contact links are removed, and the affected contacts
+        and tags get a new version. Returns False if the tag was not found. Does not commit.
+        """
+        now = utcnow()
+        version = next_version(user_id)
+        options = {"synchronize_session": False}
+        tagged = db.select(ContactTag.contact_id).where(ContactTag.tag_id == tag_id)
+        db.session.execute(
+            update(Contact).where(Contact.user_id == user_id, Contact.id.in_(tagged))
+            .values(version=version, updated_at=now), execution_options=options)
+        db.session.execute(
+            update(Tag).where(Tag.user_id == user_id, Tag.parent_id == tag_id)
+            .values(parent_id=None, version=version, updated_at=now), execution_options=options)
+        # One DELETE for all links, rather than the per-row ON DELETE CASCADE, so counter triggers run once
+        db.session.execute(delete(ContactTag).where(ContactTag.tag_id == tag_id), execution_options=options)
+        deleted = db.session.execute(
+            delete(Tag).where(Tag.id == tag_id, Tag.user_id == user_id), execution_options=options
+        ).rowcount
+        if deleted:
+            db.session.add(Tombstone(user_id=user_id, kind='tag', object_id=tag_id, version=version, deleted_at=now))
+        return deleted == 1
+
 class ContactTag(db.Model):
-    contact_id = db.Column(db.Integer, db.ForeignKey('contact.id'), primary_key=True)
-    tag_id = db.Column(db.Integer, db.ForeignKey('tag.id'), primary_key=True)
+    # The primary key covers contact -> tags; this covers tag -> contacts (filters, tag usage counts)
+    __table_args__ = (db.Index('ix_contact_tag_tag_id_contact_id', 'tag_id', 'contact_id'),)
+
+    contact_id = db.Column(db.Integer, db.ForeignKey('contact.id', ondelete='CASCADE'), primary_key=True)
+    tag_id = db.Column(db.Integer, db.ForeignKey('tag.id', ondelete='CASCADE'), primary_key=True)
+
+# Usage counters kept by the database in the same transaction as every write, whichever code path
+# (ORM relationship changes, Core bulk statements, cascades) made it: tag.usage_count,
+# contact.tag_count, and user.contact_count / user.untagged_count.
+# PostgreSQL uses statement-level triggers, so a bulk statement costs one counter UPDATE per table.
+COUNTER_TRIGGERS = {
+    'postgresql': [
+        """
+        CREATE OR REPLACE FUNCTION contact_tag_counts() RETURNS trigger LANGUAGE plpgsql AS $$
+        DECLARE step integer := CASE TG_OP WHEN 'INSERT' THEN 1 ELSE -1 END;
+        BEGIN
+            UPDATE tag SET usage_count = tag.usage_count + step * d.n
+            FROM (SELECT tag_id, count(*) AS n FROM changed_rows GROUP BY tag_id) d WHERE tag.id = d.tag_id;
+            UPDATE contact SET tag_count = contact.tag_count + step * d.n
+            FROM (SELECT contact_id, count(*) AS n FROM changed_rows GROUP BY contact_id) d WHERE contact.id = d.contact_id;
+            RETURN NULL;
+        END $$
+        """,
+        "CREATE TRIGGER contact_tag_insert_counts AFTER INSERT ON contact_tag "
+        "REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION contact_tag_counts()",
+        "CREATE TRIGGER contact_tag_delete_counts AFTER DELETE ON contact_tag "
+        "REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION contact_tag_counts()",
+        """
+        CREATE OR REPLACE FUNCTION contact_counts() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                UPDATE "user" SET contact_count = "user".contact_count + d.n,
+                                  untagged_count = "user".untagged_count + d.untagged
+                FROM (SELECT user_id, count(*) AS n, count(*) FILTER (WHERE tag_count = 0) AS untagged
+                      FROM new_rows GROUP BY user_id) d
+                WHERE "user".id = d.user_id;
+            ELSIF TG_OP = 'DELETE' THEN
+                UPDATE "user" SET contact_count = "user".contact_count - d.n,
+                                  untagged_count = "user".untagged_count - d.untagged
+                FROM (SELECT user_id, count(*) AS n, count(*) FILTER (WHERE tag_count = 0) AS untagged
+                      FROM old_rows GROUP BY user_id) d
+                WHERE "user".id = d.user_id;
+            ELSE
+                UPDATE "user" SET untagged_count = "user".untagged_count + d.delta
+                FROM (SELECT n.user_id, sum((n.tag_count = 0)::int - (o.tag_count = 0)::int) AS delta
+                      FROM old_rows o JOIN new_rows n ON n.id = o.id GROUP BY n.user_id) d
+                WHERE "user".id = d.user_id AND d.delta <> 0;
+            END IF;
+            RETURN NULL;
+        END $$
+        """,
+        "CREATE TRIGGER contact_insert_counts AFTER INSERT ON contact "
+        "REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION contact_counts()",
+        "CREATE TRIGGER contact_update_counts AFTER UPDATE ON contact "
+        "REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION contact_counts()",
+        "CREATE TRIGGER contact_delete_counts AFTER DELETE ON contact "
+        "REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION contact_counts()",
+    ],
+    'sqlite': [
+        """
+        CREATE TRIGGER contact_tag_insert_counts AFTER INSERT ON contact_tag BEGIN
+            UPDATE tag SET usage_count = usage_count + 1 WHERE id = NEW.tag_id;
+            UPDATE contact SET tag_count = tag_count + 1 WHERE id = NEW.contact_id;
+        END
+        """,
+        """
+        CREATE TRIGGER contact_tag_delete_counts AFTER DELETE ON contact_tag BEGIN
+            UPDATE tag SET usage_count = usage_count - 1 WHERE id = OLD.tag_id;
+            UPDATE contact SET tag_count = tag_count - 1 WHERE id = OLD.contact_id;
+        END
+        """,
+        """
+        CREATE TRIGGER contact_insert_counts AFTER INSERT ON contact BEGIN
+            UPDATE "user" SET contact_count = contact_count + 1, untagged_count = untagged_count + (NEW.tag_count = 0)
+            WHERE id = NEW.user_id;
+        END
+        """,
+        """
+        CREATE TRIGGER contact_update_counts AFTER UPDATE OF tag_count ON contact
+        WHEN (OLD.tag_count = 0) <> (NEW.tag_count = 0) BEGIN
+            UPDATE "user" SET untagged_count = untagged_count + (NEW.tag_count = 0) - (OLD.tag_count = 0)
+            WHERE id = NEW.user_id;
+        END
+        """,
+        """
+        CREATE TRIGGER contact_delete_counts AFTER DELETE ON contact BEGIN
+            UPDATE "user" SET contact_count = contact_count - 1, untagged_count = untagged_count - (OLD.tag_count = 0)
+            WHERE id = OLD.user_id;
+        END
+        """,
+    ],
+}
+
+# contact_tag is created after the user, contact and tag tables, so all of them exist by then
+for dialect, statements in COUNTER_TRIGGERS.items():
+    for statement in statements:
+        event.listen(ContactTag.__table__, 'after_create', DDL(statement).execute_if(dialect=dialect))
+
+class Tombstone(db.Model):
+    """Records a deleted contact or tag so sync clients can learn about the deletion."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # 'contact' or 'tag'
+    object_id = db.Column(db.Integer, nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+
+    __table_args__ = (db.Index('ix_tombstone_user_id_version', 'user_id', 'version'),)
+
+def next_version(user_id, connection=None):
+    """
+    Increment and return the user's change counter.
+    The UPDATE locks the user row until commit, so a user's versions are committed in increasing order.
+    """
+    return (connection or db.session).execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(change_counter=User.change_counter + 1)
+        .returning(User.change_counter)
+    ).scalar_one()
+
+@event.listens_for(db.session, 'before_flush')
+def _track_changes(session, flush_context, instances):
+    """Stamp changed contacts and tags with a new version and leave tombstones for deleted ones."""
+    changed = defaultdict(list)
+    for obj in session.new | session.dirty:
+        if isinstance(obj, (Contact, Tag)) and (obj in session.new or session.is_modified(obj)):
+            changed[obj.user_id].append(obj)
+        if isinstance(obj, Contact) and obj not in session.new and _key_changed(obj):
+            # The stored key no longer matches; the next upsert import keys the contact again
+            obj.import_key = None
+    deleted = [obj for obj in session.deleted if isinstance(obj, (Contact, Tag))]
+    for obj in deleted:
+        changed.setdefault(obj.user_id, [])
+    if not changed:
+        return
+
+    now = utcnow()
+    versions = {}
+    for user_id, objs in changed.items():
+        versions[user_id] = next_version(user_id, session.connection())
+        for obj in objs:
+            obj.version = versions[user_id]
+            obj.updated_at = now
+    for obj in deleted:
+        session.add(Tombstone(user_id=obj.user_id, kind=obj.__tablename__, object_id=obj.id,
+                              version=versions[obj.user_id], deleted_at=now))
+
+def _key_changed(contact):
+    """True if a field the contact's import_key was built from changed, and the key itself was not set."""
+    attrs = inspect(contact).attrs
+    return (any(attrs[field].history.has_changes() for field in KEY_FIELDS)
+            and not attrs.import_key.history.has_changes())
+
+@event.listens_for(Engine, 'connect')
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    """SQLite only enforces foreign keys, ON DELETE CASCADE included, when each connection asks for it."""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys = ON')
+        cursor.close()
+
+class ImportJob(db.Model):
+    """A contact import running in the background; the uploaded file is spooled to `path`."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    filename = db.Column(db.String(255), nullable=False)
+    path = db.Column(db.String(500), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed, cancelled
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    bytes_total = db.Column(db.BigInteger, nullable=False, default=0)
+    bytes_read = db.Column(db.BigInteger, nullable=False, default=0)
+    rows_processed = db.Column(db.Integer, nullable=False, default=0)
+    rows_imported = db.Column(db.Integer, nullable=False, default=0)
+    rows_failed = db.Column(db.Integer, nullable=False, default=0)
+    # Upsert imports: the natural key ('email', 'phone' or 'name') rows are merged on, and their outcomes
+    match_on = db.Column(db.String(20))
+    rows_updated = db.Column(db.Integer, nullable=False, default=0)
+    rows_skipped = db.Column(db.Integer, nullable=False, default=0)  # No key, duplicated in the file, or unchanged
+    errors = db.Column(db.JSON, default=list)  # Row-level errors, stored when the job finishes
+    error = db.Column(db.Text)  # Set when the whole job failed
+    created_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    FINISHED = ('done', 'failed', 'cancelled')
+
+    def to_dict(self):
+        """Convert ImportJob instance to dictionary, including throughput and ETA estimates."""
+        elapsed = None
+        if self.started_at:
+            elapsed = ((self.finished_at or utcnow()) - self.started_at).total_seconds()
+        throughput = round(self.rows_processed / elapsed, 1) if elapsed else None
+        eta = None
+        if self.status == 'running' and elapsed and self.bytes_read:
+            # Estimated from the share of the file consumed so far
+            remaining = max(self.bytes_total - self.bytes_read, 0)
+            eta = round(elapsed * remaining / self.bytes_read, 1)
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "cancel_requested": self.cancel_requested,
+            "rows_processed": self.rows_processed,
+            "rows_imported": self.rows_imported,
+            "rows_failed": self.rows_failed,
+            "match_on": self.match_on,
+            "rows_updated": self.rows_updated,
+            "rows_skipped": self.rows_skipped,
+            "rows_per_second": throughput,
+            "eta_seconds": eta,
+            "errors": self.errors or [],
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
@@ -0,0 +1,172 @@
+import csv
+import io
+import mmap
+import re
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from app.models import IMPORT_FIELDS, Contact, ValidatedRow
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Shared by all import threads, so at most `workers` cores parse at once per process
+            _pool = ProcessPoolExecutor(max_workers=workers)
+        return _pool
+
+
+# A quoted field, as csv.reader reads one: a double quote opens it only at the start of a field, "" inside
+# it is an escaped quote, and an unclosed one runs to the end of the data. Quotes elsewhere, as in
+# 5" screen, are literal
+QUOTED_FIELD = re.compile(rb'(?<![^,\r\n])"[^"]*(?:""[^"]*)*(?:"|\Z)')
+# Whole records, newline included. Possessive, so a quote that opens a field is never re-read as a literal one
+RECORDS = re.compile(rb'(?:(?:[^"\n]+|' + QUOTED_FIELD.pattern + rb'|")*+\n)*+')
+
+
+def _record_end(data, start, position):
+    """
+    Offset just past the first newline at or after position that ends a record, i.e. is not inside a
+    quoted field, or len(data). start must be a record boundary: the records wholly before position
+    are skipped in one match, then the quoted fields of the record position falls in are followed.
+    """
+    record = RECORDS.match(data, start, position).end()
+    newline = data.find(b'\n', position)
+    for field in QUOTED_FIELD.finditer(data, record):
+        if newline == -1 or field.start() > newline:
+            break
+        if field.end() > newline:
+            newline = data.find(b'\n', field.end())
+    return len(data) if newline == -1 else newline + 1
+
+
+def split_records(data, chunk_bytes):
+    """
+    Split a CSV document (bytes or mmap) into (start, end) byte ranges of about chunk_bytes each that
+    begin and end on record boundaries. The first range is the header row. A generator, so chunks can be
+    parsed while the rest of the document is still being split.
+    """
+    start = _record_end(data, 0, 0)
+    yield 0, start
+    while start < len(data):
+        end = _record_end(data, start, min(start + chunk_bytes, len(data)))
+        yield start, end
+        start = end
+
+
+def parse_chunk(path, start, end, header):
+    """
+    Parse and validate the CSV records between two byte offsets of a file. Runs in the pool.
+    Returns per record a tuple of its IMPORT_FIELDS values followed by its tags column, or the error
+    message if Contact.import_row rejects it. Tuples, unlike dictionaries, are cheap to send back to the importing process.
+    Returns None if the chunk may not have been split on record boundaries: a record has more or fewer
+    fields than the header, or the chunk ends inside a quoted field. The reader then parses the rest serially.
+    """
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        text = data[start:end].decode('utf-8')
+    rows = []
+    try:
+        # strict: an unclosed quoted field at the end of the chunk is an error rather than a field
+        for record in csv.reader(io.StringIO(text, newline=''), strict=True):
+            if not record:
+                continue  # Blank lines are skipped, as csv.DictReader does
+            if len(record) != len(header):
+                return None
+            item = dict(zip(header, record))
+            try:
+                values = Contact.import_row(item, None)
+                rows.append(tuple(values[field] for field in IMPORT_FIELDS) + (item.get('tags'),))
+            except ValueError as e:
+                rows.append(str(e))
+    except csv.Error:
+        return None
+    return rows
+
+
+class ParallelCSVReader:
+    """
+    Yields the rows of a CSV file on disk, like utils.iter_csv, but parses and validates them in a
+    process pool: the file is memory-mapped, split on record boundaries into chunks of chunk_bytes and the
+    chunks are handled in parallel. Rows come out in file order as ValidatedRows, which Contact.import_row
+    passes through, so the import thread is left with the inserts. At most `workers` + 1 parsed chunks are
+    held in memory. tell() is the end offset of the chunk being read, for progress like a stream's.
+    Should a chunk not parse cleanly (see parse_chunk), the rest of the file is read serially, as iter_csv does.
+    """
+
+    def __init__(self, path, workers, chunk_bytes=16 * 1024 * 1024):
+        self.path = path
+        self.workers = workers
+        self.chunk_bytes = chunk_bytes
+        self.bytes_read = 0
+        self._stream = None  # The file while the rest of it is parsed serially
+
+    def __iter__(self):
+        with open(self.path, 'rb') as f:
+            if not f.seek(0, io.SEEK_END):
+                return  # Empty files cannot be memory-mapped
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                yield from self._read_chunks(data)
+
+    def _read_chunks(self, data):
+        ranges = split_records(data, self.chunk_bytes)
+        start, end = next(ranges)
+        try:
+            header = list(csv.reader(io.StringIO(data[start:end].decode('utf-8'), newline=''), strict=True))
+        except csv.Error:
+            header = None
+        if not header or len(header) != 1:
+            yield from self._read_serially(0)
+            return
+        header = header[0]
+
+        pool = _get_pool(self.workers)
+        pending = deque()
+        try:
+            while True:
+                while len(pending) <= self.workers:
+                    chunk = next(ranges, None)
+                    if chunk is None:
+                        break
+                    pending.append((chunk, pool.submit(parse_chunk, self.path, *chunk, header)))
+                if not pending:
+                    break
+                (start, end), future = pending.popleft()
+                rows = future.result()
+                if rows is None:
+                    # The split cannot be trusted from here on; the chunks before this one parsed cleanly,
+                    # so it starts on a record boundary
+                    yield from self._read_serially(start, header)
+                    return
+                self.bytes_read = end
+                for values in rows:
+                    if isinstance(values, str):
+                        row = ValidatedRow()
+                        row.error = values
+                    else:
+                        row = ValidatedRow(zip(IMPORT_FIELDS, values))
+                        row.tags = values[-1]
+                    yield row
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+    def tell(self):
+        return self._stream.tell() if self._stream else self.bytes_read
+
+    def _read_serially(self, start, header=None):
+        """Rows from byte offset start on as utils.iter_csv yields them, left to Contact.import_row to validate."""
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            self._stream = f
+            text_stream = io.TextIOWrapper(f, encoding='utf-8', newline='')
+            try:
+                yield from csv.DictReader(text_stream, fieldnames=header)
+            finally:
+                text_stream.detach()
+                self.bytes_read = f.tell()
+                self._stream = None
@@ -0,0 +1,49 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _run(func, *args, **kwargs):
+    """Run a hashing function in the password pool if PASSWORD_HASH_WORKERS is set, else in this thread."""
+    workers = current_app.config['PASSWORD_HASH_WORKERS']
+    if not workers:
+        return func(*args, **kwargs)
+
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # At most `workers` cores hash at once, however many requests are logging in
+            _pool = ProcessPoolExecutor(max_workers=workers)
+    return _pool.submit(func, *args, **kwargs).result()
+
+
+def hash_password(password):
+    """Hash a password with the configured PASSWORD_HASH_METHOD and PASSWORD_SALT_LENGTH."""
+    return _run(generate_password_hash, password,
+                method=current_app.config['PASSWORD_HASH_METHOD'],
+                salt_length=current_app.config['PASSWORD_SALT_LENGTH'])
+
+
+def needs_rehash(password_hash):
+    """True if the hash was made with a different method, parameters or salt length than configured."""
+    method, _, rest = (password_hash or '').partition('$')
+    salt = rest.partition('$')[0]
+    return (method != current_app.config['PASSWORD_HASH_METHOD']
+            or len(salt) != current_app.config['PASSWORD_SALT_LENGTH'])
+
+
+def check_password(user, password):
+    """
+    Check a login password. When it matches a hash made with outdated settings, user.password is
+    replaced by a hash with the current ones; the caller commits.
+    """
+    if not user or not password or not _run(check_password_hash, user.password, password):
+        return False
+    if needs_rehash(user.password):
+        user.password = hash_password(password)
+    return True
@@ -0,0 +1,137 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from flask import current_app
+from sqlalchemy import and_, delete, or_, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db
+from app.models import Contact, ContactTag, ImportJob, User, utcnow
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(app):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=app.config['PURGE_WORKERS'], thread_name_prefix='purge')
+        return _executor
+
+
+def _enqueue(app, user_id):
+    if app.config['PURGE_WORKERS'] > 0:
+        _get_executor(app).submit(run_purge, app, user_id)
+    else:
+        run_purge(app, user_id)
+
+
+def purge_user(user_id, batch_size, on_chunk=None):
+    """
+    Delete a user and everything they own with set-based statements, committing every batch_size
+    contacts so no single transaction locks the whole account. Safe to run again after an interruption.
+    on_chunk(), if given, runs inside each chunk's transaction.
+    """
+    while True:
+        # Chunks are id ranges, served by ix_contact_user_id_id, so no id lists travel back and forth
+        upto = db.session.scalar(
+            db.select(Contact.id).where(Contact.user_id == user_id)
+            .order_by(Contact.id).offset(batch_size - 1).limit(1)
+        )
+        chunk = Contact.user_id == user_id if upto is None else and_(Contact.user_id == user_id, Contact.id <= upto)
+        # Links first, in one statement: the ON DELETE CASCADE would remove them contact by contact
+        db.session.execute(delete(ContactTag).where(ContactTag.contact_id.in_(db.select(Contact.id).where(chunk))))
+        db.session.execute(delete(Contact).where(chunk), execution_options={"synchronize_session": False})
+        if on_chunk:
+            on_chunk()
+        db.session.commit()
+        if upto is None:
+            break
+
+    # Tags, tombstones and import jobs are few; the foreign keys cascade them with the user row
+    db.session.execute(delete(User).where(User.id == user_id), execution_options={"synchronize_session": False})
+    db.session.commit()
+
+
+def _heartbeat(user_id):
+    db.session.execute(update(User).where(User.id == user_id).values(purge_heartbeat_at=utcnow()))
+
+
+def run_purge(app, user_id):
+    """
+    Purge one deleted account in its own app context, unless another process is purging it.
+    A failed or abandoned purge is taken over by the next resume_purges.
+    """
+    with app.app_context():
+        # Claim the purge atomically; a live purge refreshes its claim after every chunk
+        stale = utcnow() - timedelta(seconds=app.config['PURGE_STALE_SECONDS'])
+        claimed = db.session.execute(
+            update(User)
+            .where(User.id == user_id, User.deleted_at.is_not(None),
+                   or_(User.purge_heartbeat_at.is_(None), User.purge_heartbeat_at < stale))
+            .values(purge_heartbeat_at=utcnow())
+        ).rowcount
+        db.session.commit()
+        if not claimed:
+            return
+
+        try:
+            purge_user(user_id, app.config['PURGE_BATCH_SIZE'], on_chunk=lambda: _heartbeat(user_id))
+        except SQLAlchemyError:
+            db.session.rollback()
+            app.logger.exception("Purging deleted user %s failed", user_id)
+            # Release the claim so the next resume_purges retries at once
+            db.session.execute(update(User).where(User.id == user_id).values(purge_heartbeat_at=None))
+            db.session.commit()
+
+
+def delete_account(user_id):
+    """
+    Delete an account and all of its data. The account is closed first (login stops working, the email and
+    username can register again and its import jobs stop), so a purge that fails half-way is finished by the
+    next resume_purges. Accounts with up to PURGE_INLINE_MAX_CONTACTS contacts are purged right away, larger
+    ones in the background. Returns True if the purge continues in the background.
+    """
+    app = current_app._get_current_object()
+    db.session.execute(
+        update(ImportJob).where(ImportJob.user_id == user_id, ImportJob.status == 'queued')
+        .values(status='cancelled', finished_at=utcnow())
+    )
+    db.session.execute(
+        update(ImportJob).where(ImportJob.user_id == user_id, ImportJob.status == 'running')
+        .values(cancel_requested=True)
+    )
+    contact_count = db.session.scalar(db.select(User.contact_count).where(User.id == user_id))
+    db.session.execute(
+        update(User).where(User.id == user_id)
+        .values(deleted_at=utcnow(), username=f'deleted-{user_id}', email=f'deleted-{user_id}@invalid', password='')
+    )
+    db.session.commit()
+    if not app.config['PURGE_WORKERS'] or contact_count <= app.config['PURGE_INLINE_MAX_CONTACTS']:
+        # Claimed and run like a background purge, so a failure leaves it to resume_purges
+        run_purge(app, user_id)
+        return db.session.scalar(db.select(User.id).where(User.id == user_id)) is not None
+
+    _enqueue(app, user_id)
+    return True
+
+
+def resume_purges(app):
+    """
+    Re-queue purges of deleted accounts left unfinished by a previous process. Purges still being
+    run by a live process are skipped when run_purge fails to claim them.
+    """
+    with app.app_context():
+        try:
+            user_ids = db.session.scalars(
+                db.select(User.id).where(User.deleted_at.is_not(None)).order_by(User.id)
+            ).all()
+        except SQLAlchemyError:
+            # Tables not created yet (first run, or migrations pending)
+            db.session.rollback()
+            return
+
+    for user_id in user_ids:
+        _enqueue(app, user_id)
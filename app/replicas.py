@@ -0,0 +1,59 @@
+import random
+from functools import wraps
+
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+
+REPLICA_BIND = 'replica'
+
+
+class RoutingSession(Session):
+    """Session that sends SELECTs to the read replica bind while a @use_replica view is running."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and clause is not None and clause.is_select
+                and has_app_context() and g.get('use_replica')):
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def use_replica(view):
+    """
+    Run a read-only view's queries on the read replica, if one is configured. Replicas may lag slightly.
+    The flag lives on g, so it also covers streamed responses and ends with the request.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.use_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def engine_options(app):
+    """Pool and timeout options for every engine, built from the DB_* settings."""
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if uri.startswith('sqlite'):
+        return {}
+    options = {
+        'pool_size': app.config['DB_POOL_SIZE'],
+        'max_overflow': app.config['DB_MAX_OVERFLOW'],
+        'pool_timeout': app.config['DB_POOL_TIMEOUT'],
+        'pool_pre_ping': app.config['DB_POOL_PRE_PING'],
+        'pool_recycle': app.config['DB_POOL_RECYCLE'],
+    }
+    if uri.startswith('postgresql') and app.config['DB_STATEMENT_TIMEOUT_MS']:
+        options['connect_args'] = {'options': f"-c statement_timeout={app.config['DB_STATEMENT_TIMEOUT_MS']}"}
+    return options
+
+
+def configure_engines(app):
+    """Apply engine_options() and register one of DATABASE_REPLICA_URLS (chosen per process) as the replica bind."""
+    options = engine_options(app)
+    # Options set explicitly in the config class win
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {**options, **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
+    if app.config['DATABASE_REPLICA_URLS']:
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds[REPLICA_BIND] = {'url': random.choice(app.config['DATABASE_REPLICA_URLS']), **options}
+        app.config['SQLALCHEMY_BINDS'] = binds
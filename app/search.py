@@ -0,0 +1,117 @@
+import heapq
+import re
+from functools import lru_cache
+from difflib import SequenceMatcher
+
+from sqlalchemy import and_, desc, func, or_, text
+
+from app import db
+from app.models import Contact, SEARCH_FIELDS, search_text, search_vector
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+# Longer queries are truncated to this many terms
+MAX_SEARCH_TERMS = 10
+# difflib ratio from which a word counts as a fuzzy match in the fallback search; one letter changed in a
+# word of n letters scores (n - 1) / n
+FALLBACK_FUZZY_RATIO = 0.8
+# Shorter terms only match exactly, by prefix or as a substring: one letter off in "ann3" is another name
+FALLBACK_FUZZY_MIN_LENGTH = 5
+
+
+def search_terms(q):
+    """Split a search query into lowercase word terms."""
+    return re.findall(r'\w+', (q or '').lower())[:MAX_SEARCH_TERMS]
+
+
+def _search_postgres(user_id, terms, limit):
+    """Rank contacts with the GIN full-text (prefix) and trigram (substring, fuzzy) indexes."""
+    document = search_text()
+    vector = search_vector()
+    tsquery = func.to_tsquery(text("'simple'"), ' & '.join(f'{term}:*' for term in terms))
+
+    # Every term must occur as a substring or a fuzzy word match; both are served by the trigram index
+    term_matches = []
+    rank = func.ts_rank(vector, tsquery)
+    for term in terms:
+        pattern = '%' + term.replace('\\', '\\\\').replace('_', '\\_') + '%'
+        term_matches.append(or_(document.like(pattern, escape='\\'), document.op('%>')(term)))
+        rank = rank + func.word_similarity(term, document)
+
+    return (
+        db.session.query(Contact.id, rank.label('rank'))
+        .filter(Contact.user_id == user_id, or_(vector.op('@@')(tsquery), and_(*term_matches)))
+        .order_by(desc('rank'), Contact.id)
+        .limit(limit)
+        .all()
+    )
+
+
+def _similarity(term, word):
+    """difflib ratio of two words, or 0 when their lengths alone keep it below FALLBACK_FUZZY_RATIO."""
+    if 2 * min(len(term), len(word)) < FALLBACK_FUZZY_RATIO * (len(term) + len(word)):
+        return 0
+    return SequenceMatcher(None, term, word).ratio()
+
+
+def _term_score(term, words, document, similarity=_similarity):
+    if term in words:
+        return 1.0
+    if any(word.startswith(term) for word in words):
+        return 0.8
+    if term in document:
+        return 0.6
+    if len(term) < FALLBACK_FUZZY_MIN_LENGTH:
+        return 0
+    best = max((similarity(term, word) for word in words), default=0)
+    return best * 0.5 if best >= FALLBACK_FUZZY_RATIO else 0
+
+
+def _search_fallback(user_id, terms, limit):
+    """
+    In-process ranking for databases without full-text/trigram support (SQLite in development).
+    Streams the user's searchable columns and keeps only the best `limit` matches in memory.
+    """
+    columns = [getattr(Contact, field) for field in SEARCH_FIELDS]
+    rows = (
+        db.session.query(Contact.id, *columns)
+        .filter(Contact.user_id == user_id)
+        .yield_per(1000)
+    )
+
+    # Names repeat across contacts, so each word is compared with a term once per search
+    similarity = lru_cache(maxsize=100000)(_similarity)
+
+    def scored():
+        for contact_id, *values in rows:
+            document = ' '.join(value for value in values if value).lower()
+            words = set(re.findall(r'\w+', document))
+            score = 0
+            for term in terms:
+                term_score = _term_score(term, words, document, similarity)
+                if not term_score:
+                    break
+                score += term_score
+            else:
+                yield contact_id, score
+
+    return heapq.nsmallest(limit, scored(), key=lambda match: (-match[1], match[0]))
+
+
+def search_contacts(user_id, q, limit=DEFAULT_SEARCH_LIMIT, offset=0):
+    """
+    Search a user's contacts by name, company, email, phone and comment.
+    Returns ([(contact, score), ...], has_more), best matches first.
+    """
+    terms = search_terms(q)
+    if not terms:
+        return [], False
+
+    search = _search_postgres if db.engine.dialect.name == 'postgresql' else _search_fallback
+    ranked = search(user_id, terms, offset + limit + 1)[offset:]
+    has_more = len(ranked) > limit
+    ranked = ranked[:limit]
+
+    contacts = {contact.id: contact for contact in
+                Contact.query.filter(Contact.id.in_([contact_id for contact_id, _ in ranked]))}
+    return [(contacts[contact_id], round(float(score), 4)) for contact_id, score in ranked], has_more
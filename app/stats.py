@@ -0,0 +1,55 @@
+from sqlalchemy import distinct, func
+
+from app import db
+from app.cache import TagTree
+from app.models import ContactTag, Tag, User
+
+
+def _subtree_contact_counts(user_id, tag_ids):
+    """
+    {tag id: distinct contacts tagged with the tag or any tag below it} for tags that have children,
+    counted with one recursive CTE; a contact with several tags in a subtree counts once.
+    """
+    if not tag_ids:
+        return {}
+    roots = (
+        db.select(Tag.id.label('root_id'), Tag.id.label('tag_id'))
+        .where(Tag.id.in_(tag_ids), Tag.user_id == user_id)
+        .cte('tag_subtree', recursive=True)
+    )
+    # UNION (not UNION ALL) also stops the recursion if the hierarchy ever contains a cycle
+    subtree = roots.union(db.select(roots.c.root_id, Tag.id).join(roots, Tag.parent_id == roots.c.tag_id))
+    return dict(db.session.execute(
+        db.select(subtree.c.root_id, func.count(distinct(ContactTag.contact_id)))
+        .join(ContactTag, ContactTag.tag_id == subtree.c.tag_id)
+        .group_by(subtree.c.root_id)
+    ).tuples().all())
+
+
+def tag_usage_stats(user_id, top=10):
+    """
+    Tag usage for a user: the `top` most used tags, usage per tag and per subtree, and contact/untagged
+    totals. Usage per tag and the totals are read from the counters the database maintains. A subtree's
+    usage is the number of distinct contacts tagged in it: the counter for tags without children, one
+    recursive query over the contacts of the other subtrees.
+    """
+    rows = db.session.execute(
+        db.select(Tag.id, Tag.name, Tag.color, Tag.parent_id, Tag.usage_count)
+        .where(Tag.user_id == user_id).order_by(Tag.id)
+    ).all()
+    tree = TagTree([row._asdict() for row in rows])
+    usage = {row.id: row.usage_count for row in rows}
+    subtree_usage = dict(usage)
+    subtree_usage.update(_subtree_contact_counts(user_id, [tag_id for tag_id in tree.tags if tree.children[tag_id]]))
+    contacts, untagged = db.session.execute(
+        db.select(User.contact_count, User.untagged_count).where(User.id == user_id)
+    ).one()
+
+    ranked = sorted((tag_id for tag_id in usage if usage[tag_id]), key=lambda tag_id: (-usage[tag_id], tag_id))
+    return {
+        "top": [tree.tags[tag_id] for tag_id in ranked[:top]],
+        "tags": [{"id": tag_id, "usage_count": usage[tag_id], "subtree_usage_count": subtree_usage[tag_id]}
+                 for tag_id in tree.tags],
+        "contacts": contacts,
+        "untagged_contacts": untagged,
+    }
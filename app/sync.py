@@ -0,0 +1,55 @@
+from app import db
+from app.models import Contact, Tag, Tombstone, User
+
+
+def _changed(model, user_id, since, upto, limit=None, version=None):
+    query = model.query.filter(model.user_id == user_id)
+    if version is not None:
+        query = query.filter(model.version == version)
+    else:
+        query = query.filter(model.version > since, model.version <= upto)
+    query = query.order_by(model.version, model.id)
+    return query.limit(limit).all() if limit else query.all()
+
+
+def changes_since(user_id, since, limit):
+    """
+    Return the user's contacts, tags and deletions with a version after `since`, oldest first.
+    Pages end on a version boundary so the returned cursor never splits one change; a single
+    change larger than `limit` (a big import batch, say) is returned whole.
+    """
+    # Read the counter first: every version up to it is committed, later ones are picked up next time
+    upto = db.session.scalar(db.select(User.change_counter).where(User.id == user_id)) or 0
+    fetched = [_changed(model, user_id, since, upto, limit + 1) for model in (Contact, Tag, Tombstone)]
+
+    # Versions below the last one fetched from a truncated list are complete in every list
+    truncated = [rows[-1].version for rows in fetched if len(rows) > limit]
+    complete = min(truncated) - 1 if truncated else upto
+    items = sorted((row for rows in fetched for row in rows if row.version <= complete),
+                   key=lambda row: row.version)
+    has_more = complete < upto
+    if len(items) > limit:
+        boundary = items[limit].version
+        items = [row for row in items if row.version < boundary]
+        has_more = True
+
+    if not items and has_more:
+        version = min(rows[0].version for rows in fetched if rows)
+        items = [row for model in (Contact, Tag, Tombstone)
+                 for row in _changed(model, user_id, since, upto, version=version)]
+        has_more = version < upto
+
+    if has_more:
+        cursor = items[-1].version
+    else:
+        cursor = max(since, upto)
+    return {
+        "contacts": [row.to_dict() for row in items if isinstance(row, Contact)],
+        "tags": [row.to_dict() for row in items if isinstance(row, Tag)],
+        "deleted": {
+            "contacts": [row.object_id for row in items if isinstance(row, Tombstone) and row.kind == 'contact'],
+            "tags": [row.object_id for row in items if isinstance(row, Tombstone) and row.kind == 'tag'],
+        },
+        "cursor": cursor,
+        "has_more": has_more,
+    }
@@ -0,0 +1,23 @@
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='api-token')
+
+
+def issue_token(user):
+    """Return a signed bearer token for the user, valid for API_TOKEN_MAX_AGE seconds."""
+    return _serializer().dumps({"id": user.id})
+
+
+def user_id_from_token(authorization):
+    """Return the user id from an 'Authorization: Bearer <token>' header value, or None if invalid or expired."""
+    scheme, _, token = authorization.partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return None
+    try:
+        payload = _serializer().loads(token.strip(), max_age=current_app.config['API_TOKEN_MAX_AGE'])
+    except BadSignature:
+        return None
+    return payload.get('id') if isinstance(payload, dict) else None
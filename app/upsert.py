@@ -0,0 +1,304 @@
+import csv
+import json
+import tempfile
+from itertools import islice
+
+from sqlalchemy import BigInteger, Column, MetaData, String, Table, Text, and_, bindparam, cast, func, or_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db
+from app.duplicates import normalize_email, normalize_name, normalize_phone
+from app.models import IMPORT_FIELDS, MAX_IMPORT_ERRORS, Contact, ContactTag, Tag
+
+# Natural keys an import can merge on
+MATCH_KEYS = ('email', 'phone', 'name')
+
+
+def natural_key(match_on, values, country_code=''):
+    """
+    The import_key of a row or contact for one kind of natural key, or None if it has no such key:
+    'email:<normalized email>', 'phone:<E.164 phone or mobile>' or 'name:<first last>|<company>'.
+    """
+    if match_on == 'email':
+        key = normalize_email(values.get('email'))
+    elif match_on == 'phone':
+        key = normalize_phone(values.get('phone'), country_code) or normalize_phone(values.get('mobile'), country_code)
+    else:
+        name = normalize_name(values.get('first_name'), values.get('last_name'))
+        key = f"{name}|{normalize_name(values.get('company_name'), '')}" if name else None
+    return f'{match_on}:{key}'[:255] if key else None
+
+
+def claim_existing(user_id, match_on, country_code='', batch_size=1000):
+    """
+    Key the user's contacts that have no key yet (added by hand, by a plain import, or edited since they
+    were keyed), so the upsert finds them. The oldest contact wins when several share a key. Contacts keep
+    the key they have: one keyed on email is not re-keyed by a phone upsert, which would rewrite the whole
+    book whenever imports alternate, so such an import inserts a new contact instead.
+    Candidates are streamed batch_size at a time. Commits. After the first upsert import only contacts
+    added or edited since are read.
+    """
+    candidates = db.session.execute(
+        db.select(Contact.id, Contact.email, Contact.phone, Contact.mobile,
+                  Contact.first_name, Contact.last_name, Contact.company_name)
+        .where(Contact.user_id == user_id, Contact.import_key.is_(None))
+        .order_by(Contact.id)
+        .execution_options(yield_per=batch_size)
+    )
+    claim = (
+        update(Contact.__table__)
+        .where(Contact.__table__.c.id == bindparam('contact_id'))
+        .values(import_key=bindparam('key'))
+    )
+    claimed = 0
+    for partition in candidates.partitions():
+        keys = {}
+        for row in partition:
+            key = natural_key(match_on, row._mapping, country_code)
+            if key:
+                keys.setdefault(key, row.id)
+        # Keys claimed by earlier batches are in the table already, so older contacts still win
+        taken = set(db.session.scalars(
+            db.select(Contact.import_key).where(Contact.user_id == user_id, Contact.import_key.in_(keys))
+        )) if keys else set()
+        params = [{"contact_id": contact_id, "key": key} for key, contact_id in keys.items() if key not in taken]
+        if params:
+            db.session.execute(claim, params)
+        claimed += len(params)
+    db.session.commit()
+    return claimed
+
+
+def _upsert_statement():
+    """
+    INSERT ... ON CONFLICT (user_id, import_key) DO UPDATE, executed with a list of row values.
+    Values are passed as executemany parameters, so the statement compiles once and is cached.
+    """
+    table = Contact.__table__
+    insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+    statement = insert(table)
+    excluded = statement.excluded
+    # Empty cells keep what the contact has; rows that would change nothing are left alone
+    changes = {field: func.coalesce(excluded[field], table.c[field]) for field in IMPORT_FIELDS}
+    changed = or_(*[and_(excluded[field].is_not(None), excluded[field].is_distinct_from(table.c[field]))
+                    for field in IMPORT_FIELDS])
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.import_key],
+        set_=dict(changes, version=excluded.version, updated_at=excluded.updated_at),
+        where=changed,
+    ).returning(table.c.id, table.c.created_at)
+
+
+def _merge(rows, user_id):
+    """
+    Upsert one list of row values; returns {contact id: True if inserted, False if updated}.
+    Rows that would change nothing are left out.
+    """
+    stamp = Contact.change_stamp(user_id)
+    returned = db.session.execute(_upsert_statement(), [dict(values, **stamp) for values in rows]).all()
+    # Updates leave created_at alone, so only inserted rows carry this batch's timestamp
+    return {contact_id: created_at == stamp['created_at'] for contact_id, created_at in returned}
+
+
+def _add_tags(tagged, user_id):
+    """
+    Tag upserted contacts with the user's tags named in {import_key: [tag name, ...]}, keeping the tags
+    they have. Contacts that gain a tag get a new version; returns their ids.
+    """
+    ids = dict(db.session.execute(
+        db.select(Contact.import_key, Contact.id).where(Contact.user_id == user_id, Contact.import_key.in_(tagged))
+    ).tuples().all())
+    gained = Contact.add_tags_by_name([(ids[key], tags) for key, tags in tagged.items() if key in ids],
+                                      user_id, existing=True)
+    if gained:
+        stamp = Contact.change_stamp(user_id)
+        db.session.execute(
+            update(Contact).where(Contact.id.in_(gained))
+            .values(version=stamp['version'], updated_at=stamp['updated_at']),
+            execution_options={"synchronize_session": False}
+        )
+    return gained
+
+
+def bulk_upsert(rows, user_id, match_on, batch_size=1000, first_row=1, on_batch=None, country_code=''):
+    """
+    Merge rows into the user's contacts on a natural key (see natural_key) in batches of
+    INSERT ... ON CONFLICT DO UPDATE, committing after each batch. Non-empty cells overwrite the matched
+    contact's fields; new keys become new contacts. A tags column adds the user's tags of those names to
+    the contact, keeping the ones it has (see Contact.import_tags). on_batch works as for Contact.bulk_import.
+    Returns {"processed", "imported" (inserted), "updated", "skipped", "failed", "batches", "errors"}.
+    """
+    result = {"processed": 0, "imported": 0, "updated": 0, "skipped": 0, "failed": 0, "batches": [], "errors": []}
+
+    def add_error(row_number, error):
+        result["failed"] += 1
+        if len(result["errors"]) < MAX_IMPORT_ERRORS:
+            result["errors"].append({"row": row_number, "error": error})
+
+    numbered = enumerate(rows, start=first_row)
+    while True:
+        chunk = list(islice(numbered, batch_size))
+        if not chunk:
+            break
+
+        # One row per key: a statement cannot update the same contact twice, so the last row wins
+        batch = {}
+        for row_number, item in chunk:
+            try:
+                values = Contact.import_row(item, user_id)
+            except ValueError as e:
+                add_error(row_number, str(e))
+                continue
+            values['import_key'] = natural_key(match_on, values, country_code)
+            if values['import_key'] is None:
+                result["skipped"] += 1
+                continue
+            if values['import_key'] in batch:
+                result["skipped"] += 1
+            batch[values['import_key']] = (row_number, values, Contact.import_tags(item))
+
+        changed = {}
+        if batch:
+            try:
+                changed = _merge([values for _, values, _ in batch.values()], user_id)
+            except SQLAlchemyError:
+                # Retry the failed batch row by row so only the offending rows are rejected. Each row gets a
+                # savepoint, and the rows are committed with the batch's progress below, as in bulk_import
+                db.session.rollback()
+                for row_number, values, _ in list(batch.values()):
+                    try:
+                        with db.session.begin_nested():
+                            changed.update(_merge([values], user_id))
+                    except SQLAlchemyError as e:
+                        add_error(row_number, str(getattr(e, 'orig', None) or e))
+                        batch.pop(values['import_key'])
+            tagged = {key: tags for key, (_, _, tags) in batch.items() if tags}
+            if tagged:
+                # A contact that only gained tags was updated too
+                changed.update((contact_id, False) for contact_id in _add_tags(tagged, user_id) - changed.keys())
+
+        inserted = sum(changed.values())
+        result["skipped"] += len(batch) - len(changed)
+        result["imported"] += inserted
+        result["updated"] += len(changed) - inserted
+        result["batches"].append(inserted)
+        result["processed"] += len(chunk)
+        keep_going = on_batch(result) if on_batch else True
+        db.session.commit()
+        if keep_going is False:
+            break
+    return result
+
+
+def staged_upsert(rows, user_id, match_on, on_batch=None, country_code=''):
+    """
+    The bulk_upsert of very large files on PostgreSQL: validated rows are COPYed into a temporary staging
+    table and merged with one INSERT ... SELECT ... ON CONFLICT DO UPDATE, in a single transaction.
+    Much faster than batches, but all or nothing: progress shows and cancellation applies only at the end
+    (on_batch is called once, before the commit). Tags are added as by bulk_upsert.
+    Returns the same counts as bulk_upsert.
+    """
+    result = {"processed": 0, "imported": 0, "updated": 0, "skipped": 0, "failed": 0, "batches": [], "errors": []}
+    fields = ('row_number', 'import_key') + IMPORT_FIELDS
+    staging = Table(
+        'import_staging', MetaData(),
+        Column('row_number', BigInteger), Column('import_key', String(255)),
+        *[Column(field, Text) for field in IMPORT_FIELDS],
+        Column('tags', Text),  # JSON array of tag names
+        prefixes=['TEMPORARY'], postgresql_on_commit='DROP',
+    )
+
+    # Validate into a CSV spool (in memory up to 64 MB, then on disk) for COPY
+    staged = 0
+    with tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024, mode='w+', newline='') as spool:
+        writer = csv.writer(spool)
+        for row_number, item in enumerate(rows, start=1):
+            result["processed"] += 1
+            try:
+                values = Contact.import_row(item, user_id)
+            except ValueError as e:
+                result["failed"] += 1
+                if len(result["errors"]) < MAX_IMPORT_ERRORS:
+                    result["errors"].append({"row": row_number, "error": str(e)})
+                continue
+            values['import_key'] = natural_key(match_on, values, country_code)
+            if values['import_key'] is None:
+                result["skipped"] += 1
+                continue
+            values['row_number'] = row_number
+            # \N marks NULL so that empty strings survive
+            tags = Contact.import_tags(item)
+            writer.writerow(['\\N' if values[field] is None else values[field] for field in fields]
+                            + [json.dumps(tags) if tags else '\\N'])
+            staged += 1
+        spool.seek(0)
+
+        connection = db.session.connection()
+        staging.create(connection)
+        with connection.connection.cursor() as cursor:
+            cursor.copy_expert(f"COPY import_staging ({', '.join(fields + ('tags',))}) "
+                               "FROM STDIN WITH (FORMAT csv, NULL '\\N')", spool)
+
+    # The last row of each key wins, as in bulk_upsert
+    latest = (
+        db.select(*[staging.c[field] for field in IMPORT_FIELDS], staging.c.import_key, staging.c.tags)
+        .distinct(staging.c.import_key)
+        .order_by(staging.c.import_key, staging.c.row_number.desc())
+        .subquery()
+    )
+    stamp = Contact.change_stamp(user_id)
+    table = Contact.__table__
+    columns = list(IMPORT_FIELDS) + ['import_key', 'user_id', 'version', 'created_at', 'updated_at', 'custom_fields']
+    statement = postgresql.insert(table).from_select(columns, db.select(
+        *[latest.c[field] for field in IMPORT_FIELDS], latest.c.import_key,
+        bindparam('user_id', user_id), bindparam('version', stamp['version']),
+        bindparam('created_at', stamp['created_at']), bindparam('updated_at', stamp['updated_at']),
+        bindparam('custom_fields', {}, type_=table.c.custom_fields.type),
+    ))
+    excluded = statement.excluded
+    merged = statement.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.import_key],
+        set_=dict({field: func.coalesce(excluded[field], table.c[field]) for field in IMPORT_FIELDS},
+                  version=excluded.version, updated_at=excluded.updated_at),
+        where=or_(*[and_(excluded[field].is_not(None), excluded[field].is_distinct_from(table.c[field]))
+                    for field in IMPORT_FIELDS]),
+    ).returning(table.c.created_at).cte('merged')
+    inserted, returned = db.session.execute(db.select(
+        func.count().filter(merged.c.created_at == stamp['created_at']), func.count()
+    ).select_from(merged)).one()
+
+    # Tag the merged contacts. Those merged above already carry this stamp's version, so only contacts that
+    # just gained a tag are stamped (and counted as updated) here
+    names = (
+        db.select(latest.c.import_key, func.jsonb_array_elements_text(cast(latest.c.tags, JSONB)).label('name'))
+        .where(latest.c.tags.is_not(None))
+        .subquery()
+    )
+    pairs = (
+        db.select(Contact.id, Tag.id).select_from(names)
+        .join(Contact, and_(Contact.user_id == user_id, Contact.import_key == names.c.import_key))
+        .join(Tag, and_(Tag.user_id == user_id, Tag.name == names.c.name))
+    )
+    gained = (
+        postgresql.insert(ContactTag).from_select(['contact_id', 'tag_id'], pairs)
+        .on_conflict_do_nothing().returning(ContactTag.contact_id).cte('gained')
+    )
+    tagged = db.session.execute(
+        update(Contact).add_cte(gained)
+        .where(Contact.id.in_(db.select(gained.c.contact_id)), Contact.version != stamp['version'])
+        .values(version=stamp['version'], updated_at=stamp['updated_at']),
+        execution_options={"synchronize_session": False}
+    ).rowcount
+
+    result["imported"] = inserted
+    result["updated"] = returned - inserted + tagged
+    result["skipped"] -= tagged
+    result["skipped"] += staged - returned
+    result["batches"].append(inserted)
+    if on_batch and on_batch(result) is False:
+        db.session.rollback()
+        return dict(result, imported=0, updated=0, batches=[])
+    db.session.commit()
+    return result
@@ -1,7 +1,19 @@
-import pandas as pd
 import csv
 import json
 import io
+import logging
+import os
+import re
+import tempfile
+from collections import namedtuple
+
+# openpyxl and pandas (with numpy) are slow to import and only needed for Excel files,
+# so they are imported inside the functions that use them, on first use
+
+# Whitespace between JSON tokens, as the json module defines it
+JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+logger = logging.getLogger(__name__)
 
 def process_csv(file):
     """
@@ -16,7 +28,7 @@ def process_csv(file):
             data.append(row)
         return data
     except Exception as e:
-        print(f"Error processing CSV: {e}")
+        logger.warning("Error processing CSV: %s", e)
         return None
 
 
@@ -27,7 +39,7 @@ def process_json(file):
     try:
         return json.load(file)
     except Exception as e:
-        print(f"Error processing JSON: {e}")
+        logger.warning("Error processing JSON: %s", e)
         return None
 
 
@@ -36,6 +48,8 @@ def process_excel(file):
     Processes an Excel file and returns a list of dictionaries representing the rows.
     """
     try:
+        import pandas as pd
+
         data = []
         # Use pandas to read the Excel file
         excel_data = pd.read_excel(file.stream)
@@ -43,5 +57,246 @@ def process_excel(file):
         data = excel_data.to_dict(orient='records')
         return data
     except Exception as e:
-        print(f"Error processing Excel: {e}")
+        logger.warning("Error processing Excel: %s", e)
         return None
+
+
+def iter_csv(file):
+    """
+    Yields the rows of a CSV file one at a time as dictionaries.
+    """
+    text_stream = io.TextIOWrapper(file.stream, encoding='utf-8', newline='')
+    try:
+        yield from csv.DictReader(text_stream)
+    finally:
+        # Detach so the wrapper does not close the caller's stream when it is garbage collected
+        text_stream.detach()
+
+
+def iter_json(file, chunk_chars=64 * 1024):
+    """
+    Yields the items of a JSON array one at a time. The document is read chunk by chunk and decoded
+    item by item, so only a chunk and the current item are held in memory, never the whole upload.
+    """
+    decoder = json.JSONDecoder()
+    text_stream = io.TextIOWrapper(file.stream, encoding='utf-8')
+    buffer, position = '', 0
+
+    def read_more():
+        nonlocal buffer, position
+        chunk = text_stream.read(chunk_chars)
+        buffer, position = buffer[position:] + chunk, 0
+        return bool(chunk)
+
+    def next_char():
+        # The next character that is not whitespace, at buffer[position]; '' at the end of the document
+        nonlocal position
+        while True:
+            position = JSON_WHITESPACE.match(buffer, position).end()
+            if position < len(buffer) or not read_more():
+                return buffer[position:position + 1]
+
+    try:
+        if next_char() != '[':
+            raise ValueError("A JSON import must be an array of objects.")
+        position += 1
+        if next_char() == ']':
+            return
+        while True:
+            next_char()
+            while True:
+                try:
+                    item, end = decoder.raw_decode(buffer, position)
+                    # Complete once a separator follows: a number cut off as 2.5 may go on as 2.5e3
+                    following = JSON_WHITESPACE.match(buffer, end).end()
+                    if buffer[following:following + 1] in (',', ']'):
+                        break
+                except json.JSONDecodeError:
+                    pass  # Cut off by the end of the buffer, or invalid: read on to tell which
+                if not read_more():
+                    item, end = decoder.raw_decode(buffer, position)
+                    break
+            yield item
+            position = end
+            separator = next_char()
+            if separator == ']':
+                return
+            if separator != ',':
+                raise ValueError("Expected ',' or ']' after an item of the JSON array.")
+            position += 1
+    finally:
+        # Detach so the wrapper does not close the caller's stream when it is garbage collected
+        text_stream.detach()
+
+
+def iter_jsonl(file):
+    """
+    Yields the objects of a JSON Lines (NDJSON) file one line at a time, as export_jsonl writes them.
+    """
+    text_stream = io.TextIOWrapper(file.stream, encoding='utf-8')
+    try:
+        for line in text_stream:
+            if line.strip():
+                yield json.loads(line)
+    finally:
+        text_stream.detach()
+
+
+def iter_excel(file):
+    """
+    Yields the rows of the first Excel worksheet one at a time as dictionaries.
+    The workbook is opened in openpyxl read-only mode so rows are not all held in memory.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file.stream, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [str(column).strip() if column is not None else None for column in header]
+        for values in rows:
+            if all(value is None for value in values):
+                continue
+            yield {column: value for column, value in zip(header, values) if column}
+    finally:
+        workbook.close()
+
+
+def iter_xls(file):
+    """
+    Yields the rows of a legacy .xls workbook; openpyxl cannot read the format, so pandas loads it whole.
+    Unlike process_excel, parse errors are raised, so the import job fails with them.
+    """
+    import pandas as pd
+
+    return iter(pd.read_excel(file.stream).to_dict(orient='records'))
+
+
+# Import and export formats by name. Readers take an uploaded file and yield row dictionaries;
+# writers take Contact.export_rows() and the field names and yield chunks of the document.
+# More formats can be added with register_importer/register_exporter.
+Importer = namedtuple('Importer', 'name extensions content_types reader')
+Exporter = namedtuple('Exporter', 'name content_type extension writer')
+IMPORTERS = {}
+EXPORTERS = {}
+
+
+def register_importer(name, extensions, content_types, reader):
+    IMPORTERS[name] = Importer(name, tuple(extensions), tuple(content_types), reader)
+
+
+def register_exporter(name, content_type, extension, writer):
+    EXPORTERS[name] = Exporter(name, content_type, extension, writer)
+
+
+def find_importer(filename, content_type=None):
+    """
+    Returns the importer for a file, chosen by its extension or else by its content type, or None.
+    """
+    extension = os.path.splitext(filename or '')[1].lower()
+    for importer in IMPORTERS.values():
+        if extension in importer.extensions:
+            return importer
+    for importer in IMPORTERS.values():
+        if content_type in importer.content_types:
+            return importer
+    return None
+
+
+def find_exporter(name=None, accept=None):
+    """
+    Returns the exporter with this name (None if there is none), or else the best match for an
+    Accept header (a werkzeug MIMEAccept), falling back to CSV.
+    """
+    if name:
+        return EXPORTERS.get(name)
+    best = accept.best_match([exporter.content_type for exporter in EXPORTERS.values()]) if accept else None
+    return next((exporter for exporter in EXPORTERS.values() if exporter.content_type == best), EXPORTERS['csv'])
+
+
+def is_importable(filename, content_type=None):
+    """
+    Returns True if iter_rows can read the file.
+    """
+    return find_importer(filename, content_type) is not None
+
+
+def iter_rows(file):
+    """
+    Returns a row iterator for an uploaded file based on its extension or content type, or None if unsupported.
+    """
+    importer = find_importer(file.filename, file.mimetype)
+    return importer.reader(file) if importer else None
+
+
+def format_tags(names):
+    """
+    Tag names as one cell, separated by ', '. Names holding a comma or a double quote are quoted CSV-style,
+    so parse_tags splits the cell back into the same names.
+    """
+    return ', '.join('"' + name.replace('"', '""') + '"' if ',' in name or '"' in name else name for name in names)
+
+
+def parse_tags(value):
+    """Tag names from a cell written by format_tags (or a plain comma-separated list)."""
+    return next(csv.reader([value], skipinitialspace=True), [])
+
+
+def export_csv(rows, fields):
+    """
+    Yields a CSV document chunk by chunk; tags are written as one column (see format_tags).
+    The header matches what process_csv/iter_csv read back.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(list(fields) + ['tags'])
+    for count, (values, tags) in enumerate(rows, start=1):
+        writer.writerow(values + [format_tags(tags)])
+        if count % 1000 == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_jsonl(rows, fields):
+    """
+    Yields one JSON object per line, with tags as a list of names.
+    """
+    for values, tags in rows:
+        yield json.dumps(dict(zip(fields, values), tags=tags)) + '\n'
+
+
+def export_xlsx(rows, fields, chunk_size=64 * 1024):
+    """
+    Yields an Excel workbook in chunks. The sheet is built with openpyxl in write-only mode and saved
+    to a temporary file, so memory use does not grow with the number of rows.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Contacts')
+    sheet.append(list(fields) + ['tags'])
+    for values, tags in rows:
+        sheet.append(values + [format_tags(tags)])
+    with tempfile.TemporaryFile() as output:
+        workbook.save(output)
+        output.seek(0)
+        while True:
+            chunk = output.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+register_importer('csv', ['.csv'], ['text/csv', 'application/csv'], iter_csv)
+register_importer('json', ['.json'], ['application/json'], iter_json)
+register_importer('jsonl', ['.jsonl', '.ndjson'], ['application/x-ndjson', 'application/jsonl'], iter_jsonl)
+register_importer('xlsx', ['.xlsx'], ['application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'], iter_excel)
+register_importer('xls', ['.xls'], ['application/vnd.ms-excel'], iter_xls)
+
+register_exporter('csv', 'text/csv', 'csv', export_csv)
+register_exporter('jsonl', 'application/x-ndjson', 'jsonl', export_jsonl)
+register_exporter('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx', export_xlsx)
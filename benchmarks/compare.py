@@ -0,0 +1,48 @@
+"""
+Compare two benchmarks/run.py JSON results, e.g. from the commits before and after a change.
+
+    python benchmarks/compare.py before.json after.json [--scenario search ...]
+"""
+import argparse
+import json
+
+# Lower is better for every metric except throughput
+METRICS = ('requests_per_second', 'p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request', 'peak_memory_kb')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--scenario', action='append', help='compare only these scenarios (repeatable)')
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print(f"before: {before['meta'].get('commit')} ({before['meta']['database']})   "
+          f"after: {after['meta'].get('commit')} ({after['meta']['database']})")
+
+    for name in sorted(set(before['scenarios']) | set(after['scenarios'])):
+        if args.scenario and name not in args.scenario:
+            continue
+        old, new = before['scenarios'].get(name), after['scenarios'].get(name)
+        if old is None or new is None:
+            print(f'{name}: only in {"after" if old is None else "before"}')
+            continue
+        print(name)
+        for metric in METRICS:
+            change = (new[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0
+            print(f'  {metric:<22}{old[metric]:>12}{new[metric]:>12}{change:>+10.1f}%')
+
+    if 'startup' in before and 'startup' in after:
+        old, new = before['startup']['import_ms'], after['startup']['import_ms']
+        print('startup')
+        print(f'  {"import_ms":<22}{old:>12}{new:>12}{(new - old) / old * 100 if old else 0.0:>+10.1f}%')
+        for name in after['startup']['heavy_modules']:
+            print(f'  heavy module imported at startup: {name}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Account deletion benchmark: time to delete a user versus their contact count, with one cascading
+DELETE of the user row and with the chunked purge used for large accounts.
+
+    python benchmarks/delete_account.py [--database-url postgresql://localhost/address_book_bench]
+                                        [--sizes 1000 10000 100000] [--tags 50] [--batch-size 5000]
+
+The database is reset first, so never point --database-url at real data.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+import seed as seeding  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='contacts per account')
+    parser.add_argument('--tags', type=int, default=50, help='tags per account')
+    parser.add_argument('--batch-size', type=int, default=5000, help='contacts per transaction when chunked')
+    args = parser.parse_args()
+
+    path = None
+    if args.database_url:
+        database_url = args.database_url
+    else:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        database_url = 'sqlite:///' + path
+    config.Config.SQLALCHEMY_DATABASE_URI = database_url
+    config.Config.PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'  # Seeding speed only; logins are not measured
+
+    from sqlalchemy import delete
+
+    from app import create_app, db
+    from app.models import User
+    from app.purge import purge_user
+
+    def cascade(user_id):
+        db.session.execute(delete(User).where(User.id == user_id))
+        db.session.commit()
+
+    methods = [('cascade', cascade), ('chunked', lambda user_id: purge_user(user_id, args.batch_size))]
+
+    app = create_app()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        print(f'{"contacts":>10}{"method":>10}{"seconds":>10}{"contacts/s":>12}')
+        for size in args.sizes:
+            for name, method in methods:
+                # A bystander account keeps the tables realistic: only one user's rows go
+                user_id, _ = seeding.seed(2, size, args.tags, seed=size)
+                start = time.perf_counter()
+                method(user_id)
+                elapsed = time.perf_counter() - start
+                print(f'{size:>10}{name:>10}{elapsed:>10.2f}{size / elapsed:>12.0f}')
+                db.drop_all()
+                db.create_all()
+    if path:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Requests per second for an authenticated API read (GET /api/home) with the original per-request
+user query, with the user-identity cache, and with a signed bearer token.
+
+    python benchmarks/load_user.py [--requests 2000]
+
+Runs against a throwaway SQLite database, so it shows the database round trips saved rather than
+their real cost; against PostgreSQL over a network each saved query is worth considerably more.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    config.Config.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + path
+    config.Config.API_TOKENS = True
+
+    from app import create_app, db, login_manager
+    from app.models import User
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        engine = db.engine
+    # Requests run outside of an app context so each gets a fresh session, as in production
+    queries = []
+    event.listen(engine, 'before_cursor_execute', lambda *_: queries.append(1))
+    client = app.test_client()
+    client.post('/api/register', json={'email': 'bench@example.com', 'username': 'bench', 'password': 'bench123'})
+    token = client.post('/api/login', json={'email': 'bench@example.com', 'password': 'bench123'}).get_json()['token']
+
+    def run(name, headers=None, session=True):
+        bench = app.test_client()
+        if session:
+            bench.post('/api/login', json={'email': 'bench@example.com', 'password': 'bench123'})
+        bench.get('/api/home', headers=headers)  # warm up
+        queries.clear()
+        start = time.perf_counter()
+        for _ in range(args.requests):
+            assert bench.get('/api/home', headers=headers).status_code == 200
+        elapsed = time.perf_counter() - start
+        print(f'{name:<24}{args.requests / elapsed:>10.0f} req/s{len(queries) / args.requests:>8.2f} queries/req')
+
+    cached_loader = login_manager._user_callback
+    login_manager.user_loader(lambda user_id: db.session.get(User, int(user_id)))
+    run('query per request')
+    login_manager.user_loader(cached_loader)
+    run('user cache')
+    run('bearer token', headers={'Authorization': f'Bearer {token}'}, session=False)
+
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
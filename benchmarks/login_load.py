@@ -0,0 +1,101 @@
+"""
+Login load test: concurrent logins alongside contact list reads, reporting login and read latency
+percentiles with hashing in the request threads and in a bounded process pool.
+
+    python benchmarks/login_load.py [--threads 16] [--logins 200] [--pool-workers 2]
+
+Runs in-process against a throwaway SQLite database with Flask's test client.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+
+EMAIL, PASSWORD = 'bench@example.com', 'bench123'
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))] * 1000
+
+
+def report(name, samples):
+    print(f'{name:<28}{len(samples):>6}  p50 {percentile(samples, 50):8.1f} ms  '
+          f'p99 {percentile(samples, 99):8.1f} ms  mean {statistics.mean(samples) * 1000:8.1f} ms')
+
+
+def run(app, threads, logins, readers):
+    login_times, read_times = [], []
+    done = threading.Event()
+
+    def login(_):
+        client = app.test_client()
+        start = time.perf_counter()
+        assert client.post('/api/login', json={'email': EMAIL, 'password': PASSWORD}).status_code == 200
+        login_times.append(time.perf_counter() - start)
+
+    def read():
+        client = app.test_client()
+        client.post('/api/login', json={'email': EMAIL, 'password': PASSWORD})
+        while not done.is_set():
+            start = time.perf_counter()
+            assert client.get('/api/contacts?limit=50').status_code == 200
+            read_times.append(time.perf_counter() - start)
+
+    reader_threads = [threading.Thread(target=read) for _ in range(readers)]
+    for thread in reader_threads:
+        thread.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(login, range(logins)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    for thread in reader_threads:
+        thread.join()
+    return login_times, read_times, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16, help='concurrent logins')
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--readers', type=int, default=2, help='threads reading contacts meanwhile')
+    parser.add_argument('--pool-workers', type=int, default=2, help='PASSWORD_HASH_WORKERS for the pooled run')
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    config.Config.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + path
+
+    from app import create_app, db
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+    client.post('/api/register', json={'email': EMAIL, 'username': 'bench', 'password': PASSWORD})
+    client.post('/api/login', json={'email': EMAIL, 'password': PASSWORD})
+    for i in range(50):
+        client.post('/api/contacts', json={'first_name': f'First{i}', 'last_name': f'Last{i}'})
+
+    for workers in (0, args.pool_workers):
+        app.config['PASSWORD_HASH_WORKERS'] = workers
+        login_times, read_times, elapsed = run(app, args.threads, args.logins, args.readers)
+        label = f'pool of {workers}' if workers else 'request threads'
+        print(f'hashing in {label}: {args.logins / elapsed:.1f} logins/s')
+        report('  login', login_times)
+        report('  contact reads meanwhile', read_times)
+
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+CSV import parsing benchmark: rows per second parsing and validating (Contact.import_row) a generated
+N-row CSV file, serially as an import thread does with utils.iter_csv, and through ParallelCSVReader with
+1, 2, 4 and 8 pool processes.
+
+    python benchmarks/parse_csv.py [--rows 1000000] [--workers 1 2 4 8] [--chunk-mb 16] [--file contacts.csv]
+
+This is the work taken off the import thread; inserting is not timed, upsert_import.py and run.py cover
+the database side. For the multi-GB case use --rows 10000000 (about 1.3 GB on disk). --file keeps the
+generated file for reuse.
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.datastructures import FileStorage  # noqa: E402
+
+import seed as seeding  # noqa: E402
+from app import parsing  # noqa: E402
+from app.models import IMPORT_FIELDS, Contact  # noqa: E402
+from app.utils import iter_csv  # noqa: E402
+
+
+def write_csv(path, rows, seed=0):
+    """Write a CSV of fake contacts. Some comments hold quotes and line breaks, as exported notes do."""
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, IMPORT_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for index in range(rows):
+            contact = seeding.fake_contact(rng, 0, index)
+            if rng.random() < 0.05:
+                contact['comment'] = 'Met at "the conference",\nfollow up in spring'
+            writer.writerow(contact)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--chunk-mb', type=int, default=16, help='bytes parsed per pool task, in MB')
+    parser.add_argument('--file', help='CSV file to use, generated if missing')
+    args = parser.parse_args()
+
+    path = args.file or tempfile.mkstemp(suffix='.csv')[1]
+    if not args.file or not os.path.exists(path):
+        write_csv(path, args.rows)
+    size_mb = os.path.getsize(path) / 1024 / 1024
+
+    def validate(rows):
+        """Rows read and checked, as Contact.bulk_import does before inserting."""
+        count = 0
+        for row in rows:
+            count += 1
+            try:
+                Contact.import_row(row, 0)
+            except ValueError:
+                pass
+        return count
+
+    def serial():
+        with open(path, 'rb') as stream:
+            return validate(iter_csv(FileStorage(stream=stream, filename=path)))
+
+    def pooled(workers):
+        count = validate(parsing.ParallelCSVReader(path, workers, args.chunk_mb * 1024 * 1024))
+        # Each worker count gets a pool of its own size
+        parsing._pool.shutdown()
+        parsing._pool = None
+        return count
+
+    print(f'{size_mb:.0f} MB, {os.cpu_count()} CPUs')
+    print(f'{"reader":<12}{"rows":>12}{"seconds":>10}{"rows/s":>12}{"MB/s":>8}')
+    for name, run in [('serial', serial)] + [(f'{n} workers', lambda n=n: pooled(n)) for n in args.workers]:
+        start = time.perf_counter()
+        count = run()
+        elapsed = time.perf_counter() - start
+        print(f'{name:<12}{count:>12}{elapsed:>10.2f}{count / elapsed:>12.0f}{size_mb / elapsed:>8.0f}')
+    if not args.file:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+"""
+Scenario benchmarks through the Flask test client, against a fresh SQLite database or a local Postgres.
+
+    python benchmarks/run.py [--database-url postgresql://localhost/address_book_bench]
+                             [--users 3] [--contacts 5000] [--tags 40] [--hierarchy-size 200] [--iterations 50]
+                             [--scenario list_contacts ...] [--output results.json]
+
+The database is seeded with benchmarks/seed.py data first (a --database-url database is reset,
+so never point it at real data). For each scenario it reports throughput, latency percentiles,
+SQL queries per request and peak Python memory; --output writes the same as JSON (see compare.py),
+together with the app's startup import time (see startup.py). For search latency at scale, run the
+search scenario on a million contacts: --users 1 --contacts 1000000 --scenario search.
+"""
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+import seed as seeding  # noqa: E402
+import startup  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+
+def scenarios(ctx):
+    """(name, request) pairs; each request function builds a fresh request from the shared random generator."""
+    rng = ctx['rng']
+
+    def list_contacts(client):
+        after = rng.choice(ctx['contact_ids'])
+        return client.get(f'/api/contacts?limit=100&after={after}')
+
+    def filter_contacts(client):
+        return client.get(f"/api/contacts/filter?tags={rng.choice(ctx['root_tag_ids'])}&descendants=1&limit=100")
+
+    def filter_deep_tags(client):
+        # Descendants of a tag chain --hierarchy-size deep: one recursion step per level
+        return client.get(f"/api/contacts/filter?tags={ctx['chain_root_id']}&descendants=1&limit=100")
+
+    def filter_wide_tags(client):
+        # Descendants of a tag with --hierarchy-size children
+        return client.get(f"/api/contacts/filter?tags={ctx['fan_root_id']}&descendants=1&limit=100")
+
+    def search(client):
+        # Whole, prefix, misspelled and two-word queries, so exact, prefix and fuzzy matching are all ranked
+        first, last = rng.choice(seeding.FIRST_NAMES), rng.choice(seeding.LAST_NAMES)
+        q = rng.choice([last, last[:3], last[:-1] + 'x', f'{first} {last}'])
+        return client.get('/api/contacts/search', query_string={'q': q, 'limit': 20})
+
+    def most_common_tags(client):
+        return client.get('/contacts/most_common_tag')
+
+    def same_lastnames(client):
+        return client.get('/contacts/same_lastnames')
+
+    def import_contacts(client):
+        rows = [seeding.fake_contact(rng, 0, index) for index in range(ctx['import_rows'])]
+        data = io.StringIO()
+        data.write('first_name,last_name,company_name,email,phone\n')
+        for row in rows:
+            data.write(f"{row['first_name']},{row['last_name']},{row['company_name'] or ''},{row['email']},{row['phone']}\n")
+        upload = (io.BytesIO(data.getvalue().encode()), 'contacts.csv')
+        return client.post('/api/contacts/import', data={'file': upload}, content_type='multipart/form-data')
+
+    def edit_contact(client):
+        contact_id = rng.choice(ctx['contact_ids'])
+        tags = rng.sample(ctx['tag_ids'], k=min(3, len(ctx['tag_ids'])))
+        return client.put(f'/api/contacts/{contact_id}',
+                          json={'company_name': rng.choice(seeding.COMPANIES), 'tags': tags})
+
+    def updates(count):
+        return [{'id': contact_id, 'data': {'company_name': rng.choice(seeding.COMPANIES)}}
+                for contact_id in rng.sample(ctx['contact_ids'], k=count)]
+
+    # update_batch and update_singly apply the same --batch-ops updates per iteration, so their
+    # req/s times --batch-ops compares operations per second
+    def update_batch(client):
+        operations = [dict(update, op='update') for update in updates(ctx['batch_ops'])]
+        return client.post('/api/contacts/batch', json={'operations': operations})
+
+    def update_singly(client):
+        for update in updates(ctx['batch_ops']):
+            response = client.put(f"/api/contacts/{update['id']}", json=update['data'])
+            if response.status_code >= 400:
+                break
+        return response
+
+    return [
+        ('list_contacts', list_contacts),
+        ('filter_contacts', filter_contacts),
+        ('filter_deep_tags', filter_deep_tags),
+        ('filter_wide_tags', filter_wide_tags),
+        ('search', search),
+        ('most_common_tags', most_common_tags),
+        ('same_lastnames', same_lastnames),
+        ('import_contacts', import_contacts),
+        ('edit_contact', edit_contact),
+        ('update_batch', update_batch),
+        ('update_singly', update_singly),
+    ]
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def measure(client, name, request, iterations, queries):
+    latencies, query_counts = [], []
+    for _ in range(iterations):
+        queries.clear()
+        start = time.perf_counter()
+        response = request(client)
+        latencies.append(time.perf_counter() - start)
+        query_counts.append(len(queries))
+        if response.status_code >= 400:
+            raise RuntimeError(f'{name} failed with {response.status_code}: {response.get_data(as_text=True)[:200]}')
+
+    # Peak memory comes from one extra, separate run so tracing doesn't distort the timings
+    gc.collect()
+    tracemalloc.start()
+    request(client)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total = sum(latencies)
+    return {
+        "iterations": iterations,
+        "requests_per_second": round(iterations / total, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(total / iterations * 1000, 3),
+        "queries_per_request": round(sum(query_counts) / iterations, 2),
+        "peak_memory_kb": round(peak / 1024, 1),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--users', type=int, default=3)
+    parser.add_argument('--contacts', type=int, default=5000, help='contacts per user')
+    parser.add_argument('--tags', type=int, default=40, help='tags per user')
+    parser.add_argument('--hierarchy-size', type=int, default=200,
+                        help='depth of the tag chain and width of the tag fan-out used by filter_deep/wide_tags')
+    parser.add_argument('--import-rows', type=int, default=500, help='rows per import_contacts request')
+    parser.add_argument('--batch-ops', type=int, default=100,
+                        help='contact updates per update_batch/update_singly iteration')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--scenario', action='append', help='run only these scenarios (repeatable)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    path = None
+    if args.database_url:
+        database_url = args.database_url
+    else:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        database_url = 'sqlite:///' + path
+    config.Config.SQLALCHEMY_DATABASE_URI = database_url
+    config.Config.IMPORT_WORKERS = 0  # Imports run inside the request, so their cost is measured
+    config.Config.RESPONSE_CACHE_SIZE = 0
+    config.Config.METRICS_ENABLED = False
+
+    from app import create_app, db
+    from app.models import Contact, Tag
+
+    app = create_app()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        started = time.perf_counter()
+        user_ids = seeding.seed(args.users, args.contacts, args.tags, args.seed)
+        seed_seconds = time.perf_counter() - started
+        user_id = user_ids[0]
+        ctx = {
+            'rng': random.Random(args.seed),
+            'import_rows': args.import_rows,
+            'batch_ops': args.batch_ops,
+            'contact_ids': db.session.scalars(db.select(Contact.id).filter_by(user_id=user_id)).all(),
+            'tag_ids': db.session.scalars(db.select(Tag.id).filter_by(user_id=user_id)).all(),
+            'root_tag_ids': db.session.scalars(db.select(Tag.id).filter_by(user_id=user_id, parent_id=None)).all(),
+        }
+        # Added after the ids above are read, so the other scenarios keep the regular tags
+        ctx['chain_root_id'], ctx['fan_root_id'] = seeding.seed_tag_hierarchies(user_id, args.hierarchy_size, args.seed)
+        dialect = db.engine.dialect.name
+        engine = db.engine
+
+    queries = []
+    event.listen(engine, 'before_cursor_execute', lambda *_: queries.append(1))
+    client = app.test_client()
+    client.post('/api/login', json={'email': 'bench0@example.com', 'password': seeding.PASSWORD})
+
+    results = {}
+    print(f'{"scenario":<20}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"queries":>10}{"peak KB":>10}')
+    for name, request in scenarios(ctx):
+        if args.scenario and name not in args.scenario:
+            continue
+        request(client)  # warm up
+        result = measure(client, name, request, args.iterations, queries)
+        results[name] = result
+        print(f'{name:<20}{result["requests_per_second"]:>10}{result["p50_ms"]:>10}{result["p95_ms"]:>10}'
+              f'{result["p99_ms"]:>10}{result["queries_per_request"]:>10}{result["peak_memory_kb"]:>10}')
+
+    if args.output:
+        report = {
+            "meta": {
+                "commit": git_commit(),
+                "date": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                "python": platform.python_version(),
+                "database": dialect,
+                "users": args.users,
+                "contacts_per_user": args.contacts,
+                "tags_per_user": args.tags,
+                "hierarchy_size": args.hierarchy_size,
+                "import_rows": args.import_rows,
+                "batch_ops": args.batch_ops,
+                "iterations": args.iterations,
+                "seed": args.seed,
+                "seed_seconds": round(seed_seconds, 2),
+            },
+            "scenarios": results,
+            "startup": startup.measure_startup(),
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+    if path:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+Synthetic data generator: N users x M contacts x K hierarchical tags per user, with skewed
+(Zipf-like) last names, companies and tag usage so that grouping and filtering behave realistically.
+
+    python benchmarks/seed.py --database-url postgresql://... [--users 10] [--contacts 10000] [--tags 50] [--reset]
+
+Every user's password is 'bench123'; users are bench0@example.com, bench1@example.com, ...
+The same --seed always produces the same data.
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PASSWORD = 'bench123'
+FIRST_NAMES = ['James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda', 'William', 'Elizabeth',
+               'David', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Charles', 'Karen',
+               'Ivan', 'Maria', 'Georgi', 'Elena', 'Dimitar', 'Yana', 'Nikolay', 'Petya', 'Stefan', 'Desislava']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+              'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin',
+              'Ivanov', 'Petrov', 'Georgiev', 'Dimitrov', 'Nikolov', 'Todorov', 'Stoyanov', 'Kolev', 'Angelov', 'Popov']
+COMPANIES = ['Acme', 'Globex', 'Initech', 'Umbrella', 'Hooli', 'Stark Industries', 'Wayne Enterprises', 'Tyrell',
+             'Cyberdyne', 'Soylent', None, None, None]
+TAG_WORDS = ['family', 'friends', 'work', 'clients', 'suppliers', 'school', 'sports', 'neighbours', 'vip', 'travel']
+
+
+def zipf_weights(n, s=1.1):
+    return [1 / (rank ** s) for rank in range(1, n + 1)]
+
+
+def fake_contact(rng, user_id, index):
+    first_name = rng.choices(FIRST_NAMES, zipf_weights(len(FIRST_NAMES), 0.8))[0]
+    last_name = rng.choices(LAST_NAMES, zipf_weights(len(LAST_NAMES)))[0]
+    return {
+        "first_name": first_name,
+        "last_name": last_name,
+        "company_name": rng.choice(COMPANIES),
+        "address": f"{rng.randint(1, 300)} Main Street",
+        "phone": f"+1555{rng.randint(0, 9999999):07d}",
+        "email": f"{first_name.lower()}.{last_name.lower()}{index}@example.com",
+        "fax": None,
+        "mobile": f"+1666{rng.randint(0, 9999999):07d}" if rng.random() < 0.5 else None,
+        "comment": rng.choice([None, None, "Met at a conference", "Old friend", "Call back next week"]),
+        "user_id": user_id,
+    }
+
+
+def fake_tags(rng, user_id, count):
+    """Tags forming a forest: each tag's parent is an earlier tag (about two thirds of the time), depth <= 4."""
+    tags, depth = [], {}
+    for index in range(count):
+        parents = [i for i in range(index) if depth[i] < 3]
+        parent = rng.choice(parents) if parents and rng.random() < 0.66 else None
+        depth[index] = depth[parent] + 1 if parent is not None else 0
+        tags.append({"name": f"u{user_id}-{rng.choice(TAG_WORDS)}-{index}", "color": "#FFFFFF",
+                     "parent_index": parent, "user_id": user_id})
+    return tags
+
+
+def seed(users=10, contacts=10000, tags=50, seed=0, batch_size=5000):
+    """Insert the synthetic data into the current app's database. Returns the created user ids."""
+    from sqlalchemy import insert, update
+
+    from app import db
+    from app.models import Contact, ContactTag, Tag, User
+    from app.passwords import hash_password
+
+    rng = random.Random(seed)
+    password = hash_password(PASSWORD)
+    user_ids = []
+    for user_index in range(users):
+        user = User(username=f'bench{user_index}', email=f'bench{user_index}@example.com', password=password)
+        db.session.add(user)
+        db.session.flush()
+        user_ids.append(user.id)
+
+        tag_ids = []
+        for tag in fake_tags(rng, user.id, tags):
+            parent_index = tag.pop('parent_index')
+            tag_id = db.session.execute(insert(Tag).returning(Tag.id), tag).scalar_one()
+            if parent_index is not None:
+                db.session.execute(update(Tag).where(Tag.id == tag_id).values(parent_id=tag_ids[parent_index]))
+            tag_ids.append(tag_id)
+        tag_weights = zipf_weights(len(tag_ids)) if tag_ids else []
+
+        for start in range(0, contacts, batch_size):
+            rows = [fake_contact(rng, user.id, index) for index in range(start, min(start + batch_size, contacts))]
+            contact_ids = db.session.scalars(
+                insert(Contact).returning(Contact.id, sort_by_parameter_order=True), rows
+            ).all()
+            pairs = set()
+            for contact_id in contact_ids:
+                count = rng.choices([0, 1, 2, 3, 5], [30, 35, 20, 10, 5])[0] if tag_ids else 0
+                pairs.update((contact_id, tag_id) for tag_id in rng.choices(tag_ids, tag_weights, k=count))
+            if pairs:
+                db.session.execute(insert(ContactTag), [{"contact_id": c, "tag_id": t} for c, t in pairs])
+        db.session.commit()
+    return user_ids
+
+
+def seed_tag_hierarchies(user_id, size=200, seed=0):
+    """
+    Add two extreme tag hierarchies to a seeded user: a chain `size` tags deep and one root with `size`
+    children, each tag on a few of the user's contacts. Returns (chain root id, fan-out root id).
+    """
+    from sqlalchemy import insert
+
+    from app import db
+    from app.models import Contact, ContactTag, Tag
+
+    rng = random.Random(seed)
+    contact_ids = db.session.scalars(db.select(Contact.id).filter_by(user_id=user_id)).all()
+
+    def add_tag(name, parent_id):
+        return db.session.execute(insert(Tag).returning(Tag.id), {
+            "name": f"u{user_id}-{name}", "color": "#FFFFFF", "parent_id": parent_id, "user_id": user_id,
+        }).scalar_one()
+
+    chain = [add_tag('chain-0', None)]
+    for depth in range(1, size):
+        chain.append(add_tag(f'chain-{depth}', chain[-1]))
+    fan_root = add_tag('fan', None)
+    fan = [add_tag(f'fan-{index}', fan_root) for index in range(size)]
+
+    pairs = {(contact_id, tag_id) for tag_id in chain + fan
+             for contact_id in rng.sample(contact_ids, k=min(5, len(contact_ids)))}
+    if pairs:
+        db.session.execute(insert(ContactTag), [{"contact_id": c, "tag_id": t} for c, t in pairs])
+    db.session.commit()
+    return chain[0], fan_root
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--contacts', type=int, default=10000, help='contacts per user')
+    parser.add_argument('--tags', type=int, default=50, help='tags per user')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--reset', action='store_true', help='drop and recreate all tables first')
+    args = parser.parse_args()
+
+    import config
+    config.Config.SQLALCHEMY_DATABASE_URI = args.database_url
+    from app import create_app, db
+
+    app = create_app()
+    with app.app_context():
+        if args.reset:
+            db.drop_all()
+        db.create_all()
+        user_ids = seed(args.users, args.contacts, args.tags, args.seed)
+    print(f'Seeded users {user_ids[0]}..{user_ids[-1]} with {args.contacts} contacts and {args.tags} tags each.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+App startup benchmark: imports and creates the app in fresh interpreters under `python -X importtime`
+and reports the import time, the slowest top-level packages, and whether heavy optional backends
+(pandas, numpy, openpyxl) were loaded at startup.
+
+    python benchmarks/startup.py [--runs 5] [--top 10] [--max-ms 1500]
+
+Exits with status 1 if a heavy backend is imported at startup or the median exceeds --max-ms, so it can
+guard CI. benchmarks/run.py includes the same measurement in its JSON results.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Only needed by Excel imports and exports, which load them on first use
+HEAVY_MODULES = ('pandas', 'numpy', 'openpyxl')
+STARTUP = "import config; from app import create_app; create_app('testing')"
+LINE = re.compile(r'import time:\s+(\d+) \|\s+\d+ \| *(\S+)')
+
+
+def measure_once():
+    """Import time of one startup, per top-level package: {package: microseconds spent in its own modules}."""
+    env = dict(os.environ, TEST_DATABASE_URL='sqlite://')
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', STARTUP], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stderr
+    packages = Counter()
+    # Self times, unlike cumulative ones, do not count nested imports twice
+    for self_us, module in LINE.findall(output):
+        packages[module.split('.')[0]] += int(self_us)
+    return packages
+
+
+def measure_startup(runs=5, top=10):
+    """Median startup import time over several runs, with the slowest packages and any heavy backends loaded."""
+    samples = [measure_once() for _ in range(runs)]
+    packages = samples[-1]
+    return {
+        "runs": runs,
+        "import_ms": round(statistics.median(sum(sample.values()) for sample in samples) / 1000, 1),
+        "slowest": [{"package": name, "ms": round(us / 1000, 1)} for name, us in packages.most_common(top)],
+        "heavy_modules": [name for name in HEAVY_MODULES if name in packages],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--max-ms', type=float, help='fail if the median import time is higher')
+    args = parser.parse_args()
+
+    result = measure_startup(args.runs, args.top)
+    print(f'startup imports: {result["import_ms"]} ms (median of {args.runs})')
+    for entry in result["slowest"]:
+        print(f'  {entry["package"]:<24}{entry["ms"]:>10} ms')
+
+    failed = False
+    if result["heavy_modules"]:
+        print(f'heavy modules imported at startup: {", ".join(result["heavy_modules"])}')
+        failed = True
+    if args.max_ms is not None and result["import_ms"] > args.max_ms:
+        print(f'import time above the {args.max_ms} ms budget')
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
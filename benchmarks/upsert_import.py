@@ -0,0 +1,76 @@
+"""
+Upsert import benchmark: a first import of N rows merged on email, an unchanged re-sync, and a re-sync
+where a share of the rows changed, reporting rows per second and the inserted/updated/skipped counts.
+
+    python benchmarks/upsert_import.py [--database-url postgresql://localhost/address_book_bench]
+                                       [--rows 100000] [--changed 0.1] [--batch-size 1000] [--staged]
+
+--staged merges through the PostgreSQL staging table instead of batches. The database is reset
+first, so never point --database-url at real data.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+import seed as seeding  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--changed', type=float, default=0.1, help='share of rows changed before the last re-sync')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--staged', action='store_true', help='PostgreSQL only')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    path = None
+    if args.database_url:
+        database_url = args.database_url
+    else:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        database_url = 'sqlite:///' + path
+    config.Config.SQLALCHEMY_DATABASE_URI = database_url
+    config.Config.PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'  # Seeding speed only; logins are not measured
+
+    from app import create_app, db
+    from app.upsert import bulk_upsert, claim_existing, staged_upsert
+
+    rng = random.Random(args.seed)
+    rows = [seeding.fake_contact(rng, 0, index) for index in range(args.rows)]
+    for row in rows:
+        del row['user_id']
+    changed = [dict(row, company_name=rng.choice(seeding.COMPANIES[:-3]), comment='Updated by the CRM')
+               if rng.random() < args.changed else row for row in rows]
+
+    app = create_app()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user_id, = seeding.seed(1, 0, 0, args.seed)
+
+        print(f'{"run":<12}{"seconds":>10}{"rows/s":>10}{"inserted":>10}{"updated":>10}{"skipped":>10}')
+        for name, data in (('first', rows), ('unchanged', rows), ('changed', changed)):
+            start = time.perf_counter()
+            claim_existing(user_id, 'email')
+            if args.staged:
+                result = staged_upsert(iter(data), user_id, 'email')
+            else:
+                result = bulk_upsert(iter(data), user_id, 'email', batch_size=args.batch_size)
+            elapsed = time.perf_counter() - start
+            print(f'{name:<12}{elapsed:>10.2f}{len(data) / elapsed:>10.0f}{result["imported"]:>10}'
+                  f'{result["updated"]:>10}{result["skipped"]:>10}')
+    if path:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
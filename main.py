@@ -1,8 +1,7 @@
-from app import create_app, db
+from app import create_app
 
 app = create_app()
 
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
-    app.run(debug=True)
+    # Development server only (debug comes from DevelopmentConfig); use wsgi.py in production
+    app.run()
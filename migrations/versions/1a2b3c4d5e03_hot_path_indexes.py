@@ -0,0 +1,36 @@
+"""Indexes for per-user contact lists, keyset paging, name lookups and tag filters
+
+Revision ID: 1a2b3c4d5e03
+Revises: 1a2b3c4d5e02
+Create Date: 2026-10-18 09:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1a2b3c4d5e03'
+down_revision = '1a2b3c4d5e02'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_contact_user_id_id', 'contact', ['user_id', 'id'])
+    op.create_index('ix_contact_user_id_last_name_first_name', 'contact', ['user_id', 'last_name', 'first_name'])
+    op.create_index('ix_contact_user_id_first_name', 'contact', ['user_id', 'first_name'])
+    op.create_index('ix_tag_user_id', 'tag', ['user_id'])
+    op.create_index('ix_tag_parent_id', 'tag', ['parent_id'])
+    op.create_index('ix_contact_tag_tag_id_contact_id', 'contact_tag', ['tag_id', 'contact_id'])
+    op.create_index('ix_import_job_user_id', 'import_job', ['user_id'])
+
+
+def downgrade():
+    op.drop_index('ix_import_job_user_id', table_name='import_job')
+    op.drop_index('ix_contact_tag_tag_id_contact_id', table_name='contact_tag')
+    op.drop_index('ix_tag_parent_id', table_name='tag')
+    op.drop_index('ix_tag_user_id', table_name='tag')
+    op.drop_index('ix_contact_user_id_first_name', table_name='contact')
+    op.drop_index('ix_contact_user_id_last_name_first_name', table_name='contact')
+    op.drop_index('ix_contact_user_id_id', table_name='contact')
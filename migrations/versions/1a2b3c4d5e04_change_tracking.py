@@ -0,0 +1,54 @@
+"""Change tracking: per-user change counter, contact/tag versions and tombstones
+
+Revision ID: 1a2b3c4d5e04
+Revises: 1a2b3c4d5e03
+Create Date: 2026-10-18 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1a2b3c4d5e04'
+down_revision = '1a2b3c4d5e03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.add_column(sa.Column('change_counter', sa.Integer(), server_default='0', nullable=False))
+    for table in ('contact', 'tag'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('created_at', sa.DateTime(), nullable=True))
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+            batch_op.add_column(sa.Column('version', sa.Integer(), server_default='0', nullable=False))
+    op.create_index('ix_contact_user_id_version', 'contact', ['user_id', 'version'])
+    op.create_index('ix_tag_user_id_version', 'tag', ['user_id', 'version'])
+
+    op.create_table('tombstone',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=20), nullable=False),
+        sa.Column('object_id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_tombstone_user_id_version', 'tombstone', ['user_id', 'version'])
+
+
+def downgrade():
+    op.drop_index('ix_tombstone_user_id_version', table_name='tombstone')
+    op.drop_table('tombstone')
+    op.drop_index('ix_tag_user_id_version', table_name='tag')
+    op.drop_index('ix_contact_user_id_version', table_name='contact')
+    for table in ('tag', 'contact'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('version')
+            batch_op.drop_column('updated_at')
+            batch_op.drop_column('created_at')
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.drop_column('change_counter')
@@ -0,0 +1,143 @@
+"""Tag usage, contact tag and per-user contact counters maintained by triggers
+
+Revision ID: 1a2b3c4d5e05
+Revises: 1a2b3c4d5e04
+Create Date: 2026-10-18 09:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1a2b3c4d5e05'
+down_revision = '1a2b3c4d5e04'
+branch_labels = None
+depends_on = None
+
+# Must stay identical to app.models.COUNTER_TRIGGERS
+COUNTER_TRIGGERS = {
+    'postgresql': [
+        """
+        CREATE OR REPLACE FUNCTION contact_tag_counts() RETURNS trigger LANGUAGE plpgsql AS $$
+        DECLARE step integer := CASE TG_OP WHEN 'INSERT' THEN 1 ELSE -1 END;
+        BEGIN
+            UPDATE tag SET usage_count = tag.usage_count + step * d.n
+            FROM (SELECT tag_id, count(*) AS n FROM changed_rows GROUP BY tag_id) d WHERE tag.id = d.tag_id;
+            UPDATE contact SET tag_count = contact.tag_count + step * d.n
+            FROM (SELECT contact_id, count(*) AS n FROM changed_rows GROUP BY contact_id) d WHERE contact.id = d.contact_id;
+            RETURN NULL;
+        END $$
+        """,
+        "CREATE TRIGGER contact_tag_insert_counts AFTER INSERT ON contact_tag "
+        "REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION contact_tag_counts()",
+        "CREATE TRIGGER contact_tag_delete_counts AFTER DELETE ON contact_tag "
+        "REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION contact_tag_counts()",
+        """
+        CREATE OR REPLACE FUNCTION contact_counts() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                UPDATE "user" SET contact_count = "user".contact_count + d.n,
+                                  untagged_count = "user".untagged_count + d.untagged
+                FROM (SELECT user_id, count(*) AS n, count(*) FILTER (WHERE tag_count = 0) AS untagged
+                      FROM new_rows GROUP BY user_id) d
+                WHERE "user".id = d.user_id;
+            ELSIF TG_OP = 'DELETE' THEN
+                UPDATE "user" SET contact_count = "user".contact_count - d.n,
+                                  untagged_count = "user".untagged_count - d.untagged
+                FROM (SELECT user_id, count(*) AS n, count(*) FILTER (WHERE tag_count = 0) AS untagged
+                      FROM old_rows GROUP BY user_id) d
+                WHERE "user".id = d.user_id;
+            ELSE
+                UPDATE "user" SET untagged_count = "user".untagged_count + d.delta
+                FROM (SELECT n.user_id, sum((n.tag_count = 0)::int - (o.tag_count = 0)::int) AS delta
+                      FROM old_rows o JOIN new_rows n ON n.id = o.id GROUP BY n.user_id) d
+                WHERE "user".id = d.user_id AND d.delta <> 0;
+            END IF;
+            RETURN NULL;
+        END $$
+        """,
+        "CREATE TRIGGER contact_insert_counts AFTER INSERT ON contact "
+        "REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION contact_counts()",
+        "CREATE TRIGGER contact_update_counts AFTER UPDATE ON contact "
+        "REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION contact_counts()",
+        "CREATE TRIGGER contact_delete_counts AFTER DELETE ON contact "
+        "REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION contact_counts()",
+    ],
+    'sqlite': [
+        """
+        CREATE TRIGGER contact_tag_insert_counts AFTER INSERT ON contact_tag BEGIN
+            UPDATE tag SET usage_count = usage_count + 1 WHERE id = NEW.tag_id;
+            UPDATE contact SET tag_count = tag_count + 1 WHERE id = NEW.contact_id;
+        END
+        """,
+        """
+        CREATE TRIGGER contact_tag_delete_counts AFTER DELETE ON contact_tag BEGIN
+            UPDATE tag SET usage_count = usage_count - 1 WHERE id = OLD.tag_id;
+            UPDATE contact SET tag_count = tag_count - 1 WHERE id = OLD.contact_id;
+        END
+        """,
+        """
+        CREATE TRIGGER contact_insert_counts AFTER INSERT ON contact BEGIN
+            UPDATE "user" SET contact_count = contact_count + 1, untagged_count = untagged_count + (NEW.tag_count = 0)
+            WHERE id = NEW.user_id;
+        END
+        """,
+        """
+        CREATE TRIGGER contact_update_counts AFTER UPDATE OF tag_count ON contact
+        WHEN (OLD.tag_count = 0) <> (NEW.tag_count = 0) BEGIN
+            UPDATE "user" SET untagged_count = untagged_count + (NEW.tag_count = 0) - (OLD.tag_count = 0)
+            WHERE id = NEW.user_id;
+        END
+        """,
+        """
+        CREATE TRIGGER contact_delete_counts AFTER DELETE ON contact BEGIN
+            UPDATE "user" SET contact_count = contact_count - 1, untagged_count = untagged_count - (OLD.tag_count = 0)
+            WHERE id = OLD.user_id;
+        END
+        """,
+    ],
+}
+
+TRIGGERS = {
+    'contact_tag': ('contact_tag_insert_counts', 'contact_tag_delete_counts'),
+    'contact': ('contact_insert_counts', 'contact_update_counts', 'contact_delete_counts'),
+}
+
+
+def upgrade():
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.add_column(sa.Column('contact_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('untagged_count', sa.Integer(), server_default='0', nullable=False))
+    with op.batch_alter_table('contact') as batch_op:
+        batch_op.add_column(sa.Column('tag_count', sa.Integer(), server_default='0', nullable=False))
+    with op.batch_alter_table('tag') as batch_op:
+        batch_op.add_column(sa.Column('usage_count', sa.Integer(), server_default='0', nullable=False))
+
+    op.execute('UPDATE tag SET usage_count = (SELECT count(*) FROM contact_tag WHERE contact_tag.tag_id = tag.id)')
+    op.execute('UPDATE contact SET tag_count = (SELECT count(*) FROM contact_tag WHERE contact_tag.contact_id = contact.id)')
+    op.execute('UPDATE "user" SET '
+               'contact_count = (SELECT count(*) FROM contact WHERE contact.user_id = "user".id), '
+               'untagged_count = (SELECT count(*) FROM contact WHERE contact.user_id = "user".id AND contact.tag_count = 0)')
+
+    for statement in COUNTER_TRIGGERS.get(op.get_bind().dialect.name, []):
+        op.execute(statement)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect in COUNTER_TRIGGERS:
+        for table, triggers in TRIGGERS.items():
+            for trigger in triggers:
+                op.execute(f'DROP TRIGGER IF EXISTS {trigger}' + (f' ON {table}' if dialect == 'postgresql' else ''))
+    if dialect == 'postgresql':
+        op.execute('DROP FUNCTION IF EXISTS contact_counts()')
+        op.execute('DROP FUNCTION IF EXISTS contact_tag_counts()')
+
+    with op.batch_alter_table('tag') as batch_op:
+        batch_op.drop_column('usage_count')
+    with op.batch_alter_table('contact') as batch_op:
+        batch_op.drop_column('tag_count')
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.drop_column('untagged_count')
+        batch_op.drop_column('contact_count')
@@ -0,0 +1,63 @@
+"""Queryable custom fields: JSONB with a GIN index on PostgreSQL, a trigger-maintained contact_field table elsewhere
+
+Revision ID: 1a2b3c4d5e06
+Revises: 1a2b3c4d5e05
+Create Date: 2026-10-18 11:20:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '1a2b3c4d5e06'
+down_revision = '1a2b3c4d5e05'
+branch_labels = None
+depends_on = None
+
+# Must stay identical to app.models.CUSTOM_FIELD_ROWS and app.models.CUSTOM_FIELD_INDEX
+CUSTOM_FIELD_ROWS = """
+    INSERT INTO contact_field (contact_id, key, value)
+    SELECT NEW.id, key, CASE type WHEN 'true' THEN 'true' WHEN 'false' THEN 'false' ELSE CAST(value AS TEXT) END
+    FROM json_each(NEW.custom_fields) WHERE type NOT IN ('object', 'array', 'null');
+"""
+CUSTOM_FIELD_INDEX = {
+    'sqlite': [
+        "CREATE TABLE contact_field (contact_id INTEGER NOT NULL, key VARCHAR(100) NOT NULL, value TEXT, "
+        "PRIMARY KEY (contact_id, key))",
+        "CREATE INDEX ix_contact_field_key_value ON contact_field (key, value)",
+        f"CREATE TRIGGER contact_field_insert AFTER INSERT ON contact BEGIN {CUSTOM_FIELD_ROWS} END",
+        "CREATE TRIGGER contact_field_update AFTER UPDATE OF custom_fields ON contact BEGIN "
+        f"DELETE FROM contact_field WHERE contact_id = NEW.id; {CUSTOM_FIELD_ROWS} END",
+        "CREATE TRIGGER contact_field_delete AFTER DELETE ON contact BEGIN "
+        "DELETE FROM contact_field WHERE contact_id = OLD.id; END",
+    ],
+}
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('ALTER TABLE contact ALTER COLUMN custom_fields TYPE jsonb USING custom_fields::jsonb')
+        op.execute('CREATE INDEX ix_contact_custom_fields ON contact USING gin (custom_fields jsonb_path_ops)')
+    for statement in CUSTOM_FIELD_INDEX.get(dialect, []):
+        op.execute(statement)
+    if dialect == 'sqlite':
+        op.execute("""
+            INSERT INTO contact_field (contact_id, key, value)
+            SELECT contact.id, field.key,
+                   CASE field.type WHEN 'true' THEN 'true' WHEN 'false' THEN 'false' ELSE CAST(field.value AS TEXT) END
+            FROM contact, json_each(contact.custom_fields) AS field
+            WHERE json_valid(contact.custom_fields) AND json_type(contact.custom_fields) = 'object'
+              AND field.type NOT IN ('object', 'array', 'null')
+        """)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_contact_custom_fields')
+        op.execute('ALTER TABLE contact ALTER COLUMN custom_fields TYPE json USING custom_fields::json')
+    elif dialect == 'sqlite':
+        for trigger in ('contact_field_insert', 'contact_field_update', 'contact_field_delete'):
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        op.execute('DROP TABLE IF EXISTS contact_field')
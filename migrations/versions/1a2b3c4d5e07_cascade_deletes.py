@@ -0,0 +1,84 @@
+"""ON DELETE CASCADE foreign keys and user.deleted_at for background account purges
+
+Revision ID: 1a2b3c4d5e07
+Revises: 1a2b3c4d5e06
+Create Date: 2026-10-18 12:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1a2b3c4d5e07'
+down_revision = '1a2b3c4d5e06'
+branch_labels = None
+depends_on = None
+
+# (table, column, referred table, ON DELETE action)
+FOREIGN_KEYS = [
+    ('contact', 'user_id', 'user', 'CASCADE'),
+    ('tag', 'user_id', 'user', 'CASCADE'),
+    ('tag', 'parent_id', 'tag', 'SET NULL'),
+    ('contact_tag', 'contact_id', 'contact', 'CASCADE'),
+    ('contact_tag', 'tag_id', 'tag', 'CASCADE'),
+    ('tombstone', 'user_id', 'user', 'CASCADE'),
+    ('import_job', 'user_id', 'user', 'CASCADE'),
+]
+# Names the unnamed SQLite constraints so batch mode can drop them
+NAMING_CONVENTION = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+# Rows the unenforced SQLite foreign keys (or the old delete_account) may have left behind
+ORPHANS = [
+    'DELETE FROM contact WHERE user_id NOT IN (SELECT id FROM "user")',
+    'DELETE FROM tag WHERE user_id NOT IN (SELECT id FROM "user")',
+    'UPDATE tag SET parent_id = NULL WHERE parent_id NOT IN (SELECT id FROM tag)',
+    'DELETE FROM contact_tag WHERE contact_id NOT IN (SELECT id FROM contact) OR tag_id NOT IN (SELECT id FROM tag)',
+    'DELETE FROM tombstone WHERE user_id NOT IN (SELECT id FROM "user")',
+    'DELETE FROM import_job WHERE user_id NOT IN (SELECT id FROM "user")',
+]
+
+
+def _drop_sqlite_triggers():
+    """
+    Recreating a table drops its triggers, and renaming tables fails while other triggers reference a
+    missing one, so SQLite triggers are set aside during the table changes. Returns their SQL.
+    """
+    if op.get_bind().dialect.name != 'sqlite':
+        return []
+    triggers = op.get_bind().execute(sa.text("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'")).all()
+    for name, _ in triggers:
+        op.execute(f'DROP TRIGGER {name}')
+    return [sql for _, sql in triggers]
+
+
+def _replace_foreign_keys(cascade):
+    dialect = op.get_bind().dialect.name
+    for table in dict.fromkeys(table for table, *_ in FOREIGN_KEYS):
+        with op.batch_alter_table(table, naming_convention=NAMING_CONVENTION) as batch_op:
+            for fk_table, column, referred, ondelete in FOREIGN_KEYS:
+                if fk_table != table:
+                    continue
+                name = f'{table}_{column}_fkey' if dialect == 'postgresql' else f'fk_{table}_{column}_{referred}'
+                batch_op.drop_constraint(name, type_='foreignkey')
+                batch_op.create_foreign_key(name, referred, [column], ['id'], ondelete=ondelete if cascade else None)
+
+
+def upgrade():
+    for statement in ORPHANS:
+        op.execute(statement)
+    triggers = _drop_sqlite_triggers()
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.add_column(sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    _replace_foreign_keys(cascade=True)
+    for statement in triggers:
+        op.execute(statement)
+
+
+def downgrade():
+    triggers = _drop_sqlite_triggers()
+    _replace_foreign_keys(cascade=False)
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.drop_column('deleted_at')
+    for statement in triggers:
+        op.execute(statement)
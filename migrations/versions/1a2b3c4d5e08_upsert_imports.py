@@ -0,0 +1,35 @@
+"""Natural-key upsert imports: contact.import_key and per-job updated/skipped counts
+
+Revision ID: 1a2b3c4d5e08
+Revises: 1a2b3c4d5e07
+Create Date: 2026-10-18 14:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1a2b3c4d5e08'
+down_revision = '1a2b3c4d5e07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('contact', sa.Column('import_key', sa.String(length=255), nullable=True))
+    op.create_index('ix_contact_user_id_import_key', 'contact', ['user_id', 'import_key'], unique=True)
+
+    op.add_column('import_job', sa.Column('match_on', sa.String(length=20), nullable=True))
+    op.add_column('import_job', sa.Column('rows_updated', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('import_job', sa.Column('rows_skipped', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    # Plain drops: batch mode would recreate the tables and, on SQLite, lose their triggers
+    op.drop_column('import_job', 'rows_skipped')
+    op.drop_column('import_job', 'rows_updated')
+    op.drop_column('import_job', 'match_on')
+
+    op.drop_index('ix_contact_user_id_import_key', table_name='contact')
+    op.drop_column('contact', 'import_key')
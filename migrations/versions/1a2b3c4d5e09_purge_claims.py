@@ -0,0 +1,25 @@
+"""Claim background account purges: user.purge_heartbeat_at
+
+Revision ID: 1a2b3c4d5e09
+Revises: 1a2b3c4d5e08
+Create Date: 2026-10-18 18:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1a2b3c4d5e09'
+down_revision = '1a2b3c4d5e08'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('user', sa.Column('purge_heartbeat_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    # A plain drop: batch mode would recreate the table and, on SQLite, lose its triggers
+    op.drop_column('user', 'purge_heartbeat_at')
@@ -0,0 +1,72 @@
+import os
+import sys
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db  # noqa: E402
+from app.models import Contact, Tag, User  # noqa: E402
+
+EMAIL = 'alice@example.com'
+PASSWORD = 'secret123'
+
+
+@pytest.fixture
+def app():
+    """The app with TestingConfig, on a fresh database (in-memory SQLite unless TEST_DATABASE_URL is set)."""
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    """A test client logged in as a fresh user."""
+    client = app.test_client()
+    client.post('/api/register', json={'email': EMAIL, 'username': 'alice', 'password': PASSWORD})
+    response = client.post('/api/login', json={'email': EMAIL, 'password': PASSWORD})
+    assert response.status_code == 200
+    return client
+
+
+@pytest.fixture
+def user(client):
+    return db.session.scalar(db.select(User).filter_by(email=EMAIL))
+
+
+def add_contacts(user_id, count, tags=()):
+    """Add count contacts, each tagged with every tag in tags. Returns the contacts."""
+    contacts = [Contact(first_name=f'First{index}', last_name=f'Last{index}', email=f'c{index}@example.com',
+                        user_id=user_id, tags=list(tags))
+                for index in range(count)]
+    db.session.add_all(contacts)
+    db.session.commit()
+    return contacts
+
+
+def add_tags(user_id, names):
+    tags = [Tag(name=name, color='#FFFFFF', user_id=user_id) for name in names]
+    db.session.add_all(tags)
+    db.session.commit()
+    return tags
+
+
+@contextmanager
+def count_queries():
+    """Count the SQL statements executed inside the block: `with count_queries() as queries: ...; queries[0]`."""
+    queries = [0]
+
+    def before_cursor_execute(*args):
+        queries[0] += 1
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield queries
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
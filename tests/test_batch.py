@@ -0,0 +1,14 @@
+from conftest import add_contacts
+
+
+def test_boolean_ids_are_rejected(client, user):
+    add_contacts(user.id, 1)
+
+    response = client.post('/api/contacts/batch', json={'operations': [
+        {'op': 'delete', 'id': True},
+        {'op': 'create', 'data': {'first_name': 'Ann', 'last_name': 'Lee', 'tags': [True]}},
+        {'op': 'update', 'id': 1, 'data': {'company_name': 'Acme'}},
+    ]})
+
+    statuses = [result['status'] for result in response.get_json()['results']]
+    assert statuses == ['error', 'error', 'ok']
@@ -0,0 +1,15 @@
+import logging
+
+from app import cache, create_app
+
+
+def test_redis_url_without_the_package_falls_back_to_process_caches(monkeypatch, caplog):
+    monkeypatch.setattr(cache, 'redis', None)
+    monkeypatch.setattr('config.TestingConfig.CACHE_REDIS_URL', 'redis://localhost:6379/0')
+
+    with caplog.at_level(logging.WARNING):
+        app = create_app('testing')
+
+    assert isinstance(app.extensions['user_cache'], cache.TTLCache)
+    assert isinstance(app.extensions['tag_cache'], cache.TTLCache)
+    assert 'redis package is not installed' in caplog.text
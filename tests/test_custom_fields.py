@@ -0,0 +1,40 @@
+from app import db
+from app.models import Contact, User
+from conftest import add_contacts
+
+
+def change_counter(user_id):
+    return db.session.scalar(db.select(User.change_counter).filter_by(id=user_id))
+
+
+def test_missing_or_foreign_contacts_do_not_bump_the_change_counter(client, user):
+    other = User(username='bob', email='bob@example.com', password='-')
+    db.session.add(other)
+    db.session.commit()
+    foreign, = add_contacts(other.id, 1)
+    before = change_counter(user.id)
+
+    assert client.patch('/api/contacts/999/custom_fields', json={'set': {'a': 1}}).status_code == 404
+    assert client.patch(f'/api/contacts/{foreign.id}/custom_fields', json={'set': {'a': 1}}).status_code == 403
+    assert change_counter(user.id) == before
+
+
+def test_custom_fields_are_set_and_unset(client, user):
+    contact, = add_contacts(user.id, 1)
+    client.patch(f'/api/contacts/{contact.id}/custom_fields', json={'set': {'a': 1, 'b': 'x'}})
+    response = client.patch(f'/api/contacts/{contact.id}/custom_fields', json={'set': {'c': True}, 'unset': ['a']})
+
+    assert response.get_json()['contact']['custom_fields'] == {'b': 'x', 'c': True}
+    assert db.session.get(Contact, contact.id, populate_existing=True).version > 0
+
+
+def test_set_values_replace_whole_top_level_keys(client, user):
+    contact, = add_contacts(user.id, 1)
+    client.patch(f'/api/contacts/{contact.id}/custom_fields',
+                 json={'set': {'address': {'city': 'Oslo', 'zip': '0150'}, 'vip': True, 'note': 'x'}})
+    response = client.patch(f'/api/contacts/{contact.id}/custom_fields',
+                            json={'set': {'address': {'city': 'Bergen', 'po_box': None}, 'note': None}})
+
+    # Like jsonb || on PostgreSQL: no deep merge, and null is stored rather than removing the key
+    assert response.get_json()['contact']['custom_fields'] == {
+        'address': {'city': 'Bergen', 'po_box': None}, 'vip': True, 'note': None}
@@ -0,0 +1,58 @@
+import random
+import string
+
+from app import db
+from app.duplicates import MAX_BLOCK_SIZE, find_duplicates
+from app.models import Contact
+
+
+def add_named(user_id, names):
+    contacts = [Contact(first_name=first, last_name=last, user_id=user_id) for first, last in names]
+    db.session.add_all(contacts)
+    db.session.commit()
+    return [contact.id for contact in contacts]
+
+
+def random_word(rng, prefix):
+    return prefix + ''.join(rng.choice(string.ascii_lowercase) for _ in range(8))
+
+
+def fuzzy_groups(user_id):
+    return [cluster['contact_ids'] for cluster in find_duplicates(user_id, ['fuzzy'])]
+
+
+def test_fuzzy_matches_are_found_in_oversized_blocks(user):
+    rng = random.Random(1)
+    # Every first and last name starts with "Ma", so both prefix blocks are over the limit
+    add_named(user.id, [(random_word(rng, 'Ma'), random_word(rng, 'Ma')) for _ in range(MAX_BLOCK_SIZE + 100)])
+    pair = add_named(user.id, [('Martin', 'Maxwell'), ('Martyn', 'Maxwell')])
+
+    assert pair in fuzzy_groups(user.id)
+
+
+def test_fuzzy_matches_are_found_among_many_identical_first_names(user):
+    rng = random.Random(2)
+    add_named(user.id, [('Maria', random_word(rng, 'Ko')) for _ in range(MAX_BLOCK_SIZE + 100)])
+    pair = add_named(user.id, [('Maria', 'Kovalenko'), ('Maria', 'Kovalenco')])
+
+    assert pair in fuzzy_groups(user.id)
+
+
+def test_duplicates_limit_is_validated(client):
+    assert client.get('/api/contacts/duplicates?limit=0').status_code == 400
+    assert client.get('/api/contacts/duplicates?limit=100000').status_code == 400
+    assert client.get('/api/contacts/duplicates?limit=5').status_code == 200
+
+
+def test_merge_ids_are_validated(client, user):
+    primary, duplicate = add_named(user.id, [('Ann', 'Lee'), ('Ann', 'Lee')])
+
+    for payload in [{'primary_id': primary, 'duplicate_ids': [[duplicate]]},
+                    {'primary_id': primary, 'duplicate_ids': str(duplicate)},
+                    {'primary_id': primary, 'duplicate_ids': duplicate},
+                    {'primary_id': primary, 'duplicate_ids': [True]},
+                    {'primary_id': True, 'duplicate_ids': [duplicate]},
+                    [primary, duplicate]]:
+        assert client.post('/api/contacts/merge', json=payload).status_code == 400, payload
+
+    assert client.post('/api/contacts/merge', json={'primary_id': primary, 'duplicate_ids': [duplicate]}).status_code == 200
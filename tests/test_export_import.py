@@ -0,0 +1,54 @@
+"""Every export format can be imported back: the contacts and their tags come back unchanged."""
+import io
+
+import pytest
+from sqlalchemy import delete
+
+from app import db
+from app.models import Contact
+from conftest import add_tags
+
+
+@pytest.fixture
+def contacts(user):
+    family, work, close = add_tags(user.id, ['family', 'work', 'friends, "close"'])
+    db.session.add_all([
+        Contact(first_name='Ann', last_name='Lee', email='ann@example.com', phone='+15550001',
+                user_id=user.id, tags=[family, work]),
+        Contact(first_name='Zoë', last_name="O'Brien", company_name='Acme, Inc.', address='1 "Main" St',
+                comment='Met at the fair,\nsecond line', user_id=user.id, tags=[work, close]),
+        Contact(first_name='Bo', last_name='Chen', mobile='0044 20 7946 0000', user_id=user.id),
+    ])
+    db.session.commit()
+    return user.id
+
+
+def exported(user_id):
+    return [(values, sorted(tags)) for values, tags in Contact.export_rows(user_id)]
+
+
+@pytest.mark.parametrize('format', ['csv', 'jsonl', 'xlsx'])
+def test_export_round_trips_through_import(client, contacts, format):
+    before = exported(contacts)
+    response = client.get(f'/api/contacts/export?format={format}')
+    assert response.status_code == 200
+
+    db.session.execute(delete(Contact).where(Contact.user_id == contacts))
+    db.session.commit()
+
+    upload = (io.BytesIO(response.get_data()), f'contacts.{format}')
+    response = client.post('/api/contacts/import', data={'file': upload}, content_type='multipart/form-data')
+    job = response.get_json()['job']
+    assert (job['status'], job['rows_imported'], job['rows_failed']) == ('done', 3, 0), job
+
+    assert exported(contacts) == before
+
+
+def test_jsonl_is_recognised_by_content_type(client, contacts):
+    body = b'{"first_name": "Ann", "last_name": "Lee", "tags": ["family", "unknown"]}\n\n'
+    upload = (io.BytesIO(body), 'export', 'application/x-ndjson')
+    response = client.post('/api/contacts/import', data={'file': upload}, content_type='multipart/form-data')
+
+    assert response.get_json()['job']['rows_imported'] == 1
+    # Tags the user does not have are ignored
+    assert exported(contacts)[-1][1] == ['family']
@@ -0,0 +1,84 @@
+import io
+import json
+
+import pytest
+from sqlalchemy import func, text
+from werkzeug.datastructures import FileStorage
+
+from app import db
+from app.models import Contact
+from app.utils import iter_json
+from conftest import add_tags
+
+
+@pytest.fixture
+def reject_bad_rows(app):
+    """A trigger that makes the database reject contacts named 'bad', as a constraint would."""
+    if db.engine.dialect.name != 'sqlite':
+        pytest.skip('uses a SQLite trigger')
+    db.session.execute(text("CREATE TRIGGER reject_bad BEFORE INSERT ON contact WHEN NEW.first_name = 'bad' "
+                            "BEGIN SELECT RAISE(ABORT, 'bad row'); END"))
+    db.session.commit()
+
+
+def rows(*first_names):
+    return [{'first_name': name, 'last_name': 'Row'} for name in first_names]
+
+
+def contact_count(user_id):
+    return db.session.scalar(db.select(func.count()).select_from(Contact).filter_by(user_id=user_id))
+
+
+def test_rejected_rows_are_retried_one_by_one(user, reject_bad_rows):
+    result = Contact.bulk_import(rows('a', 'bad', 'b', 'c'), user.id, batch_size=10)
+
+    assert (result['imported'], result['failed']) == (3, 1)
+    assert result['errors'][0]['row'] == 2
+    assert contact_count(user.id) == 3
+
+
+def test_retried_rows_commit_with_the_batch_progress(user, reject_bad_rows):
+    def worker_dies(result):
+        raise RuntimeError('worker killed')
+
+    with pytest.raises(RuntimeError):
+        Contact.bulk_import(rows('a', 'bad', 'b'), user.id, batch_size=10, on_batch=worker_dies)
+    db.session.rollback()
+
+    # Progress was never recorded, so a resumed job starts the batch over: none of it may be kept
+    assert contact_count(user.id) == 0
+
+
+def test_retried_rows_keep_their_tags(user, reject_bad_rows):
+    add_tags(user.id, ['family'])
+    items = [dict(row, tags='family') for row in rows('a', 'bad')]
+
+    Contact.bulk_import(items, user.id, batch_size=10)
+
+    assert [tags for _, tags in Contact.export_rows(user.id)] == [['family']]
+
+
+@pytest.mark.parametrize('chunk_chars', [1, 7, 64 * 1024])
+def test_json_arrays_are_read_item_by_item(chunk_chars):
+    items = [{'first_name': 'Ann', 'phone': 123456789, 'comment': 'a, [b] {"c"}'}, {'nested': [1, {'x': None}]}, 2.5e3]
+    document = ' [\n' + ',\n '.join(json.dumps(item) for item in items) + ' ]\n'
+
+    assert list(iter_json(FileStorage(io.BytesIO(document.encode())), chunk_chars)) == items
+
+
+@pytest.mark.parametrize('document', ['', '{"first_name": "Ann"}', '[{"a": 1} {"b": 2}]', '[{"a": 1}, {"b": '])
+def test_malformed_json_arrays_are_rejected(document):
+    with pytest.raises(ValueError):
+        list(iter_json(FileStorage(io.BytesIO(document.encode())), 4))
+
+
+def test_empty_json_arrays_have_no_items():
+    assert list(iter_json(FileStorage(io.BytesIO(b' [ ] ')))) == []
+
+
+def test_unreadable_workbooks_fail_the_job(client):
+    upload = (io.BytesIO(b'not a workbook'), 'contacts.xls')
+    response = client.post('/api/contacts/import', data={'file': upload}, content_type='multipart/form-data')
+
+    job = response.get_json()['job']
+    assert job['status'] == 'failed' and job['error'], job
@@ -0,0 +1,20 @@
+"""/metrics is opt-in in production and can require a bearer token."""
+import config
+
+
+def test_production_serves_no_metrics_by_default():
+    assert config.Config.METRICS_ENABLED
+    assert not config.ProductionConfig.METRICS_ENABLED
+
+
+def test_metrics_token_is_required_when_set(app):
+    client = app.test_client()
+    assert client.get('/metrics').status_code == 200
+
+    app.config['METRICS_TOKEN'] = 's3cret'
+
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = client.get('/metrics', headers={'Authorization': 'Bearer s3cret'})
+    assert response.status_code == 200
+    assert b'# TYPE' in response.data
@@ -0,0 +1,68 @@
+"""Parsing a CSV import in the process pool yields the same rows as parsing it serially."""
+import os
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from app.models import Contact
+from app.parsing import ParallelCSVReader
+from app.utils import iter_csv
+
+
+def write_csv(tmp_path, records):
+    path = tmp_path / 'contacts.csv'
+    path.write_text('first_name,last_name,comment,tags\n' + ''.join(records), newline='')
+    return str(path)
+
+
+def imported(rows):
+    """What the import makes of each row: its values or its error, and its tags."""
+    result = []
+    for row in rows:
+        try:
+            values = Contact.import_row(row, None)
+        except ValueError as e:
+            values = str(e)
+        result.append((values, Contact.import_tags(row)))
+    return result
+
+
+def serial(path):
+    with open(path, 'rb') as stream:
+        return imported(iter_csv(FileStorage(stream=stream, filename=path)))
+
+
+def stray_quotes(index):
+    # A quote inside an unquoted field is a literal character: it opens no quoted field, so the newline
+    # inside the next record's quoted comment must still not end a record
+    if index % 4 == 0:
+        return f'Bo{index},Chen,5" screen,\n'
+    return f'Ann{index},Lee,"line one\n""5"" screen"", and two",family\n'
+
+
+def multi_line(index):
+    return f'Cy{index},Diaz,"line one\nline ""two"", and three",\n' if index % 2 else f'Di{index},Eze,,work\n'
+
+
+@pytest.mark.parametrize('make_record', [stray_quotes, multi_line])
+@pytest.mark.parametrize('chunk_bytes', [64, 1000])
+def test_pooled_rows_match_serial_rows(tmp_path, make_record, chunk_bytes):
+    path = write_csv(tmp_path, [make_record(index) for index in range(100)])
+
+    pooled = imported(ParallelCSVReader(path, 2, chunk_bytes))
+
+    assert len(pooled) == 100
+    assert pooled == serial(path)
+
+
+def test_chunks_that_do_not_parse_cleanly_fall_back_to_serial(tmp_path):
+    # A record with a field too many, then an unclosed quote that runs to the end of the file
+    records = [f'Ann{index},Lee,,\n' for index in range(50)] + ['Bo,Chen,,,extra\n']
+    records += [f'Cy{index},Diaz,,\n' for index in range(50)] + ['Di,Eze,"never closed\n', 'Ed,Fox,,\n']
+    path = write_csv(tmp_path, records)
+
+    reader = ParallelCSVReader(path, 2, 64)
+    pooled = imported(reader)
+
+    assert pooled == serial(path)
+    assert reader.tell() == os.path.getsize(path)
@@ -0,0 +1,78 @@
+from datetime import timedelta
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db, purge, resume_background_work
+from app.models import Contact, ImportJob, User, utcnow
+from app.purge import run_purge
+from conftest import EMAIL, PASSWORD, add_contacts
+
+
+def closed_account(heartbeat_at=None):
+    """An account closed for a background purge, as delete_account leaves large ones."""
+    user = User(username='deleted-x', email='deleted-x@invalid', password='', deleted_at=utcnow(),
+                purge_heartbeat_at=heartbeat_at)
+    db.session.add(user)
+    db.session.commit()
+    add_contacts(user.id, 3)
+    return user.id
+
+
+def exists(user_id):
+    db.session.expire_all()
+    return db.session.get(User, user_id) is not None
+
+
+def test_a_purge_claimed_by_a_live_process_is_left_alone(app):
+    user_id = closed_account(heartbeat_at=utcnow())
+
+    run_purge(app, user_id)
+
+    assert exists(user_id)
+    assert db.session.scalar(db.select(db.func.count()).select_from(Contact).filter_by(user_id=user_id)) == 3
+
+
+def test_an_abandoned_purge_is_taken_over(app):
+    user_id = closed_account(heartbeat_at=utcnow() - timedelta(seconds=app.config['PURGE_STALE_SECONDS'] + 1))
+
+    run_purge(app, user_id)
+
+    assert not exists(user_id)
+
+
+def test_resume_background_work_finishes_unclaimed_purges(app):
+    user_id = closed_account()
+
+    resume_background_work(app)
+
+    assert not exists(user_id)
+
+
+def test_a_failed_inline_purge_leaves_a_closed_account_for_resume(app, client, user, monkeypatch):
+    app.config['PURGE_BATCH_SIZE'] = 2
+    add_contacts(user.id, 5)
+    job = ImportJob(user_id=user.id, filename='contacts.csv', path='contacts.csv', status='running')
+    db.session.add(job)
+    db.session.commit()
+    user_id, job_id = user.id, job.id
+    chunks = []
+
+    def fail_second_chunk(user_id):
+        chunks.append(user_id)
+        if len(chunks) == 2:
+            raise SQLAlchemyError('connection lost')
+
+    monkeypatch.setattr(purge, '_heartbeat', fail_second_chunk)
+    response = client.delete('/api/delete_account')
+
+    # Partly deleted, but closed: nobody can log in and the import stops after its current batch
+    assert response.status_code == 202
+    assert db.session.scalar(db.select(db.func.count()).select_from(Contact).filter_by(user_id=user_id)) == 3
+    assert db.session.get(User, user_id).deleted_at is not None
+    assert db.session.get(ImportJob, job_id).cancel_requested
+    assert client.post('/api/login', json={'email': EMAIL, 'password': PASSWORD}).status_code != 200
+
+    monkeypatch.undo()
+    resume_background_work(app)
+
+    assert not exists(user_id)
@@ -0,0 +1,45 @@
+"""Contact lists load tags for a whole page at once: the statement count must not grow with the contacts shown."""
+import pytest
+
+from conftest import add_contacts, add_tags, count_queries
+
+HTML_PAGES = ['/contacts', '/filter_contacts', '/contacts/all']
+JSON_LISTS = ['/api/contacts', '/api/contacts/filter']
+
+
+def queries_for(client, url):
+    client.get(url)  # Warm the per-process caches (user, tag tree) so only the page's own statements count
+    with count_queries() as queries:
+        response = client.get(url)
+        response.get_data()  # Streamed bodies run their queries as they are read
+    assert response.status_code == 200
+    return queries[0]
+
+
+@pytest.mark.parametrize('url', HTML_PAGES)
+def test_html_lists_do_not_query_per_contact(client, user, url):
+    tags = add_tags(user.id, ['family', 'work'])
+    add_contacts(user.id, 3, tags)
+    few = queries_for(client, url)
+
+    add_contacts(user.id, 60, tags)
+    assert queries_for(client, url) == few
+
+
+@pytest.mark.parametrize('url', JSON_LISTS)
+def test_json_page_queries_do_not_grow_with_page_size(client, user, url):
+    add_contacts(user.id, 60, add_tags(user.id, ['family', 'work']))
+
+    small = queries_for(client, url + '?limit=5')
+    assert queries_for(client, url + '?limit=60') == small
+
+
+@pytest.mark.parametrize('url', JSON_LISTS)
+def test_streamed_lists_query_a_constant_number_of_times_per_page(client, user, url):
+    add_contacts(user.id, 60, add_tags(user.id, ['family', 'work']))
+
+    one_page = queries_for(client, url + '?stream=1&limit=100')
+    seven_pages = queries_for(client, url + '?stream=1&limit=10')
+    # A page costs two statements (its contacts, then their tags) whatever its size; with limit=10 there
+    # are six full pages and a last empty one, which has no tags to load
+    assert seven_pages - one_page == (6 * 2 + 1) - 2
@@ -0,0 +1,80 @@
+"""The hot queries must be able to use the indexes added by migrations 1a2b3c4d5e01-03."""
+import pytest
+from sqlalchemy import func, text
+
+from app import db
+from app.models import Contact, ContactTag, Tag, User, search_text
+from conftest import add_contacts, add_tags
+
+
+@pytest.fixture
+def data(user):
+    """The test user's contacts and tags among those of other users, so that per-user indexes are selective."""
+    for index in range(10):
+        other = User(username=f'other{index}', email=f'other{index}@example.com', password='-')
+        db.session.add(other)
+        db.session.commit()
+        add_contacts(other.id, 50, add_tags(other.id, [f'other{index}-{tag}' for tag in range(10)])[:2])
+    tags = add_tags(user.id, ['family', 'work', 'school'])
+    tags[1].parent_id = tags[0].id
+    add_contacts(user.id, 50, tags[:2])
+    db.session.commit()
+    return user.id, tags
+
+
+def explain(statement):
+    """The plan of a statement as text: EXPLAIN QUERY PLAN on SQLite, EXPLAIN on PostgreSQL."""
+    sql = str(statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+    if db.engine.dialect.name == 'postgresql':
+        # On test-sized tables a sequential scan is cheapest; ask whether the index can be used at all
+        db.session.execute(text('SET LOCAL enable_seqscan = off'))
+        rows = db.session.execute(text('EXPLAIN ' + sql)).scalars()
+    else:
+        db.session.execute(text('ANALYZE'))
+        rows = (row.detail for row in db.session.execute(text('EXPLAIN QUERY PLAN ' + sql)))
+    return '\n'.join(rows)
+
+
+def assert_uses(index, statement):
+    plan = explain(statement)
+    assert index in plan, plan
+
+
+def test_keyset_page_uses_user_id_id(data):
+    user_id, _ = data
+    assert_uses('ix_contact_user_id_id', db.select(Contact.id, Contact.first_name)
+                .where(Contact.user_id == user_id, Contact.id > 50).order_by(Contact.id).limit(20))
+
+
+def test_same_last_names_uses_user_id_last_name(data):
+    user_id, _ = data
+    assert_uses('ix_contact_user_id_last_name_first_name', db.select(Contact.last_name)
+                .where(Contact.user_id == user_id).group_by(Contact.last_name)
+                .having(func.count(Contact.last_name) > 1))
+
+
+def test_same_first_names_uses_user_id_first_name(data):
+    user_id, _ = data
+    assert_uses('ix_contact_user_id_first_name', db.select(Contact.first_name)
+                .where(Contact.user_id == user_id).group_by(Contact.first_name)
+                .having(func.count(Contact.first_name) > 1))
+
+
+def test_tag_filter_uses_contact_tag_index(data):
+    user_id, tags = data
+    assert_uses('ix_contact_tag_tag_id_contact_id', db.select(ContactTag.contact_id)
+                .where(ContactTag.tag_id == tags[0].id))
+    assert_uses('ix_contact_tag_tag_id_contact_id', db.select(Contact.id)
+                .where(Contact.user_id == user_id, Contact.tag_filter(user_id, [tags[0].id], descendants=True)))
+
+
+def test_tag_tree_uses_tag_indexes(data):
+    user_id, tags = data
+    assert_uses('ix_tag_user_id', db.select(Tag.id, Tag.parent_id).where(Tag.user_id == user_id))
+    assert_uses('ix_tag_parent_id', db.select(Tag.id).where(Tag.parent_id == tags[0].id))
+
+
+def test_substring_search_uses_trigram_index(data):
+    if db.engine.dialect.name != 'postgresql':
+        pytest.skip('the trigram index exists on PostgreSQL only; set TEST_DATABASE_URL to a scratch database')
+    assert_uses('ix_contact_search_trgm', db.select(Contact.id).where(search_text().like('%irst1%')))
@@ -0,0 +1,43 @@
+"""Contact search ranks exact words above prefixes, substrings and fuzzy matches (SQLite fallback here)."""
+import pytest
+
+from app import db
+from app.models import Contact
+
+
+@pytest.fixture
+def contacts(user):
+    people = {
+        'exact': Contact(first_name='Ann', last_name='Kovalenko', user_id=user.id),
+        'prefix': Contact(first_name='Annabel', last_name='Lee', user_id=user.id),
+        'substring': Contact(first_name='Joanne', last_name='Price', user_id=user.id),
+        'fuzzy': Contact(first_name='Maria', last_name='Kovalenco', user_id=user.id),
+        'short': Contact(first_name='Ann0', last_name='Digits', user_id=user.id),
+        'other': Contact(first_name='Bo', last_name='Chen', company_name='Acme', user_id=user.id),
+    }
+    db.session.add_all(people.values())
+    db.session.commit()
+    return {contact.id: name for name, contact in people.items()}
+
+
+def search(client, contacts, q):
+    response = client.get('/api/contacts/search', query_string={'q': q})
+    assert response.status_code == 200
+    return [contacts[contact['id']] for contact in response.get_json()['contacts']]
+
+
+def test_exact_words_rank_above_prefixes_and_substrings(client, contacts):
+    assert search(client, contacts, 'ann') == ['exact', 'prefix', 'short', 'substring']
+
+
+def test_misspelled_words_match_fuzzily_below_exact_ones(client, contacts):
+    assert search(client, contacts, 'kovalenko') == ['exact', 'fuzzy']
+
+
+def test_one_letter_off_in_a_short_word_does_not_match(client, contacts):
+    assert search(client, contacts, 'ann3') == []
+
+
+def test_every_term_must_match(client, contacts):
+    assert search(client, contacts, 'bo acme') == ['other']
+    assert search(client, contacts, 'bo kovalenko') == []
@@ -0,0 +1,14 @@
+"""Excel support is loaded on first use: starting the app must not import the heavy backends."""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import startup  # noqa: E402
+
+
+def test_heavy_backends_are_not_imported_at_startup():
+    packages = startup.measure_once()
+
+    assert 'flask' in packages  # The import log was read at all
+    assert [name for name in startup.HEAVY_MODULES if name in packages] == []
@@ -0,0 +1,22 @@
+from app import db
+from app.models import Contact
+from conftest import add_tags
+
+
+def test_subtree_usage_counts_each_contact_once(client, user):
+    family, work, school, other = add_tags(user.id, ['family', 'work', 'school', 'other'])
+    work.parent_id = family.id
+    school.parent_id = work.id
+    db.session.add_all([
+        Contact(first_name='Ann', last_name='Lee', user_id=user.id, tags=[family, work]),
+        Contact(first_name='Bo', last_name='Chen', user_id=user.id, tags=[school]),
+        Contact(first_name='Cy', last_name='Diaz', user_id=user.id, tags=[other]),
+        Contact(first_name='Di', last_name='Eze', user_id=user.id),
+    ])
+    db.session.commit()
+
+    stats = client.get('/api/tags/stats').get_json()
+
+    counts = {tag['id']: (tag['usage_count'], tag['subtree_usage_count']) for tag in stats['tags']}
+    assert counts == {family.id: (1, 2), work.id: (1, 2), school.id: (1, 1), other.id: (1, 1)}
+    assert (stats['contacts'], stats['untagged_contacts']) == (4, 1)
@@ -0,0 +1,112 @@
+"""Upsert imports match contacts on their current values, whichever way those were last edited."""
+import io
+import time
+from datetime import timedelta
+
+import pytest
+
+from app import db
+from app.jobs import _keep_alive
+from app.models import Contact, ImportJob, utcnow
+from app.upsert import claim_existing
+from conftest import add_tags
+
+
+def sync(client, *emails, tags=''):
+    body = 'first_name,last_name,email,tags\n' + ''.join(f'Ann,Lee,{email},"{tags}"\n' for email in emails)
+    upload = (io.BytesIO(body.encode()), 'contacts.csv')
+    response = client.post('/api/contacts/import', data={'file': upload, 'match_on': 'email'},
+                           content_type='multipart/form-data')
+    job = response.get_json()['job']
+    assert job['status'] == 'done', job
+    return job
+
+
+def emails(user_id):
+    return db.session.scalars(db.select(Contact.email).filter_by(user_id=user_id).order_by(Contact.id)).all()
+
+
+def change_email(client, contact_id, email, how):
+    if how == 'put':
+        response = client.put(f'/api/contacts/{contact_id}', json={'email': email})
+    else:
+        response = client.post('/api/contacts/batch', json={'operations': [
+            {'op': 'update', 'id': contact_id, 'data': {'email': email}},
+        ]})
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('how', ['put', 'batch'])
+def test_edited_contacts_are_matched_on_their_new_key(client, user, how):
+    sync(client, 'ann@x.io')
+    contact_id = db.session.scalar(db.select(Contact.id).filter_by(user_id=user.id))
+    change_email(client, contact_id, 'ann@new.io', how)
+
+    job = sync(client, 'ann@new.io', 'ann@x.io')
+
+    # The edited contact is found under its new email; the old one is free again
+    assert (job['rows_imported'], job['rows_updated'] + job['rows_skipped']) == (1, 1), job
+    assert emails(user.id) == ['ann@new.io', 'ann@x.io']
+
+
+def test_merged_contacts_are_matched_on_their_new_key(client, user):
+    sync(client, 'ann@x.io')
+    primary = Contact(first_name='Ann', last_name='Lee', user_id=user.id)
+    db.session.add(primary)
+    db.session.commit()
+    duplicate_id = db.session.scalar(db.select(Contact.id).filter_by(email='ann@x.io'))
+    response = client.post('/api/contacts/merge', json={'primary_id': primary.id, 'duplicate_ids': [duplicate_id]})
+    assert response.status_code == 200
+
+    job = sync(client, 'ann@x.io')
+
+    assert job['rows_imported'] == 0, job
+    assert emails(user.id) == ['ann@x.io']
+
+
+def test_upserted_rows_keep_their_tags(client, user):
+    add_tags(user.id, ['family', 'work'])
+    sync(client, 'ann@x.io', tags='family')
+
+    # Only the tags change: the contact gains one and keeps the other
+    job = sync(client, 'ann@x.io', 'bo@x.io', tags='work, unknown')
+
+    assert (job['rows_imported'], job['rows_updated']) == (1, 1), job
+    assert [sorted(tags) for _, tags in Contact.export_rows(user.id)] == [['family', 'work'], ['work']]
+    assert sync(client, 'ann@x.io', tags='work')['rows_skipped'] == 1
+
+
+def keys(user_id):
+    return db.session.scalars(db.select(Contact.import_key).filter_by(user_id=user_id).order_by(Contact.id)).all()
+
+
+def test_claims_are_streamed_and_the_oldest_contact_wins(user):
+    db.session.add_all([Contact(first_name='Ann', last_name='Lee', email=email, user_id=user.id)
+                        for email in ['ann@x.io', 'bo@x.io', 'ANN@x.io', None, 'ann@x.io']])
+    db.session.commit()
+
+    assert claim_existing(user.id, 'email', batch_size=2) == 2
+    assert keys(user.id) == ['email:ann@x.io', 'email:bo@x.io', None, None, None]
+
+
+def test_keyed_contacts_are_not_rekeyed_by_another_kind_of_import(user):
+    db.session.add(Contact(first_name='Ann', last_name='Lee', email='ann@x.io', phone='+15550001', user_id=user.id))
+    db.session.commit()
+    claim_existing(user.id, 'email')
+
+    assert claim_existing(user.id, 'phone') == 0
+    assert keys(user.id) == ['email:ann@x.io']
+
+
+def test_long_upsert_transactions_keep_the_job_alive(app, user):
+    app.config['IMPORT_JOB_STALE_SECONDS'] = 0.15
+    job = ImportJob(user_id=user.id, filename='contacts.csv', path='contacts.csv', status='running',
+                    heartbeat_at=utcnow() - timedelta(hours=1))
+    db.session.add(job)
+    db.session.commit()
+
+    with _keep_alive(app, job.id):
+        time.sleep(0.2)
+
+    db.session.expire_all()
+    assert db.session.get(ImportJob, job.id).heartbeat_at > utcnow() - timedelta(seconds=5)
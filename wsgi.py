@@ -0,0 +1,13 @@
+"""
+WSGI entry point for production servers, e.g.:
+
+    APP_CONFIG=production SECRET_KEY=... DATABASE_URL=postgresql://... gunicorn -w 4 wsgi:app
+
+Each worker process creates the app, and with it its own connection pools and import threads,
+so don't use gunicorn's --preload. Each worker also picks up imports and account purges left
+unfinished by a restart; they are claimed atomically, so only one worker runs each.
+"""
+from app import create_app, resume_background_work
+
+app = create_app()
+resume_background_work(app)